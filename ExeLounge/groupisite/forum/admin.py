@@ -3,52 +3,63 @@ from django.contrib import admin
 from .models import ForumSection, ForumThread, DepartmentForumThread, \
     ModuleForumThread, ForumPost, ForumReply, \
     PostVote, ReplyVote
+from .scores import delete_and_update_scores
+
+
+class ForumModelAdmin(admin.ModelAdmin):
+    """Updates forum scores in bulk when deleting, rather than once per row."""
+
+    def delete_model(self, request, obj) -> None:
+        delete_and_update_scores(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset) -> None:
+        delete_and_update_scores(queryset)
 
 
 @admin.register(ForumSection)
-class ForumSectionAdmin(admin.ModelAdmin):
+class ForumSectionAdmin(ForumModelAdmin):
     list_display = ("name", "category", "url_slug")
 
 
 @admin.register(ForumThread)
-class ForumThreadAdmin(admin.ModelAdmin):
+class ForumThreadAdmin(ForumModelAdmin):
     list_display = ("name", "section", "url_slug")
 
 
 @admin.register(DepartmentForumThread)
-class DepartmentForumThreadAdmin(admin.ModelAdmin):
+class DepartmentForumThreadAdmin(ForumModelAdmin):
     list_display = ("name", "department", "section", "url_slug")
 
 
 @admin.register(ModuleForumThread)
-class ModuleForumThreadAdmin(admin.ModelAdmin):
+class ModuleForumThreadAdmin(ForumModelAdmin):
     list_display = ("name", "module", "section", "url_slug")
 
 
 @admin.register(ForumPost)
-class ForumPostAdmin(admin.ModelAdmin):
+class ForumPostAdmin(ForumModelAdmin):
     list_display = ("title", "date", "thread", "author", "is_anonymous",
-                    "url_slug")
+                    "url_slug", "score", "reply_count")
     list_filter = ("author", "is_anonymous")
     date_hierarchy = "date"
 
 
 @admin.register(ForumReply)
-class ForumReplyAdmin(admin.ModelAdmin):
-    list_display = ("date", "post", "author", "is_anonymous")
+class ForumReplyAdmin(ForumModelAdmin):
+    list_display = ("date", "post", "author", "is_anonymous", "score")
     list_filter = ("author", "is_anonymous")
     date_hierarchy = "date"
 
 
 @admin.register(PostVote)
-class PostVoteAdmin(admin.ModelAdmin):
+class PostVoteAdmin(ForumModelAdmin):
     list_display = ("date", "post", "user", "direction")
     list_filter = ("user", "direction")
     date_hierarchy = "date"
 
 
 @admin.register(ReplyVote)
-class ReplyVoteAdmin(admin.ModelAdmin):
+class ReplyVoteAdmin(ForumModelAdmin):
     list_display = ("date", "reply", "user", "direction")
     list_filter = ("user", "direction")
     date_hierarchy = "date"
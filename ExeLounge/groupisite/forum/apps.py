@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ForumConfig(AppConfig):
+    name = "forum"
+
+    def ready(self) -> None:
+        # Connect the receivers that keep the search index and the cached section tree up to date
+        from . import search, sections  # noqa: F401
@@ -23,3 +23,15 @@ class ForumCreateReply(forms.Form):
                                       required=False)
 
     layout = Layout("body", "is_anonymous")
+
+
+class ForumSearch(forms.Form):
+    """Form to search the ForumPosts and ForumReplies, optionally within a section, thread or module"""
+
+    q = forms.CharField(label="Search the forum", max_length=200)
+    section = forms.SlugField(required=False, widget=forms.HiddenInput)
+    thread = forms.SlugField(required=False, widget=forms.HiddenInput)
+    module = forms.CharField(required=False, max_length=200, widget=forms.HiddenInput)
+    page = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+
+    layout = Layout("q")
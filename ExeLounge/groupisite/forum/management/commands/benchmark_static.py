@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from groupisite.benchmarking import summarize
+
+# The static files every page (and the chat) loads
+ASSETS = ["css/main.css", "css/navbar.css", "css/icons.css", "js/chat.js", "favicon.ico"]
+
+# What each way of loading the files sends, by name: the URL to use and the Accept-Encoding header
+MODES = {
+    "unhashed_uncompressed": (lambda name: "/static/" + name, ""),
+    "hashed_gzip": (staticfiles_storage.url, "gzip, deflate"),
+    "hashed_brotli": (staticfiles_storage.url, "gzip, deflate, br"),
+}
+
+
+def measure(client: Client, url: str, accept_encoding: str, requests: int) -> dict:
+    """Request a static file a number of times, recording how long it took and how big it was."""
+
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+        size = len(b"".join(response.streaming_content))
+        latencies.append(time.perf_counter() - start)
+        response.close()
+
+    if response.status_code != 200:
+        raise CommandError("%s returned %d." % (url, response.status_code))
+    return {"url": url,
+            "bytes": size,
+            "encoding": response.get("Content-Encoding", "identity"),
+            "cache_control": response.get("Cache-Control", ""),
+            "latency_ms": summarize(latencies)}
+
+
+class Command(BaseCommand):
+    help = "Load the static files every page uses, as on a visitor's first page view, uncompressed by their " \
+           "plain names and compressed by their hashed names. Prints JSON with the bytes sent, the time to " \
+           "serve them and the time to download them on a slow connection. Run collectstatic first."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--requests", type=int, default=50,
+                            help="The number of times to request each file.")
+        parser.add_argument("--mbps", type=float, default=1.6,
+                            help="The connection speed to work out the download time for, in megabits per "
+                                 "second. The default is Chrome's \"Slow 3G\".")
+        parser.add_argument("--rtt-ms", type=float, default=400,
+                            help="The connection's round trip time in milliseconds, paid once per page view "
+                                 "since the files are fetched in parallel.")
+        parser.add_argument("--label", default="",
+                            help="A label to tell the results apart, e.g. the commit.")
+
+    def handle(self, *args, **options) -> None:
+        if settings.DEBUG:
+            raise CommandError("With DEBUG on the files aren't hashed or cached, turn it off first.")
+        if not getattr(staticfiles_storage, "hashed_files", None):
+            raise CommandError("There's no manifest of the hashed files, run collectstatic first.")
+
+        client = Client()
+        results = {}
+        for mode, (get_url, accept_encoding) in MODES.items():
+            files = {name: measure(client, get_url(name), accept_encoding, options["requests"])
+                     for name in ASSETS}
+            total = sum(file["bytes"] for file in files.values())
+            results[mode] = {"bytes": total,
+                             "serve_ms": sum(file["latency_ms"]["p50"] for file in files.values()),
+                             "download_ms": options["rtt_ms"] + total * 8 / (options["mbps"] * 1000),
+                             "files": files}
+
+        self.stdout.write(json.dumps({"label": options["label"],
+                                      "requests": options["requests"],
+                                      "mbps": options["mbps"],
+                                      "rtt_ms": options["rtt_ms"],
+                                      "modes": results}, indent=2))
@@ -0,0 +1,85 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from forum.models import ForumPost, ForumSection, ForumThread
+from groupisite.benchmarking import summarize
+
+from .seed_benchmark_data import USERNAME_FORMAT
+
+
+def get_routes() -> dict:
+    """Get the URL of each view, using the busiest section, thread and post to show the worst case."""
+
+    thread = ForumThread.objects.annotate(posts=Count("forumpost")).order_by("-posts") \
+        .select_related("section").first()
+    section = ForumSection.objects.annotate(posts=Count("forumthread__forumpost")).order_by("-posts").first()
+    post = ForumPost.objects.order_by("-reply_count").select_related("thread__section").first()
+    if thread is None or post is None:
+        raise CommandError("There aren't any posts, run seed_benchmark_data first.")
+
+    return {
+        "home": "/",
+        "forum_home": "/forums/",
+        "forum_section": "/forums/%s/%s/" % (section.category.lower(), section.url_slug),
+        "forum_thread": "/forums/%s/%s/%s/" % (thread.section.category.lower(), thread.section.url_slug,
+                                               thread.url_slug),
+        "forum_post": "/forums/%s/%s/%s/%s/" % (post.thread.section.category.lower(), post.thread.section.url_slug,
+                                                post.thread.url_slug, post.url_slug),
+    }
+
+
+def measure(client: Client, url: str, requests: int) -> dict:
+    """Request a URL a number of times, recording how long it took and the queries it made."""
+
+    # Warm up any caches first
+    client.get(url)
+
+    latencies = []
+    queries = []
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - start)
+        queries.append(len(context.captured_queries))
+
+    return {"url": url,
+            "status": response.status_code,
+            "latency_ms": summarize(latencies),
+            "queries": max(queries)}
+
+
+class Command(BaseCommand):
+    help = "Time the home and forum views through the test client, logged in as the busiest benchmark user, " \
+           "and count their queries. Prints JSON so the results can be compared between commits."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--requests", type=int, default=20,
+                            help="The number of times to request each view.")
+        parser.add_argument("--views", nargs="+",
+                            help="Only these views, e.g. home forum_thread.")
+        parser.add_argument("--host", default="localhost",
+                            help="The host to make the requests to, which must be in ALLOWED_HOSTS.")
+        parser.add_argument("--label", default="",
+                            help="A label to tell the results apart, e.g. the commit.")
+
+    def handle(self, *args, **options) -> None:
+        user = User.objects.filter(username=USERNAME_FORMAT % 0).first()
+        if user is None:
+            raise CommandError("There aren't any benchmark users, run seed_benchmark_data first.")
+
+        client = Client(HTTP_HOST=options["host"])
+        client.force_login(user)
+        routes = get_routes()
+        results = {name: measure(client, url, options["requests"]) for name, url in routes.items()
+                   if not options["views"] or name in options["views"]}
+
+        self.stdout.write(json.dumps({"label": options["label"],
+                                      "requests": options["requests"],
+                                      "views": results}, indent=2))
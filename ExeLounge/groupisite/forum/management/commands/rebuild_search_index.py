@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from forum.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Index every forum post and reply for search again, e.g. after changing them in bulk."
+
+    def handle(self, *args, **options) -> None:
+        with transaction.atomic():
+            get_search_backend().rebuild()
+        self.stdout.write("Rebuilt the search index.")
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from forum.scores import calculate_forum_scores
+from users.leaderboard_store import get_leaderboard_store
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Recalculate every user's forum score from their posts, replies and votes."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Show the scores that would change without saving them.")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="The number of profiles to update in each query.")
+
+    def handle(self, *args, **options) -> None:
+        with transaction.atomic():
+            scores = calculate_forum_scores()
+
+            # Find the profiles whose score is wrong
+            changed = []
+            profiles = UserProfile.objects.order_by("pk") \
+                .values_list("pk", "user_id", "user__username", "forum_score")
+            for pk, user_id, username, forum_score in profiles.iterator(chunk_size=options["batch_size"]):
+                score = scores.get(user_id, 0)
+                if score != forum_score:
+                    changed.append(UserProfile(pk=pk, forum_score=score))
+                    if options["dry_run"]:
+                        self.stdout.write("%s: %d -> %d" % (username, forum_score, score))
+
+            if not options["dry_run"]:
+                UserProfile.objects.bulk_update(changed, ["forum_score"], batch_size=options["batch_size"])
+
+        if options["dry_run"]:
+            self.stdout.write("%d forum scores would be changed." % len(changed))
+            return
+
+        # The leaderboard store isn't told about bulk updates
+        if changed:
+            get_leaderboard_store().rebuild()
+        self.stdout.write(self.style.SUCCESS("%d forum scores were changed." % len(changed)))
@@ -0,0 +1,271 @@
+import datetime
+import itertools
+import random
+from contextlib import contextmanager
+from typing import Iterable
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from forum.models import ForumSection, ForumThread, DepartmentForumThread, ModuleForumThread, \
+    ForumPost, ForumReply, PostVote, ReplyVote
+from forum.scores import refresh_counts
+from users.models import College, Department, Course, Module, UserProfile
+
+# The benchmark users' usernames, followed by their number
+USERNAME_FORMAT = "bench-%d@example.com"
+
+# The number of each thing made with --scale 1
+COUNTS = {
+    "colleges": 5,
+    "departments": 40,
+    "courses": 200,
+    "modules": 1200,
+    "users": 100000,
+    "posts": 1000000,
+    "replies": 3000000,
+    "post_votes": 5000000,
+    "reply_votes": 5000000,
+}
+
+SECTIONS = {
+    "ACADEMIC": ["Departments", "Modules", "Study Help"],
+    "GUILD": ["Societies", "Elections", "Sports"],
+    "SOCIAL": ["Events", "Accommodation", "Marketplace"],
+    "WELLBEING": ["Mental Health", "Fitness", "Advice"],
+}
+
+# The number of threads that aren't tied to a department or module in each section
+GENERAL_THREADS = 5
+
+# How far back the posts go
+HISTORY = datetime.timedelta(days=730)
+
+FIRST_NAMES = ["Derek", "Jane", "Amir", "Priya", "Tom", "Chloe", "Wei", "Olu", "Sam", "Hannah"]
+LAST_NAMES = ["Smith", "Doe", "Khan", "Patel", "Jones", "Brown", "Chen", "Adeyemi", "Taylor", "Evans"]
+WORDS = "the a lecture exam coursework deadline module library campus help anyone know when is due " \
+        "thanks really good question think answer notes week seminar group project".split()
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> list:
+    """Get cumulative weights that make the first of count things by far the most popular."""
+
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def spread(total: int, count: int) -> list:
+    """Split a total between count things with a Zipf skew, in a random order."""
+
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(count)]
+    scale = total / sum(weights)
+    shares = [round(weight * scale) for weight in weights]
+    random.shuffle(shares)
+    return shares
+
+
+def sentence(length: int) -> str:
+    return " ".join(random.choices(WORDS, k=length)).capitalize() + "."
+
+
+@contextmanager
+def dates_as_given(*models):
+    """Save the given dates in bulk_create, rather than the time of saving."""
+
+    fields = [model._meta.get_field("date") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = "Fill the database with made up colleges, users, posts, replies and votes for benchmarking. " \
+           "Popularity is skewed, so a few users, threads and posts get most of the activity."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--scale", type=float, default=1,
+                            help="Multiply the number of everything, e.g. 0.01 for a quick run. With 1 there "
+                                 "are %s." % ", ".join("%d %s" % (count, name.replace("_", " "))
+                                                       for name, count in COUNTS.items()))
+        parser.add_argument("--chunk-size", type=int, default=5000,
+                            help="The number of rows to insert in each query.")
+        parser.add_argument("--seed", type=int, default=0,
+                            help="The random seed, so the same data can be made again.")
+
+    def handle(self, *args, **options) -> None:
+        if User.objects.filter(username=USERNAME_FORMAT % 0).exists():
+            raise CommandError("There's already benchmark data in the database.")
+
+        random.seed(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        counts = {name: max(1, int(count * options["scale"])) for name, count in COUNTS.items()}
+
+        with dates_as_given(ForumPost, ForumReply):
+            modules = self.seed_university(counts)
+            user_ids = self.seed_users(counts["users"], modules)
+            threads = self.seed_sections(modules)
+            post_ids = self.seed_posts(counts["posts"], threads, user_ids)
+            reply_ids = self.seed_replies(counts["replies"], post_ids, user_ids)
+            self.seed_votes(PostVote, "post_id", counts["post_votes"], post_ids, user_ids)
+            self.seed_votes(ReplyVote, "reply_id", counts["reply_votes"], reply_ids, user_ids)
+
+        # bulk_create doesn't send the signals that keep these up to date
+        self.stdout.write("Counting votes and replies...")
+        refresh_counts(ForumPost.objects.all(), ForumReply.objects.all())
+        call_command("recompute_forum_scores", stdout=self.stdout)
+        call_command("rebuild_search_index", stdout=self.stdout)
+
+    def bulk_create(self, model, objects: Iterable, **kwargs) -> None:
+        """Insert rows a chunk at a time, so they don't all have to be in memory."""
+
+        objects = iter(objects)
+        created = 0
+        while True:
+            chunk = list(itertools.islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            model.objects.bulk_create(chunk, **kwargs)
+            created += len(chunk)
+        self.stdout.write("%d %s" % (created, model._meta.verbose_name_plural))
+
+    @staticmethod
+    def new_ids(model, after: int) -> list:
+        """Get the ids of the rows added since the last id was after, oldest first."""
+
+        return list(model.objects.filter(pk__gt=after).order_by("pk").values_list("pk", flat=True))
+
+    @staticmethod
+    def last_id(model) -> int:
+        return model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+
+    def seed_university(self, counts: dict) -> list:
+        """Make the colleges, departments, courses and modules."""
+
+        with transaction.atomic():
+            College.objects.bulk_create(
+                [College(college_name="Benchmark College %d" % i) for i in range(counts["colleges"])])
+            colleges = list(College.objects.filter(college_name__startswith="Benchmark College"))
+
+            Department.objects.bulk_create(
+                [Department(department_name="Benchmark Department %d" % i, college_name=colleges[i % len(colleges)])
+                 for i in range(counts["departments"])])
+            departments = list(Department.objects.filter(department_name__startswith="Benchmark Department"))
+
+            self.bulk_create(Course, (Course(course_title="Benchmark Course %d" % i, level="BSc", campus="Streatham",
+                                             department_name=departments[i % len(departments)])
+                                      for i in range(counts["courses"])))
+            self.bulk_create(Module, (Module(module_title="Benchmark Module %d" % i, module_code="BEN%05d" % i,
+                                             module_year=i % 4 + 1, module_credit_value=15,
+                                             module_convenor="Dr Smith", module_descriptor_URL="",
+                                             department=departments[i % len(departments)])
+                                      for i in range(counts["modules"])))
+        return list(Module.objects.filter(module_code__startswith="BEN"))
+
+    def seed_users(self, count: int, modules: list) -> list:
+        """Make the users, their profiles and the modules they take."""
+
+        after = self.last_id(User)
+        self.bulk_create(User, (User(username=USERNAME_FORMAT % i, email=USERNAME_FORMAT % i, password="!",
+                                     first_name=random.choice(FIRST_NAMES), last_name=random.choice(LAST_NAMES))
+                                for i in range(count)))
+        user_ids = self.new_ids(User, after)
+
+        privacy = [choice for choice, _ in UserProfile.LEADERBOARD_PRIVACY_CHOICES]
+        after = self.last_id(UserProfile)
+        self.bulk_create(UserProfile, (UserProfile(user_id=user_id, leaderboard_privacy=random.choice(privacy))
+                                       for user_id in user_ids))
+
+        # Everyone takes a few modules from one department
+        by_department = {}
+        for module in modules:
+            by_department.setdefault(module.department_id, []).append(module.pk)
+        departments = list(by_department.values())
+
+        def take_modules():
+            for profile_id in self.new_ids(UserProfile, after):
+                department = random.choice(departments)
+                for module_id in random.sample(department, min(len(department), random.randint(4, 6))):
+                    yield UserProfile.modules.through(userprofile_id=profile_id, module_id=module_id)
+
+        self.bulk_create(UserProfile.modules.through, take_modules())
+        return user_ids
+
+    def seed_sections(self, modules: list) -> list:
+        """Make the sections and threads, including one for every department and module."""
+
+        with transaction.atomic():
+            sections = {}
+            for category, names in SECTIONS.items():
+                for name in names:
+                    sections[name] = ForumSection.objects.create(
+                        name=name, category=category, url_slug="bench-" + name.lower().replace(" ", "-"))
+
+            for section in sections.values():
+                for i in range(GENERAL_THREADS):
+                    ForumThread.objects.create(name="%s %d" % (section.name, i), section=section,
+                                               url_slug="%s-%d" % (section.url_slug, i))
+
+            # Threads that inherit from ForumThread can't be made with bulk_create
+            for department in {module.department for module in modules}:
+                DepartmentForumThread.objects.create(name=str(department), section=sections["Departments"],
+                                                     url_slug="bench-department-%d" % department.pk,
+                                                     department=department)
+            for module in modules:
+                ModuleForumThread.objects.create(name=str(module), section=sections["Modules"],
+                                                 url_slug="bench-module-%d" % module.pk, module=module)
+
+        return list(ForumThread.objects.filter(section__in=sections.values()).values_list("pk", flat=True))
+
+    def seed_posts(self, count: int, thread_ids: list, user_ids: list) -> list:
+        """Make the posts, oldest first, mostly in a few busy threads and by a few busy users."""
+
+        thread_weights = zipf_weights(len(thread_ids))
+        user_weights = zipf_weights(len(user_ids))
+        start = timezone.now() - HISTORY
+
+        def posts():
+            for i in range(count):
+                yield ForumPost(title=sentence(random.randint(3, 10))[:100], body=sentence(random.randint(10, 80)),
+                                url_slug="bench-post-%d" % i, date=start + HISTORY * i / count,
+                                thread_id=random.choices(thread_ids, cum_weights=thread_weights)[0],
+                                author_id=random.choices(user_ids, cum_weights=user_weights)[0],
+                                is_anonymous=random.random() < 0.1)
+
+        after = self.last_id(ForumPost)
+        self.bulk_create(ForumPost, posts())
+        return self.new_ids(ForumPost, after)
+
+    def seed_replies(self, count: int, post_ids: list, user_ids: list) -> list:
+        """Make the replies, mostly to a few popular posts, a while after the post."""
+
+        user_weights = zipf_weights(len(user_ids))
+        start = timezone.now() - HISTORY
+        now = timezone.now()
+
+        def replies():
+            for post, replies_to_post in enumerate(spread(count, len(post_ids))):
+                posted = start + HISTORY * post / len(post_ids)
+                for _ in range(replies_to_post):
+                    yield ForumReply(body=sentence(random.randint(5, 60)), post_id=post_ids[post],
+                                     date=min(now, posted + datetime.timedelta(hours=random.expovariate(1 / 12))),
+                                     author_id=random.choices(user_ids, cum_weights=user_weights)[0],
+                                     is_anonymous=random.random() < 0.1)
+
+        after = self.last_id(ForumReply)
+        self.bulk_create(ForumReply, replies())
+        return self.new_ids(ForumReply, after)
+
+    def seed_votes(self, model, field: str, count: int, target_ids: list, user_ids: list) -> None:
+        """Make the votes, mostly on a few popular posts or replies, with no one voting twice on the same one."""
+
+        def votes():
+            for target, votes_on_target in enumerate(spread(count, len(target_ids))):
+                for user_id in random.sample(user_ids, min(len(user_ids), votes_on_target)):
+                    yield model(user_id=user_id, direction=random.random() < 0.8, **{field: target_ids[target]})
+
+        self.bulk_create(model, votes())
@@ -0,0 +1,70 @@
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    """Count the rows in a queryset that point at the outer row, as a subquery."""
+
+    return Coalesce(Subquery(queryset.filter(**{field: OuterRef("pk")}).order_by().values(field)
+                             .annotate(count=Count("pk")).values("count")), 0)
+
+
+def backfill_counts(apps, schema_editor):
+    """Count the votes and replies on every existing post and reply."""
+
+    ForumPost = apps.get_model("forum", "ForumPost")
+    ForumReply = apps.get_model("forum", "ForumReply")
+    PostVote = apps.get_model("forum", "PostVote")
+    ReplyVote = apps.get_model("forum", "ReplyVote")
+
+    for model, votes, field in [(ForumPost, PostVote, "post"), (ForumReply, ReplyVote, "reply")]:
+        model.objects.update(upvotes=count_subquery(votes.objects.filter(direction=True), field),
+                             downvotes=count_subquery(votes.objects.filter(direction=False), field))
+        model.objects.update(score=F("upvotes") - F("downvotes"))
+    ForumPost.objects.update(reply_count=count_subquery(ForumReply.objects.all(), "post"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('forum', '0006_auto_20210310_1740'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumpost',
+            name='downvotes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='down votes'),
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='reply_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='replies'),
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='score',
+            field=models.IntegerField(default=0, editable=False, verbose_name='vote score'),
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='upvotes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='up votes'),
+        ),
+        migrations.AddField(
+            model_name='forumreply',
+            name='downvotes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='down votes'),
+        ),
+        migrations.AddField(
+            model_name='forumreply',
+            name='score',
+            field=models.IntegerField(default=0, editable=False, verbose_name='vote score'),
+        ),
+        migrations.AddField(
+            model_name='forumreply',
+            name='upvotes',
+            field=models.IntegerField(default=0, editable=False, verbose_name='up votes'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
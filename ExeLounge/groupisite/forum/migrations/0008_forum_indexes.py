@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('forum', '0007_vote_and_reply_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forumpost',
+            index=models.Index(fields=['thread', '-date', '-id'], name='forum_post_thread_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forumreply',
+            index=models.Index(fields=['post', 'date'], name='forum_reply_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postvote',
+            index=models.Index(fields=['post', 'direction'], name='forum_postvote_direction_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='replyvote',
+            index=models.Index(fields=['reply', 'direction'], name='forum_replyvote_direction_idx'),
+        ),
+    ]
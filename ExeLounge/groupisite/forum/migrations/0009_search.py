@@ -0,0 +1,54 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Make the full-text search index for the database in use and fill it with every post and reply."""
+
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE INDEX forum_post_search_idx ON forum_forumpost USING gin (search_vector)")
+        schema_editor.execute("CREATE INDEX forum_reply_search_idx ON forum_forumreply USING gin (search_vector)")
+        schema_editor.execute("UPDATE forum_forumpost SET search_vector = "
+                              "setweight(to_tsvector('english', title), 'A') || "
+                              "setweight(to_tsvector('english', body), 'B')")
+        schema_editor.execute("UPDATE forum_forumreply SET search_vector = "
+                              "setweight(to_tsvector('english', body), 'B')")
+
+    elif vendor == "sqlite":
+        schema_editor.execute("CREATE VIRTUAL TABLE forum_search USING fts5("
+                              "title, body, thread_id UNINDEXED, tokenize = 'porter unicode61')")
+        schema_editor.execute("INSERT INTO forum_search (rowid, title, body, thread_id) "
+                              "SELECT id * 2, title, body, thread_id FROM forum_forumpost")
+        schema_editor.execute("INSERT INTO forum_search (rowid, title, body, thread_id) "
+                              "SELECT reply.id * 2 + 1, '', reply.body, post.thread_id "
+                              "FROM forum_forumreply reply JOIN forum_forumpost post ON post.id = reply.post_id")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX forum_post_search_idx")
+        schema_editor.execute("DROP INDEX forum_reply_search_idx")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE forum_search")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('forum', '0008_forum_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumpost',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='forumreply',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,8 +1,13 @@
+import copy
+import threading
+from contextlib import contextmanager
 from datetime import date
 
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models.signals import post_save, pre_delete
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from users.models import Department, Module, UserProfile
 
@@ -73,7 +78,33 @@ class ModuleForumThread(ForumThread):
         verbose_name_plural = "module forum threads"
 
 
-class ForumPost(models.Model):
+class SearchableManager(models.Manager):
+    """Leaves out the search vector when loading rows, since it's only needed in the database."""
+
+    def get_queryset(self) -> models.QuerySet:
+        return super().get_queryset().defer("search_vector")
+
+
+class CountedModel(models.Model):
+    """A post or reply, whose counts are only ever changed in the database."""
+
+    # The counts kept up to date by the signals below
+    COUNT_FIELDS = ["upvotes", "downvotes", "score"]
+
+    class Meta:
+        abstract = True
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # Writing back the counts loaded with an existing row would lose any votes or replies since
+        if not self._state.adding and not force_insert and update_fields is None:
+            deferred = self.get_deferred_fields()
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.COUNT_FIELDS
+                             and field.attname not in deferred]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class ForumPost(CountedModel):
     """Represents a post in the forum."""
 
     title = models.CharField(verbose_name="post title", max_length=100)
@@ -91,6 +122,19 @@ class ForumPost(models.Model):
     is_anonymous = models.BooleanField(verbose_name="post anonymously?",
                                        default=False)
 
+    # Counts of the votes and replies, kept up to date by the signals below
+    upvotes = models.IntegerField(verbose_name="up votes", default=0, editable=False)
+    downvotes = models.IntegerField(verbose_name="down votes", default=0, editable=False)
+    score = models.IntegerField(verbose_name="vote score", default=0, editable=False)
+    reply_count = models.IntegerField(verbose_name="replies", default=0, editable=False)
+
+    # The title and body for full-text search on PostgreSQL, kept up to date by forum/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
+    COUNT_FIELDS = CountedModel.COUNT_FIELDS + ["reply_count"]
+
     class Meta:
         verbose_name = "post"
         verbose_name_plural = "posts"
@@ -98,11 +142,16 @@ class ForumPost(models.Model):
         # Sort in descending order, newest first
         ordering = ["-date"]
 
+        # For listing the posts in a thread, newest first
+        indexes = [
+            models.Index(fields=["thread", "-date", "-id"], name="forum_post_thread_date_idx")
+        ]
+
     def __str__(self):
         return self.title + " by " + self.author.username
 
 
-class ForumReply(models.Model):
+class ForumReply(CountedModel):
     """Represents a reply to a post in a forum."""
 
     body = models.TextField(verbose_name="reply body")
@@ -116,6 +165,16 @@ class ForumReply(models.Model):
     is_anonymous = models.BooleanField(verbose_name="reply anonymously?",
                                        default=False)
 
+    # Counts of the votes, kept up to date by the signals below
+    upvotes = models.IntegerField(verbose_name="up votes", default=0, editable=False)
+    downvotes = models.IntegerField(verbose_name="down votes", default=0, editable=False)
+    score = models.IntegerField(verbose_name="vote score", default=0, editable=False)
+
+    # The body for full-text search on PostgreSQL, kept up to date by forum/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
     class Meta:
         verbose_name = "reply"
         verbose_name_plural = "replies"
@@ -123,6 +182,11 @@ class ForumReply(models.Model):
         # Sort in ascending order, oldest first
         ordering = ["date"]
 
+        # For listing the replies to a post, oldest first
+        indexes = [
+            models.Index(fields=["post", "date"], name="forum_reply_post_date_idx")
+        ]
+
     def __str__(self):
         return "Reply by " + self.author.username + " to " + self.post.title
 
@@ -154,6 +218,11 @@ class PostVote(ForumVote):
                                     name="unique_user_post_voter")
         ]
 
+        # For counting the up or down votes on a post
+        indexes = [
+            models.Index(fields=["post", "direction"], name="forum_postvote_direction_idx")
+        ]
+
     def __str__(self):
         if self.direction is True:
             return "+1 on " + self.post.title + " by " + self.user.username
@@ -174,6 +243,11 @@ class ReplyVote(ForumVote):
                                     name="unique_user_reply_voter")
         ]
 
+        # For counting the up or down votes on a reply
+        indexes = [
+            models.Index(fields=["reply", "direction"], name="forum_replyvote_direction_idx")
+        ]
+
     def __str__(self):
         if self.direction is True:
             return "+1 on a reply to " + self.reply.post.title + " by " + self.user.username
@@ -181,6 +255,38 @@ class ReplyVote(ForumVote):
             return "-1 on a reply to " + self.reply.post.title + " by " + self.user.username
 
 
+# Whether forum scores and counts are being updated in bulk, rather than by the signals below
+bulk_score_update = threading.local()
+
+
+@contextmanager
+def updating_scores_in_bulk():
+    """Stop the signals below from updating forum scores and counts, for this thread only."""
+
+    bulk_score_update.active = True
+    try:
+        yield
+    finally:
+        bulk_score_update.active = False
+
+
+# The forum score given for each post, reply and up vote
+POST_SCORE = 5
+REPLY_SCORE = 3
+VOTE_SCORE = 1
+
+
+def get_author_id(vote, field: str) -> int:
+    """Get the author of the post or reply being voted on, without loading it."""
+
+    target = vote._meta.get_field(field)
+    if target.is_cached(vote):
+        return getattr(vote, field).author_id
+
+    return target.related_model.objects.filter(pk=getattr(vote, target.attname)) \
+        .values_list("author_id", flat=True).get()
+
+
 def update_forum_score(sender, instance, direction):
     """Update the forum score, either increment or decrement."""
 
@@ -189,32 +295,55 @@ def update_forum_score(sender, instance, direction):
 
     # +5 for a post
     if sender.__name__ == "ForumPost":
-        UserProfile.objects.get(user=instance.author).update_forum_score(5 * direction)
+        UserProfile.add_to_forum_score(instance.author_id, POST_SCORE * direction)
 
     # +3 for a reply
     elif sender.__name__ == "ForumReply":
-        UserProfile.objects.get(user=instance.author).update_forum_score(3 * direction)
+        UserProfile.add_to_forum_score(instance.author_id, REPLY_SCORE * direction)
 
     # +1 for an up vote, -1 for a down vote on own post
     elif sender.__name__ == "PostVote" and instance.direction is True:
-        user = UserProfile.objects.get(user=instance.post.author)
         if instance.direction is True:
-            user.update_forum_score(1 * direction)
+            UserProfile.add_to_forum_score(get_author_id(instance, "post"), VOTE_SCORE * direction)
         else:
-            user.update_forum_score(-1 * direction)
+            UserProfile.add_to_forum_score(get_author_id(instance, "post"), -VOTE_SCORE * direction)
 
     # +1 for an up vote, -1 for a down vote on own reply
     elif sender.__name__ == "ReplyVote" and instance.direction is True:
-        user = UserProfile.objects.get(user=instance.reply.author)
         if instance.direction is True:
-            user.update_forum_score(1 * direction)
+            UserProfile.add_to_forum_score(get_author_id(instance, "reply"), VOTE_SCORE * direction)
         else:
-            user.update_forum_score(-1 * direction)
+            UserProfile.add_to_forum_score(get_author_id(instance, "reply"), -VOTE_SCORE * direction)
 
     else:
         pass
 
 
+def get_vote_count_changes(upvote: bool, direction: int) -> dict:
+    """Get the changes to make to the vote counts for a vote being added or removed."""
+
+    if upvote:
+        return {"upvotes": F("upvotes") + direction, "score": F("score") + direction}
+    return {"downvotes": F("downvotes") + direction, "score": F("score") - direction}
+
+
+def update_counts(sender, instance, direction):
+    """Update the vote and reply counts, either increment or decrement."""
+
+    if direction != -1 and direction != 1:
+        raise ValueError("direction can only be -1 or 1!")
+
+    # Count the votes on posts and replies
+    if sender.__name__ == "PostVote":
+        ForumPost.objects.filter(pk=instance.post_id).update(**get_vote_count_changes(instance.direction, direction))
+    elif sender.__name__ == "ReplyVote":
+        ForumReply.objects.filter(pk=instance.reply_id).update(**get_vote_count_changes(instance.direction, direction))
+
+    # Count the replies to posts
+    elif sender.__name__ == "ForumReply":
+        ForumPost.objects.filter(pk=instance.post_id).update(reply_count=F("reply_count") + direction)
+
+
 @receiver(post_save, sender=ForumPost)
 @receiver(post_save, sender=ForumReply)
 @receiver(post_save, sender=PostVote)
@@ -227,6 +356,33 @@ def increase_forum_score(sender, instance, **kwargs):
         return
 
     update_forum_score(sender, instance, 1)
+    update_counts(sender, instance, 1)
+
+
+@receiver(pre_save, sender=PostVote)
+@receiver(pre_save, sender=ReplyVote)
+def remember_vote_direction(sender, instance, **kwargs):
+    """Look up which way an existing vote was before it's saved, in case it's been changed."""
+
+    instance.saved_direction = None
+    if not instance._state.adding:
+        instance.saved_direction = sender.objects.filter(pk=instance.pk).values_list("direction", flat=True).first()
+
+
+@receiver(post_save, sender=PostVote)
+@receiver(post_save, sender=ReplyVote)
+def change_vote_direction(sender, instance, created, **kwargs):
+    """Move the forum score and counts over when a vote is changed from up to down or back."""
+
+    if created or instance.saved_direction is None or instance.saved_direction == instance.direction:
+        return
+
+    saved_vote = copy.copy(instance)
+    saved_vote.direction = instance.saved_direction
+    update_forum_score(sender, saved_vote, -1)
+    update_counts(sender, saved_vote, -1)
+    update_forum_score(sender, instance, 1)
+    update_counts(sender, instance, 1)
 
 
 @receiver(pre_delete, sender=ForumPost)
@@ -236,4 +392,9 @@ def increase_forum_score(sender, instance, **kwargs):
 def decrease_forum_score(sender, instance, **kwargs):
     """Decrease the forum score when any of the above is deleted."""
 
+    # The scores and counts are updated afterwards when deleting in bulk
+    if getattr(bulk_score_update, "active", False):
+        return
+
     update_forum_score(sender, instance, -1)
+    update_counts(sender, instance, -1)
@@ -0,0 +1,141 @@
+from collections import Counter
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+from users.models import UserProfile
+
+from .models import ForumSection, ForumThread, ForumPost, ForumReply, PostVote, ReplyVote, \
+    POST_SCORE, REPLY_SCORE, VOTE_SCORE, updating_scores_in_bulk
+
+
+def count_by(queryset: QuerySet, field: str) -> list:
+    """Count the rows in a queryset for each value of a field, in one grouped query."""
+
+    # Clear any default ordering, otherwise it's added to the GROUP BY
+    return queryset.order_by().values_list(field).annotate(count=Count("pk")).values_list(field, "count")
+
+
+def calculate_forum_scores(posts: Optional[QuerySet] = None,
+                           replies: Optional[QuerySet] = None,
+                           post_votes: Optional[QuerySet] = None,
+                           reply_votes: Optional[QuerySet] = None) -> Counter:
+    """
+    Calculate the forum score each user gets from the given posts, replies and votes.
+
+    By default every post, reply and vote is counted, giving each user's total
+    forum score. Users without any score aren't included.
+    """
+
+    posts = ForumPost.objects.all() if posts is None else posts
+    replies = ForumReply.objects.all() if replies is None else replies
+    post_votes = PostVote.objects.all() if post_votes is None else post_votes
+    reply_votes = ReplyVote.objects.all() if reply_votes is None else reply_votes
+
+    scores = Counter()
+
+    # Points for writing posts and replies
+    for author_id, count in count_by(posts, "author_id"):
+        scores[author_id] += POST_SCORE * count
+    for author_id, count in count_by(replies, "author_id"):
+        scores[author_id] += REPLY_SCORE * count
+
+    # Points for up votes on their posts and replies
+    for author_id, count in count_by(post_votes.filter(direction=True), "post__author_id"):
+        scores[author_id] += VOTE_SCORE * count
+    for author_id, count in count_by(reply_votes.filter(direction=True), "reply__author_id"):
+        scores[author_id] += VOTE_SCORE * count
+
+    return scores
+
+
+def get_cascade(queryset: QuerySet) -> tuple:
+    """
+    Get the posts, replies and votes that are deleted along with a queryset.
+
+    :param queryset: sections, threads, posts, replies, post votes or reply votes
+    :return: querysets of the posts, replies, post votes and reply votes
+    """
+
+    model = queryset.model
+
+    # The votes only delete themselves
+    if issubclass(model, PostVote):
+        return ForumPost.objects.none(), ForumReply.objects.none(), queryset, ReplyVote.objects.none()
+    if issubclass(model, ReplyVote):
+        return ForumPost.objects.none(), ForumReply.objects.none(), PostVote.objects.none(), queryset
+
+    # Replies take their votes with them
+    if issubclass(model, ForumReply):
+        return ForumPost.objects.none(), queryset, PostVote.objects.none(), \
+            ReplyVote.objects.filter(reply__in=queryset)
+
+    # Sections, threads and posts take all the posts below them, and their replies and votes
+    if issubclass(model, ForumSection):
+        posts = ForumPost.objects.filter(thread__section__in=queryset)
+        replies = ForumReply.objects.filter(post__thread__section__in=queryset)
+    elif issubclass(model, ForumThread):
+        posts = ForumPost.objects.filter(thread__in=queryset)
+        replies = ForumReply.objects.filter(post__thread__in=queryset)
+    elif issubclass(model, ForumPost):
+        posts = queryset
+        replies = ForumReply.objects.filter(post__in=queryset)
+    else:
+        raise ValueError("%s isn't part of the forum!" % model.__name__)
+
+    return posts, replies, PostVote.objects.filter(post__in=posts), ReplyVote.objects.filter(reply__in=replies)
+
+
+def count_subquery(queryset: QuerySet, field: str) -> Coalesce:
+    """Count the rows in a queryset that point at the outer row, as a subquery."""
+
+    return Coalesce(Subquery(queryset.filter(**{field: OuterRef("pk")}).order_by().values(field)
+                             .annotate(count=Count("pk")).values("count")), 0)
+
+
+def refresh_counts(posts: QuerySet, replies: QuerySet) -> None:
+    """Recount the votes and replies on some posts and replies."""
+
+    for queryset, votes, field in [(posts, PostVote.objects.all(), "post"),
+                                   (replies, ReplyVote.objects.all(), "reply")]:
+        queryset.update(upvotes=count_subquery(votes.filter(direction=True), field),
+                        downvotes=count_subquery(votes.filter(direction=False), field))
+        queryset.update(score=F("upvotes") - F("downvotes"))
+    posts.update(reply_count=count_subquery(ForumReply.objects.all(), "post"))
+
+
+def delete_and_update_scores(queryset: QuerySet) -> tuple:
+    """
+    Delete forum objects and everything below them, updating forum scores in bulk.
+
+    Deleting one object at a time updates the scores through signals, but that
+    costs a few queries for every post, reply and vote deleted. Instead, the
+    score each author loses is counted with grouped queries and taken off
+    everyone at once, and any posts or replies left behind are recounted.
+
+    :return: the result of QuerySet.delete()
+    """
+
+    with transaction.atomic():
+        posts, replies, post_votes, reply_votes = get_cascade(queryset)
+        scores = calculate_forum_scores(posts, replies, post_votes, reply_votes)
+
+        # Find the posts and replies that will be left with the wrong counts
+        counted_post_ids = []
+        counted_reply_ids = []
+        if issubclass(queryset.model, ForumReply):
+            counted_post_ids = list(replies.values_list("post_id", flat=True).order_by().distinct())
+        elif issubclass(queryset.model, PostVote):
+            counted_post_ids = list(post_votes.values_list("post_id", flat=True).order_by().distinct())
+        elif issubclass(queryset.model, ReplyVote):
+            counted_reply_ids = list(reply_votes.values_list("reply_id", flat=True).order_by().distinct())
+
+        with updating_scores_in_bulk():
+            deleted = queryset.delete()
+
+        UserProfile.add_to_forum_scores({user_id: -score for user_id, score in scores.items()})
+        refresh_counts(ForumPost.objects.filter(pk__in=counted_post_ids),
+                       ForumReply.objects.filter(pk__in=counted_reply_ids))
+
+    return deleted
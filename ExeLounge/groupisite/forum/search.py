@@ -0,0 +1,352 @@
+"""
+Full-text search over the forum's posts and replies.
+
+On PostgreSQL each post and reply has a search_vector column, a tsvector with a
+GIN index. SQLite, which is only used for local testing, has the forum_search
+FTS5 table instead. Either way the index is updated whenever a post or reply is
+saved, and can be rebuilt with the rebuild_search_index command after changing
+them in bulk. Results are ranked with the post titles counting for more than
+the bodies, and come with a snippet of the text around the words searched for.
+"""
+import re
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import F, IntegerField, QuerySet, Value
+from django.db.models.functions import Replace
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import SafeString, mark_safe
+
+from .models import ForumPost, ForumReply, ForumThread
+
+# The number of results on each page
+RESULTS_PER_PAGE = 20
+
+# The language the text is stemmed in, so e.g. "revising" finds "revision"
+SEARCH_CONFIG = "english"
+
+# What each result is, as stored in the index
+POST = 0
+REPLY = 1
+
+# Put around the words searched for in snippets, then turned into <mark> tags once the rest is escaped
+START_MARK = "\x02"
+STOP_MARK = "\x03"
+
+# Put in place of < and > before PostgreSQL makes snippets, since it leaves out anything that looks like an HTML tag
+LESS_THAN = "\x04"
+GREATER_THAN = "\x05"
+
+# About how many words of the body to show in each snippet
+SNIPPET_WORDS = 30
+
+# The fields that make up the index, to tell whether it needs updating when a post or reply is saved
+INDEXED_FIELDS = {"title", "body", "thread", "thread_id", "post", "post_id"}
+
+
+def highlight(text: str) -> SafeString:
+    """Escape a snippet, marking the words searched for."""
+
+    text = text.replace(LESS_THAN, "<").replace(GREATER_THAN, ">")
+    return mark_safe(escape(text).replace(START_MARK, "<mark>").replace(STOP_MARK, "</mark>"))
+
+
+class SearchResult:
+    """A post or reply matching a search."""
+
+    def __init__(self, post: ForumPost, reply: Optional[ForumReply], title: str, snippet: str):
+        self.post = post
+        self.reply = reply
+        self.title = highlight(title)
+        self.snippet = highlight(snippet)
+
+    @property
+    def author(self):
+        return (self.reply or self.post).author
+
+    @property
+    def is_anonymous(self) -> bool:
+        return (self.reply or self.post).is_anonymous
+
+    @property
+    def url(self) -> str:
+        section = self.post.thread.section
+        return "/forums/%s/%s/%s/%s/" % (section.category.lower(), section.url_slug, self.post.thread.url_slug,
+                                         self.post.url_slug)
+
+
+class SearchPage:
+    """A page of results, best first."""
+
+    def __init__(self, results: list, page: int, has_next: bool):
+        self.results = results
+        self.page = page
+        self.has_previous = page > 1
+        self.has_next = has_next
+
+
+class SearchBackend(ABC):
+    """Keeps the index up to date and searches it."""
+
+    @abstractmethod
+    def index_post(self, post: ForumPost) -> None:
+        pass
+
+    @abstractmethod
+    def index_reply(self, reply: ForumReply) -> None:
+        pass
+
+    def remove_post(self, post: ForumPost) -> None:
+        pass
+
+    def remove_reply(self, reply: ForumReply) -> None:
+        pass
+
+    @abstractmethod
+    def rebuild(self) -> None:
+        """Index every post and reply again."""
+
+    @abstractmethod
+    def rank(self, text: str, threads: Optional[QuerySet], offset: int, limit: int) -> list:
+        """
+        Find the posts and replies matching a search, best first.
+
+        :param text: what to search for, as typed
+        :param threads: ids of the threads to search in, or None for all of them
+        :return: the kind and id of each, with its title and snippet if the backend makes them while ranking
+        """
+
+    def get_posts(self, text: str) -> QuerySet:
+        return ForumPost.objects.all()
+
+    def get_replies(self, text: str) -> QuerySet:
+        return ForumReply.objects.all()
+
+    def search(self, text: str, threads: Optional[QuerySet], offset: int, limit: int) -> list:
+        """Find a page of results, loading their posts and replies in one query each."""
+
+        rows = self.rank(text, threads, offset, limit)
+        post_ids = [pk for kind, pk, _, _ in rows if kind == POST]
+        reply_ids = [pk for kind, pk, _, _ in rows if kind == REPLY]
+        posts = self.get_posts(text).select_related("thread__section", "author").in_bulk(post_ids) \
+            if post_ids else {}
+        replies = self.get_replies(text).select_related("post__thread__section", "author").in_bulk(reply_ids) \
+            if reply_ids else {}
+
+        results = []
+        for kind, pk, title, snippet in rows:
+            # Skip anything deleted since it was ranked
+            if kind == POST and pk in posts:
+                post = posts[pk]
+                results.append(SearchResult(post, None, getattr(post, "title_snippet", title or post.title),
+                                            getattr(post, "body_snippet", snippet or post.body)))
+            elif kind == REPLY and pk in replies:
+                reply = replies[pk]
+                results.append(SearchResult(reply.post, reply, reply.post.title,
+                                            getattr(reply, "body_snippet", snippet or reply.body)))
+        return results
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Searches the search_vector columns, using their GIN indexes."""
+
+    post_vector = SearchVector("title", weight="A", config=SEARCH_CONFIG) \
+        + SearchVector("body", weight="B", config=SEARCH_CONFIG)
+    reply_vector = SearchVector("body", weight="B", config=SEARCH_CONFIG)
+
+    @staticmethod
+    def get_query(text: str) -> SearchQuery:
+        # Understands quotes, OR and -, like a web search engine, and never fails to parse
+        return SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+
+    @staticmethod
+    def get_headline(field: str, query: SearchQuery, **options) -> SearchHeadline:
+        text = Replace(Replace(field, Value("<"), Value(LESS_THAN)), Value(">"), Value(GREATER_THAN))
+        return SearchHeadline(text, query, config=SEARCH_CONFIG, start_sel=START_MARK, stop_sel=STOP_MARK,
+                              **options)
+
+    def index_post(self, post: ForumPost) -> None:
+        ForumPost.objects.filter(pk=post.pk).update(search_vector=self.post_vector)
+
+    def index_reply(self, reply: ForumReply) -> None:
+        ForumReply.objects.filter(pk=reply.pk).update(search_vector=self.reply_vector)
+
+    def rebuild(self) -> None:
+        ForumPost.objects.update(search_vector=self.post_vector)
+        ForumReply.objects.update(search_vector=self.reply_vector)
+
+    def rank(self, text: str, threads: Optional[QuerySet], offset: int, limit: int) -> list:
+        query = self.get_query(text)
+        posts = ForumPost.objects.filter(search_vector=query)
+        replies = ForumReply.objects.filter(search_vector=query)
+        if threads is not None:
+            posts = posts.filter(thread__in=threads)
+            replies = replies.filter(post__thread__in=threads)
+
+        def ranked(queryset: QuerySet, kind: int) -> QuerySet:
+            return queryset.order_by() \
+                .annotate(kind=Value(kind, output_field=IntegerField()), rank=SearchRank(F("search_vector"), query)) \
+                .values_list("kind", "id", "rank")
+
+        rows = ranked(posts, POST).union(ranked(replies, REPLY), all=True) \
+            .order_by("-rank", "kind", "-id")[offset:offset + limit]
+        return [(kind, pk, None, None) for kind, pk, _ in rows]
+
+    # The snippets are only worked out for the page of results, since they're slow to make
+
+    def get_posts(self, text: str) -> QuerySet:
+        query = self.get_query(text)
+        return super().get_posts(text).annotate(
+            title_snippet=self.get_headline("title", query, highlight_all=True),
+            body_snippet=self.get_headline("body", query, max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2))
+
+    def get_replies(self, text: str) -> QuerySet:
+        query = self.get_query(text)
+        return super().get_replies(text).annotate(
+            body_snippet=self.get_headline("body", query, max_words=SNIPPET_WORDS, min_words=SNIPPET_WORDS // 2))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Searches the forum_search FTS5 table, for local testing.
+
+    Each row's rowid is made from the id of the post or reply and its kind, and
+    it has the thread so results can be filtered without joining.
+    """
+
+    table = "forum_search"
+
+    @staticmethod
+    def get_match(text: str) -> str:
+        """Make an FTS5 query finding all the words, quoted so nothing typed can be taken as syntax."""
+
+        return " ".join('"%s"' % word for word in re.findall(r"\w+", text))
+
+    def execute(self, sql: str, params: list = ()) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def index_post(self, post: ForumPost) -> None:
+        self.execute("INSERT OR REPLACE INTO %s (rowid, title, body, thread_id) VALUES (%%s, %%s, %%s, %%s)"
+                     % self.table, [post.pk * 2 + POST, post.title, post.body, post.thread_id])
+
+    def index_reply(self, reply: ForumReply) -> None:
+        self.execute("INSERT OR REPLACE INTO %s (rowid, title, body, thread_id) SELECT %%s, '', %%s, thread_id "
+                     "FROM %s WHERE id = %%s" % (self.table, ForumPost._meta.db_table),
+                     [reply.pk * 2 + REPLY, reply.body, reply.post_id])
+
+    def remove_post(self, post: ForumPost) -> None:
+        self.execute("DELETE FROM %s WHERE rowid = %%s" % self.table, [post.pk * 2 + POST])
+
+    def remove_reply(self, reply: ForumReply) -> None:
+        self.execute("DELETE FROM %s WHERE rowid = %%s" % self.table, [reply.pk * 2 + REPLY])
+
+    def rebuild(self) -> None:
+        posts, replies = ForumPost._meta.db_table, ForumReply._meta.db_table
+        self.execute("DELETE FROM %s" % self.table)
+        self.execute("INSERT INTO %s (rowid, title, body, thread_id) SELECT id * 2 + %d, title, body, thread_id "
+                     "FROM %s" % (self.table, POST, posts))
+        self.execute("INSERT INTO %s (rowid, title, body, thread_id) "
+                     "SELECT reply.id * 2 + %d, '', reply.body, post.thread_id "
+                     "FROM %s reply JOIN %s post ON post.id = reply.post_id" % (self.table, REPLY, replies, posts))
+
+    def rank(self, text: str, threads: Optional[QuerySet], offset: int, limit: int) -> list:
+        match = self.get_match(text)
+        if not match:
+            return []
+
+        sql = "SELECT rowid, highlight({table}, 0, %s, %s), snippet({table}, 1, %s, %s, '...', %s) " \
+              "FROM {table} WHERE {table} MATCH %s".format(table=self.table)
+        params = [START_MARK, STOP_MARK, START_MARK, STOP_MARK, SNIPPET_WORDS, match]
+        if threads is not None:
+            threads_sql, threads_params = threads.query.sql_with_params()
+            sql += " AND thread_id IN (%s)" % threads_sql
+            params += threads_params
+
+        # bm25 is lower for better matches, and titles count four times as much as bodies
+        sql += " ORDER BY bm25(%s, 4.0, 1.0), rowid DESC LIMIT %%s OFFSET %%s" % self.table
+        params += [limit, offset]
+        return [(rowid % 2, rowid // 2, title, snippet) for rowid, title, snippet in self.execute(sql, params)]
+
+
+BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend() -> SearchBackend:
+    """Get the search backend for the database in use."""
+
+    if connection.vendor not in BACKENDS:
+        raise ImproperlyConfigured("Forum search doesn't support %s databases." % connection.vendor)
+    return BACKENDS[connection.vendor]()
+
+
+def get_threads(section: str = "", thread: str = "", module: str = "") -> Optional[QuerySet]:
+    """
+    Get the ids of the threads to search in as a subquery, rather than looking them up first.
+
+    :param section: the URL slug of a section
+    :param thread: the URL slug of a thread
+    :param module: the code of a module, to search its threads
+    :return: None to search every thread
+    """
+
+    if not (section or thread or module):
+        return None
+
+    threads = ForumThread.objects.order_by()
+    if section:
+        threads = threads.filter(section__url_slug=section)
+    if thread:
+        threads = threads.filter(url_slug=thread)
+    if module:
+        threads = threads.filter(moduleforumthread__module__module_code=module)
+    return threads.values("pk")
+
+
+def search_forum(text: str, section: str = "", thread: str = "", module: str = "", page: int = 1,
+                 per_page: int = RESULTS_PER_PAGE) -> SearchPage:
+    """
+    Search the posts and replies.
+
+    :param text: what to search for, as typed
+    :param section: only search the section with this URL slug
+    :param thread: only search the thread with this URL slug
+    :param module: only search the threads for the module with this code
+    :param page: the page of results, from 1
+    """
+
+    # Fetch one extra result to find out if there's another page
+    results = get_search_backend().search(text, get_threads(section, thread, module), (page - 1) * per_page,
+                                          per_page + 1)
+    return SearchPage(results[:per_page], page, len(results) > per_page)
+
+
+@receiver(post_save, sender=ForumPost)
+def index_post(sender, instance: ForumPost, update_fields=None, **kwargs) -> None:
+    if update_fields is None or INDEXED_FIELDS & set(update_fields):
+        get_search_backend().index_post(instance)
+
+
+@receiver(post_save, sender=ForumReply)
+def index_reply(sender, instance: ForumReply, update_fields=None, **kwargs) -> None:
+    if update_fields is None or INDEXED_FIELDS & set(update_fields):
+        get_search_backend().index_reply(instance)
+
+
+@receiver(post_delete, sender=ForumPost)
+def remove_post(sender, instance: ForumPost, **kwargs) -> None:
+    get_search_backend().remove_post(instance)
+
+
+@receiver(post_delete, sender=ForumReply)
+def remove_reply(sender, instance: ForumReply, **kwargs) -> None:
+    get_search_backend().remove_reply(instance)
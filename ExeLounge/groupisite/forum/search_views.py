@@ -0,0 +1,34 @@
+from urllib.parse import urlencode
+
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import redirect, render
+
+from .forms import ForumSearch
+from .search import search_forum
+
+# The form fields that narrow the search down, kept in the links to other pages of results
+FILTERS = ["section", "thread", "module"]
+
+
+def forum_search(request: HttpRequest) -> HttpResponse:
+    """Produce a page of the posts and replies matching a search, best first."""
+
+    # If they're not logged in then send them to login
+    if not request.user.is_authenticated:
+        return redirect("/login/")
+
+    form = ForumSearch(request.GET or None)
+    context = {"title": "Search",
+               "header": "Search the forum",
+               "form": form,
+               "page": None}
+
+    if form.is_valid():
+        filters = {name: form.cleaned_data[name] for name in FILTERS}
+        context["page"] = search_forum(form.cleaned_data["q"], page=form.cleaned_data["page"] or 1, **filters)
+
+        # The search without the page number, for the links to the next and previous pages
+        context["search_query"] = urlencode(dict({"q": form.cleaned_data["q"]},
+                                                 **{name: value for name, value in filters.items() if value}))
+
+    return render(request, "forum_search.html", context)
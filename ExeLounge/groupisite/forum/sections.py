@@ -0,0 +1,86 @@
+"""
+The forum's sections and threads, as listed on the forum home page.
+
+The whole tree is read in one query and cached, then rebuilt only after a
+section or thread (including department and module threads) is saved or
+deleted, so the home page doesn't read it from the database on every view.
+"""
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save
+from groupisite.caching import VersionedCache
+from users.models import UserProfile
+
+from .models import ForumSection, ForumThread, DepartmentForumThread, ModuleForumThread
+
+
+def build_forum_tree() -> dict:
+    """
+    Read every section and its threads in one query.
+
+    :return: the sections in each category, e.g. {"academic": [...]}, and the threads
+             for each department and module by their ids
+    """
+
+    # Going from the sections means ones without threads are still found
+    rows = ForumSection.objects.order_by("pk", "forumthread__name", "forumthread__pk").values_list(
+        "pk", "name", "category", "url_slug", "forumthread__pk", "forumthread__name", "forumthread__url_slug",
+        "forumthread__departmentforumthread__department_id", "forumthread__moduleforumthread__module_id")
+
+    tree = {"sections": {category.lower(): [] for category, _ in ForumSection.CATEGORY_CHOICES},
+            "department_threads": {},
+            "module_threads": {}}
+    sections = {}
+    for section_id, name, category, url_slug, thread_id, thread_name, thread_slug, department_id, module_id in rows:
+        if section_id not in sections:
+            sections[section_id] = {"name": name,
+                                    "url": "forums/%s/%s/" % (category.lower(), url_slug),
+                                    "threads": []}
+            tree["sections"][category.lower()].append(sections[section_id])
+
+        if thread_id is not None:
+            thread = {"name": thread_name, "url": sections[section_id]["url"] + thread_slug + "/"}
+            sections[section_id]["threads"].append(thread)
+            if department_id is not None:
+                tree["department_threads"].setdefault(department_id, []).append(thread)
+            if module_id is not None:
+                tree["module_threads"].setdefault(module_id, []).append(thread)
+
+    return tree
+
+
+forum_tree = VersionedCache("forum:tree", build_forum_tree)
+
+for model in [ForumSection, ForumThread, DepartmentForumThread, ModuleForumThread]:
+    post_save.connect(forum_tree.invalidate, sender=model, dispatch_uid="forum_tree_saved_%s" % model.__name__)
+    post_delete.connect(forum_tree.invalidate, sender=model, dispatch_uid="forum_tree_deleted_%s" % model.__name__)
+
+
+def get_my_threads(profile: Optional[UserProfile]) -> list:
+    """Get the threads for a user's department and modules, making one query for their modules."""
+
+    if profile is None:
+        return []
+
+    tree = forum_tree.get()
+    threads = []
+    if profile.course_title is not None:
+        threads += tree["department_threads"].get(profile.course_title.department_name_id, [])
+    for module_id in profile.modules.order_by("module_code").values_list("pk", flat=True):
+        threads += tree["module_threads"].get(module_id, [])
+    return threads
+
+
+def get_forum_home_context(profile: Optional[UserProfile]) -> dict:
+    """
+    Get the sections in each category, and the user's own threads, for forum_home.html.
+
+    :param profile: the user's profile, or None if they're not logged in
+    """
+
+    tree = forum_tree.get()
+
+    # The template leaves out categories that are None
+    context = {category: sections or None for category, sections in tree["sections"].items()}
+    context["my_threads"] = get_my_threads(profile)
+    return context
@@ -0,0 +1,430 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from groupisite.pagination import paginate_by_date
+from users.models import College, Course, Department, Module, UserProfile
+
+from .models import ForumSection, ForumThread, DepartmentForumThread, ModuleForumThread, ForumPost, ForumReply, \
+    PostVote, ReplyVote
+from .scores import delete_and_update_scores, refresh_counts
+from .search import search_forum
+from .search_views import forum_search
+from .sections import get_forum_home_context
+
+
+class ForumTestCase(TestCase):
+
+    def setUp(self) -> None:
+        """Create a thread with a post, a reply and votes on both."""
+
+        self.derek = User.objects.create_user(username="derek@exeter.ac.uk")
+        self.edith = User.objects.create_user(username="edith@exeter.ac.uk")
+
+        self.section = ForumSection.objects.create(name="Social", category="SOCIAL", url_slug="social")
+        self.thread = ForumThread.objects.create(name="General", section=self.section, url_slug="general")
+        self.post = ForumPost.objects.create(title="Hello", thread=self.thread, author=self.derek,
+                                             url_slug="hello")
+        self.reply = ForumReply.objects.create(body="Hi", post=self.post, author=self.edith)
+        PostVote.objects.create(post=self.post, user=self.edith, direction=True)
+        ReplyVote.objects.create(reply=self.reply, user=self.derek, direction=True)
+
+    @staticmethod
+    def get_score(user: User) -> int:
+        """Get a user's forum score from the database."""
+
+        return UserProfile.objects.get(user=user).forum_score
+
+
+class RecomputeForumScoresTests(ForumTestCase):
+
+    def test_scores_are_repaired(self) -> None:
+        """Tests that wrong scores are recalculated from the posts, replies and votes."""
+
+        UserProfile.objects.update(forum_score=100)
+        call_command("recompute_forum_scores", stdout=StringIO())
+        self.assertEqual(self.get_score(self.derek), 6)
+        self.assertEqual(self.get_score(self.edith), 4)
+
+    def test_changed_vote_direction(self) -> None:
+        """Tests that votes changed to down votes no longer count."""
+
+        PostVote.objects.filter(post=self.post).update(direction=False)
+        call_command("recompute_forum_scores", stdout=StringIO())
+        self.assertEqual(self.get_score(self.derek), 5)
+
+    def test_dry_run(self) -> None:
+        """Tests that a dry run shows the changes without saving them."""
+
+        UserProfile.objects.filter(user=self.derek).update(forum_score=100)
+        out = StringIO()
+        call_command("recompute_forum_scores", "--dry-run", stdout=out)
+        self.assertIn("derek@exeter.ac.uk: 100 -> 6", out.getvalue())
+        self.assertNotIn("edith@exeter.ac.uk", out.getvalue())
+        self.assertEqual(self.get_score(self.derek), 100)
+
+
+class BulkDeleteTests(ForumTestCase):
+
+    def test_delete_section(self) -> None:
+        """Tests that deleting a section takes off the score for everything in it."""
+
+        ForumPost.objects.create(title="Other", thread=self.thread, author=self.edith, url_slug="other")
+        delete_and_update_scores(ForumSection.objects.filter(pk=self.section.pk))
+        self.assertFalse(ForumReply.objects.exists())
+        self.assertEqual(self.get_score(self.derek), 0)
+        self.assertEqual(self.get_score(self.edith), 0)
+
+    def test_delete_reply(self) -> None:
+        """Tests that deleting a reply only takes off the score for it and its votes."""
+
+        delete_and_update_scores(ForumReply.objects.filter(pk=self.reply.pk))
+        self.assertEqual(self.get_score(self.derek), 6)
+        self.assertEqual(self.get_score(self.edith), 0)
+
+    def test_single_delete(self) -> None:
+        """Tests that deleting one object still updates the scores through the signals."""
+
+        self.reply.delete()
+        self.assertEqual(self.get_score(self.derek), 6)
+        self.assertEqual(self.get_score(self.edith), 0)
+
+
+class CountTests(ForumTestCase):
+
+    def test_counts_on_create(self) -> None:
+        """Tests that new votes and replies are counted."""
+
+        ForumReply.objects.create(body="Hello again", post=self.post, author=self.derek)
+        PostVote.objects.create(post=self.post, user=self.derek, direction=False)
+        post = ForumPost.objects.get(pk=self.post.pk)
+        self.assertEqual((post.upvotes, post.downvotes, post.score, post.reply_count), (1, 1, 0, 2))
+        reply = ForumReply.objects.get(pk=self.reply.pk)
+        self.assertEqual((reply.upvotes, reply.downvotes, reply.score), (1, 0, 1))
+
+    def test_counts_on_delete(self) -> None:
+        """Tests that deleted votes and replies are no longer counted."""
+
+        PostVote.objects.get(post=self.post).delete()
+        delete_and_update_scores(ForumReply.objects.filter(pk=self.reply.pk))
+        post = ForumPost.objects.get(pk=self.post.pk)
+        self.assertEqual((post.upvotes, post.downvotes, post.score, post.reply_count), (0, 0, 0, 0))
+
+    def test_direction_changed(self) -> None:
+        """Tests that changing a vote from up to down and back moves its count and forum score over."""
+
+        for vote, model, target, author, score in [(PostVote.objects.get(post=self.post), ForumPost, self.post,
+                                                    self.derek, 5),
+                                                   (ReplyVote.objects.get(reply=self.reply), ForumReply, self.reply,
+                                                    self.edith, 3)]:
+            with self.subTest(model=model.__name__):
+                vote.direction = False
+                vote.save()
+                target = model.objects.get(pk=target.pk)
+                self.assertEqual((target.upvotes, target.downvotes, target.score), (0, 1, -1))
+                self.assertEqual(self.get_score(author), score)
+
+                vote.direction = True
+                vote.save()
+                vote.save()
+                target = model.objects.get(pk=target.pk)
+                self.assertEqual((target.upvotes, target.downvotes, target.score), (1, 0, 1))
+                self.assertEqual(self.get_score(author), score + 1)
+
+    def test_edit_keeps_counts(self) -> None:
+        """Tests that saving an edited post or reply doesn't write back the counts it was loaded with."""
+
+        post = ForumPost.objects.get(pk=self.post.pk)
+        reply = ForumReply.objects.get(pk=self.reply.pk)
+        PostVote.objects.create(post=self.post, user=self.derek, direction=True)
+        ReplyVote.objects.create(reply=self.reply, user=self.edith, direction=True)
+        ForumReply.objects.create(body="Hello again", post=self.post, author=self.derek)
+
+        post.title = "Hello everyone"
+        post.save()
+        reply.body = "Hi there"
+        reply.save()
+
+        post = ForumPost.objects.get(pk=self.post.pk)
+        self.assertEqual((post.title, post.upvotes, post.score, post.reply_count), ("Hello everyone", 2, 2, 2))
+        reply = ForumReply.objects.get(pk=self.reply.pk)
+        self.assertEqual((reply.body, reply.upvotes, reply.score), ("Hi there", 2, 2))
+
+    def test_refresh_counts(self) -> None:
+        """Tests that wrong counts are recounted."""
+
+        ForumPost.objects.update(upvotes=10, score=10, reply_count=10)
+        refresh_counts(ForumPost.objects.all(), ForumReply.objects.all())
+        post = ForumPost.objects.get(pk=self.post.pk)
+        self.assertEqual((post.upvotes, post.downvotes, post.score, post.reply_count), (1, 0, 1, 1))
+
+
+class PaginationTests(ForumTestCase):
+
+    def setUp(self) -> None:
+        """Add enough posts to the thread for several pages."""
+
+        super().setUp()
+        for i in range(6):
+            ForumPost.objects.create(title="Post %d" % i, thread=self.thread, author=self.derek,
+                                     url_slug="post-%d" % i)
+
+        # Give some posts the same date, so that the id decides their order
+        ForumPost.objects.filter(url_slug__in=["post-2", "post-3"]).update(date=self.post.date)
+        self.posts = list(ForumPost.objects.filter(thread=self.thread).order_by("-date", "-pk"))
+
+    def test_older_and_newer(self) -> None:
+        """Tests that following the links visits every post once and comes back again."""
+
+        posts = ForumPost.objects.filter(thread=self.thread)
+        first = paginate_by_date(posts, per_page=3)
+        self.assertEqual(first.items, self.posts[:3])
+        self.assertIsNone(first.newer_cursor)
+
+        second = paginate_by_date(posts, first.older_cursor, per_page=3)
+        self.assertEqual(second.items, self.posts[3:6])
+        third = paginate_by_date(posts, second.older_cursor, per_page=3)
+        self.assertEqual(third.items, self.posts[6:])
+        self.assertIsNone(third.older_cursor)
+
+        self.assertEqual(paginate_by_date(posts, third.newer_cursor, per_page=3).items, self.posts[3:6])
+
+    def test_invalid_cursor(self) -> None:
+        """Tests that an invalid cursor gives the newest page."""
+
+        page = paginate_by_date(ForumPost.objects.filter(thread=self.thread), "older_x_1", per_page=3)
+        self.assertEqual(page.items, self.posts[:3])
+
+        for cursor in ["older_99999999999999999999_1", "newer_-99999999999999999_1", "older_0_99999999999999999999"]:
+            with self.subTest(cursor=cursor):
+                page = paginate_by_date(ForumPost.objects.filter(thread=self.thread), cursor, per_page=3)
+                self.assertEqual(page.items, self.posts[:3])
+
+    def test_deep_page_seeks(self) -> None:
+        """Tests that the index is searched from the cursor, rather than read through from the newest post."""
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        posts = ForumPost.objects.filter(thread=self.thread)
+        second = paginate_by_date(posts, paginate_by_date(posts, per_page=3).older_cursor, per_page=3)
+        for cursor in [second.older_cursor, second.newer_cursor]:
+            with self.subTest(cursor=cursor):
+                queries = []
+                with connection.execute_wrapper(record):
+                    paginate_by_date(posts, cursor, per_page=3)
+
+                # Explain it with the same parameters, since the planner can do more with the values written in
+                sql, params = queries[0]
+                with connection.cursor() as db_cursor:
+                    if connection.vendor == "postgresql":
+                        # The table is too small for an index to be worth it, unless sequential scans are ruled out
+                        db_cursor.execute("SET LOCAL enable_seqscan = off")
+                    db_cursor.execute(connection.ops.explain_query_prefix() + " " + sql, params)
+                    plan = "\n".join(" ".join(str(column) for column in row) for row in db_cursor.fetchall())
+                self.assertRegex(plan, r"(Index Cond|USING INDEX).*\bdate ?[<>]")
+
+
+class SearchTests(ForumTestCase):
+
+    def setUp(self) -> None:
+        """Add posts and replies about revision in a couple of threads."""
+
+        super().setUp()
+        college = College.objects.create(college_name="CEMPS")
+        department = Department.objects.create(department_name="Computer Science", college_name=college)
+        module = Module.objects.create(module_title="Software Engineering", module_code="ECM2429", module_year=2,
+                                       module_credit_value=15, module_convenor="Dr Smith",
+                                       module_descriptor_URL="", department=department)
+        self.module_thread = ModuleForumThread.objects.create(name="ECM2429", section=self.section,
+                                                              url_slug="ecm2429", module=module)
+
+        self.title_match = ForumPost.objects.create(title="Revision tips", body="Start early.", thread=self.thread,
+                                                    author=self.derek, url_slug="revision-tips")
+        self.body_match = ForumPost.objects.create(title="Exams", body="When should I start revising?",
+                                                   thread=self.module_thread, author=self.derek, url_slug="exams")
+        self.reply_match = ForumReply.objects.create(body="I revised with <b>flashcards</b>.",
+                                                     post=self.post, author=self.edith)
+
+    def search(self, text: str, **kwargs) -> list:
+        return [(result.post, result.reply) for result in search_forum(text, **kwargs).results]
+
+    def test_ranked(self) -> None:
+        """Tests that posts and replies are found by the stems of their words, with title matches first."""
+
+        self.assertEqual(self.search("revision"), [(self.title_match, None), (self.body_match, None),
+                                                   (self.post, self.reply_match)])
+        self.assertEqual(self.search("revision flashcards"), [(self.post, self.reply_match)])
+        self.assertEqual(self.search("nothing"), [])
+
+    def test_snippets(self) -> None:
+        """Tests that the words searched for are marked, and everything else is escaped."""
+
+        result = search_forum("flashcards").results[0]
+        self.assertEqual(result.title, "Hello")
+        self.assertIn("&lt;b&gt;<mark>flashcards</mark>&lt;/b&gt;", result.snippet)
+        self.assertEqual(search_forum("revision").results[0].title, "<mark>Revision</mark> tips")
+
+    def test_filters(self) -> None:
+        """Tests that results can be limited to a section, thread or module."""
+
+        self.assertEqual(len(self.search("revision", section="social")), 3)
+        self.assertEqual(len(self.search("revision", section="other")), 0)
+        self.assertEqual(self.search("revision", thread="general"), [(self.title_match, None),
+                                                                     (self.post, self.reply_match)])
+        self.assertEqual(self.search("revision", module="ECM2429"), [(self.body_match, None)])
+
+    def test_pages(self) -> None:
+        """Tests that the results can be read a page at a time."""
+
+        first = search_forum("revision", per_page=2)
+        self.assertEqual(len(first.results), 2)
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+
+        second = search_forum("revision", page=2, per_page=2)
+        self.assertEqual([result.reply for result in second.results], [self.reply_match])
+        self.assertFalse(second.has_next)
+        self.assertTrue(second.has_previous)
+
+    def test_updated_on_save(self) -> None:
+        """Tests that edited posts are indexed again and deleted ones are removed."""
+
+        self.title_match.title = "Coursework"
+        self.title_match.save()
+        self.assertEqual(len(self.search("coursework")), 1)
+        self.assertEqual(len(self.search("revision")), 2)
+
+        self.post.delete()
+        self.assertEqual(self.search("revision"), [(self.body_match, None)])
+
+    def test_rebuild(self) -> None:
+        """Tests that posts added in bulk can be found after rebuilding the index."""
+
+        ForumPost.objects.bulk_create([ForumPost(title="Revision timetable", thread=self.thread, author=self.derek,
+                                                 url_slug="timetable")])
+        self.assertEqual(len(self.search("timetable")), 0)
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(len(self.search("timetable")), 1)
+        self.assertEqual(len(self.search("revision")), 4)
+
+    def test_logged_out(self) -> None:
+        """Tests that people who aren't logged in are sent to login rather than shown results."""
+
+        request = RequestFactory().get("/forums/search/", {"q": "revision"})
+        request.user = AnonymousUser()
+        response = forum_search(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/login/")
+
+
+class ForumTreeTests(TransactionTestCase):
+    # The cache is only invalidated once a transaction commits, which never happens inside a TestCase
+
+    def setUp(self) -> None:
+        """Create a section with a department thread and a module thread."""
+
+        cache.clear()
+        college = College.objects.create(college_name="CEMPS")
+        department = Department.objects.create(department_name="Computer Science", college_name=college)
+        self.course = Course.objects.create(course_title="Computer Science", level="BSc", campus="Streatham",
+                                            department_name=department)
+        self.module = Module.objects.create(module_title="Software Engineering", module_code="ECM2429",
+                                            module_year=2, module_credit_value=15, module_convenor="Dr Smith",
+                                            module_descriptor_URL="", department=department)
+
+        self.section = ForumSection.objects.create(name="Study help", category="ACADEMIC", url_slug="study-help")
+        DepartmentForumThread.objects.create(name="Computer Science", section=self.section,
+                                             url_slug="computer-science", department=department)
+        ModuleForumThread.objects.create(name="ECM2429", section=self.section, url_slug="ecm2429",
+                                         module=self.module)
+
+    def test_cached(self) -> None:
+        """Tests that the sections are read in one query, then not again until they change."""
+
+        with self.assertNumQueries(1):
+            context = get_forum_home_context(None)
+        self.assertEqual(context["academic"], [{
+            "name": "Study help",
+            "url": "forums/academic/study-help/",
+            "threads": [{"name": "Computer Science", "url": "forums/academic/study-help/computer-science/"},
+                        {"name": "ECM2429", "url": "forums/academic/study-help/ecm2429/"}]
+        }])
+        self.assertIsNone(context["social"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_forum_home_context(None), context)
+
+    def test_invalidated(self) -> None:
+        """Tests that adding, renaming or deleting a thread or section shows up straight away."""
+
+        get_forum_home_context(None)
+        thread = ForumThread.objects.create(name="Timetables", section=self.section, url_slug="timetables")
+        self.assertEqual(len(get_forum_home_context(None)["academic"][0]["threads"]), 3)
+
+        thread.name = "Exam timetables"
+        thread.save()
+        self.assertIn({"name": "Exam timetables", "url": "forums/academic/study-help/timetables/"},
+                      get_forum_home_context(None)["academic"][0]["threads"])
+
+        thread.delete()
+        self.assertEqual(len(get_forum_home_context(None)["academic"][0]["threads"]), 2)
+
+        ForumSection.objects.create(name="Clubs", category="SOCIAL", url_slug="clubs")
+        self.assertEqual(get_forum_home_context(None)["social"][0]["threads"], [])
+
+        self.section.delete()
+        self.assertIsNone(get_forum_home_context(None)["academic"])
+
+    def test_my_threads(self) -> None:
+        """Tests that a user's threads are the ones for their course's department and their modules."""
+
+        profile = User.objects.create_user(username="derek@exeter.ac.uk").profile
+        self.assertEqual(get_forum_home_context(profile)["my_threads"], [])
+
+        profile.course_title = self.course
+        profile.save()
+        profile.modules.add(self.module)
+        profile = UserProfile.objects.select_related("course_title").get(pk=profile.pk)
+        get_forum_home_context(profile)
+        with self.assertNumQueries(1):
+            my_threads = get_forum_home_context(profile)["my_threads"]
+        self.assertEqual([thread["name"] for thread in my_threads], ["Computer Science", "ECM2429"])
+
+
+@skipUnless(connection.vendor == "postgresql", "Only PostgreSQL's query plans are checked.")
+class IndexTests(ForumTestCase):
+
+    def assertUsesIndex(self, queryset: QuerySet, index: str) -> None:
+        """Assert that PostgreSQL would use an index for a query."""
+
+        # The tables are too small for an index to be worth it, unless sequential scans are ruled out
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index, queryset.explain())
+
+    def test_posts_in_thread(self) -> None:
+        self.assertUsesIndex(ForumPost.objects.filter(thread=self.thread).order_by("-date", "-id")[:25],
+                             "forum_post_thread_date_idx")
+
+    def test_replies_to_post(self) -> None:
+        self.assertUsesIndex(ForumReply.objects.filter(post=self.post).order_by("date"),
+                             "forum_reply_post_date_idx")
+
+    def test_votes_by_direction(self) -> None:
+        self.assertUsesIndex(PostVote.objects.filter(post=self.post, direction=True),
+                             "forum_postvote_direction_idx")
+        self.assertUsesIndex(ReplyVote.objects.filter(reply=self.reply, direction=True),
+                             "forum_replyvote_direction_idx")
+
+    def test_search(self) -> None:
+        query = SearchQuery("hello", config="english")
+        self.assertUsesIndex(ForumPost.objects.filter(search_vector=query), "forum_post_search_idx")
+        self.assertUsesIndex(ForumReply.objects.filter(search_vector=query), "forum_reply_search_idx")
@@ -2,6 +2,8 @@
 ASGI config for groupisite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This serves both the pages and the chat's WebSockets, see gunicorn.conf.py for
+running it in production.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -9,8 +11,6 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "groupisite.settings")
 
-application = get_asgi_application()
+from groupisite.routing import application  # noqa: E402,F401
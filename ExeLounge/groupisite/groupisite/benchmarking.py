@@ -0,0 +1,36 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import math
+import resource
+import sys
+
+
+def percentile(values: list, percent: float) -> float:
+    """Get a percentile of some values by the nearest-rank method, or 0 if there aren't any."""
+
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def summarize(values: list) -> dict:
+    """Summarize timings in seconds as milliseconds."""
+
+    return {"p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000,
+            "max": max(values, default=0) * 1000}
+
+
+def get_rss() -> int:
+    """Get the resident memory of this process in bytes, or the peak if the current size isn't available."""
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,61 @@
+"""
+Values worked out from the database that only change when an admin edits something.
+
+A VersionedCache keeps its value in Django's cache under a version number, which
+is also kept in the cache. Invalidating it moves on to the next version rather
+than deleting the value, so a request that read the data just before a change
+can't put its stale copy back afterwards: it's stored under the old version,
+which nothing reads any more.
+"""
+import time
+from typing import Any, Callable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class VersionedCache:
+    """A value built by a function and cached until it's invalidated."""
+
+    def __init__(self, key: str, build: Callable[[], Any], timeout: Optional[int] = None):
+        """
+        :param key: the cache key to keep the value under
+        :param build: works the value out, e.g. from the database
+        :param timeout: how long to keep the value for in seconds, or None for as long as possible
+        """
+
+        self.key = key
+        self.version_key = key + ":version"
+        self.build = build
+        self.timeout = timeout
+
+    def get_version(self) -> int:
+        version = cache.get(self.version_key)
+        if version is None:
+            # Start from the time, so the versions used before it was evicted aren't used again
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get(self) -> Any:
+        """Get the value, building it if it isn't cached."""
+
+        version = self.get_version()
+        value = cache.get(self.key, version=version)
+        if value is None:
+            value = self.build()
+            cache.set(self.key, value, self.timeout, version=version)
+        return value
+
+    def invalidate(self, *args, **kwargs) -> None:
+        """Build the value again next time, once the current transaction (if any) is committed."""
+
+        # Until then another request could cache the value from before the change under the new version
+        transaction.on_commit(self.bump_version)
+
+    def bump_version(self) -> None:
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # It's been evicted, so the next version will start from the time
+            pass
@@ -0,0 +1,23 @@
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+
+from .middleware import get_profile
+
+
+def get_profile_pic(request: HttpRequest) -> dict:
+    """
+    Get the profile pic and name.
+    """
+
+    profile = get_profile(request)
+    if profile is None:
+        return {}
+
+    return {"name": request.user.get_full_name(),
+            "url": profile.profile_pic.url}
+
+
+def profile_pic(request: HttpRequest) -> dict:
+    """Add the current user's profile picture to every template, for the navbar."""
+
+    return {"profile_pic": SimpleLazyObject(lambda: get_profile_pic(request))}
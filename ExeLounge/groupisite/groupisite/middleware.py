@@ -0,0 +1,76 @@
+from time import perf_counter
+from typing import Callable, Optional
+
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.utils.functional import SimpleLazyObject
+from users.models import UserProfile
+
+from .timing import RequestTimings, current_timings, time_query
+
+
+def get_profile(request: HttpRequest) -> Optional[UserProfile]:
+    """Get the current user's profile, loading it at most once per request."""
+
+    if not hasattr(request, "_cached_profile"):
+        if request.user.is_anonymous:
+            request._cached_profile = None
+        else:
+            request._cached_profile = UserProfile.objects.select_related("course_title") \
+                .filter(user=request.user).first()
+
+            # Save loading the user again when the profile is used
+            if request._cached_profile is not None:
+                request._cached_profile.user = request.user
+
+    return request._cached_profile
+
+
+class ProfileMiddleware:
+    """
+    Adds the current user's profile to the request as request.profile.
+
+    The profile is only loaded when it's first used, and None for anonymous
+    users. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        return self.get_response(request)
+
+
+class TimingMiddleware:
+    """
+    Records the total, view, database and template time of each request.
+
+    Staff get them in a Server-Timing header. The view time runs from the view
+    being called until its response is returned here, so includes the response
+    side of the middleware below this one. Must come first.
+    """
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        timings = RequestTimings(request.path)
+        token = current_timings.set(timings)
+        try:
+            with connection.execute_wrapper(time_query):
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        timings.finish()
+
+        # Only if the user has already been loaded, so the header never costs a query
+        user = getattr(request, "_cached_user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = timings.server_timing()
+        return response
+
+    def process_view(self, request: HttpRequest, view_func: Callable, view_args: tuple, view_kwargs: dict) -> None:
+        timings = current_timings.get()
+        if timings is not None:
+            timings.view_start = perf_counter()
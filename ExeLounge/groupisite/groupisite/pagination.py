@@ -0,0 +1,94 @@
+import datetime
+from typing import Optional
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+# The number of posts shown on each page of a thread
+POSTS_PER_PAGE = 25
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class KeysetPage:
+    """
+    A page of rows ordered newest first by (date, id).
+
+    Rather than an offset, the page is found by comparing with the first or last
+    row of the page next to it, so a deep page costs the same as the first one.
+    """
+
+    def __init__(self, items: list, has_older: bool, has_newer: bool):
+        self.items = items
+        self.has_older = has_older
+        self.has_newer = has_newer
+
+    @staticmethod
+    def make_cursor(direction: str, row) -> str:
+        """Make a cursor pointing either side of a row, e.g. "older_1615397987000000_42"."""
+
+        return "%s_%d_%d" % (direction, (row.date - EPOCH) // datetime.timedelta(microseconds=1), row.pk)
+
+    @property
+    def older_cursor(self) -> Optional[str]:
+        """Get the cursor for the page of older rows."""
+
+        return self.make_cursor("older", self.items[-1]) if self.has_older and self.items else None
+
+    @property
+    def newer_cursor(self) -> Optional[str]:
+        """Get the cursor for the page of newer rows."""
+
+        return self.make_cursor("newer", self.items[0]) if self.has_newer and self.items else None
+
+
+def parse_cursor(cursor: str) -> tuple:
+    """
+    Read a cursor made by KeysetPage.make_cursor.
+
+    :return: the direction, date and id
+    :raises ValueError: if the cursor isn't valid
+    """
+
+    direction, timestamp, pk = cursor.split("_")
+    if direction not in ["older", "newer"]:
+        raise ValueError("%s isn't a valid direction!" % direction)
+    if not 0 < int(pk) < 2 ** 63:
+        raise ValueError("%s isn't a valid id!" % pk)
+    try:
+        date = EPOCH + datetime.timedelta(microseconds=int(timestamp))
+    except OverflowError:
+        raise ValueError("%s is too far from the epoch!" % timestamp)
+    return direction, date, int(pk)
+
+
+def paginate_by_date(queryset: QuerySet, cursor: Optional[str] = None,
+                     per_page: int = POSTS_PER_PAGE) -> KeysetPage:
+    """
+    Get a page of a queryset, newest first.
+
+    :param queryset: rows with a date field
+    :param cursor: from a previous page, or None (or an invalid cursor) for the newest page
+    :param per_page: the number of rows on each page
+    """
+
+    try:
+        direction, date, pk = parse_cursor(cursor or "")
+    except ValueError:
+        direction = None
+
+    # Fetch one extra row to find out if there's another page. The date range on its own lets the
+    # index start from the cursor, rather than reading through every row on the pages before it.
+    if direction == "older":
+        rows = list(queryset.filter(Q(date__lt=date) | Q(date=date, pk__lt=pk), date__lte=date)
+                    .order_by("-date", "-pk")[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True)
+
+    elif direction == "newer":
+        rows = list(queryset.filter(Q(date__gt=date) | Q(date=date, pk__gt=pk), date__gte=date)
+                    .order_by("date", "pk")[:per_page + 1])
+        return KeysetPage(rows[:per_page][::-1], True, len(rows) > per_page)
+
+    else:
+        rows = list(queryset.order_by("-date", "-pk")[:per_page + 1])
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False)
@@ -0,0 +1,99 @@
+"""
+The most queries each page is allowed to make, so N+1 queries are caught by the tests.
+
+Every route in groupisite/urls.py has a budget for anonymous and logged in
+users. When a page goes over, the failure lists its queries grouped by the line
+of our code that made them.
+"""
+from collections import namedtuple
+from typing import Optional
+
+from django.contrib.auth.models import User
+from django.db import connection
+
+from .timing import get_call_site
+
+Budget = namedtuple("Budget", ["anonymous", "authenticated"])
+
+# Logged in pages start with the session, the user and (for the navbar) their profile
+QUERY_BUDGETS = {
+    "favicon.ico": Budget(0, 0),
+    "admin/login/": Budget(1, 2),
+    "admin/": Budget(1, 2),
+    "register/": Budget(2, 2),
+    "login/": Budget(1, 2),
+    "": Budget(0, 5),
+    "logout/": Budget(1, 4),
+    "settings/": Budget(0, 8),
+    "settings/change-password/": Budget(0, 4),
+    ".well-known/change-password/": Budget(0, 0),
+    "change-password/": Budget(0, 0),
+    "live-chat/": Budget(0, 4),
+    "live-chat/<slug:room_id>/": Budget(0, 6),
+    "forums/": Budget(4, 7),
+    "forums/search/": Budget(3, 6),
+    "forums/<slug:category>/<slug:section>/": Budget(4, 7),
+    "forums/<slug:category>/<slug:section>/<slug:thread>/": Budget(6, 9),
+    "forums/<slug:category>/<slug:section>/<slug:thread>/<slug:post>/": Budget(6, 9),
+}
+
+
+class QueryRecorder:
+    """Records the queries made inside it and where they were made from."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((get_call_site(ignore=[__file__]), sql))
+        return execute(sql, params, many, context)
+
+    def __enter__(self) -> "QueryRecorder":
+        self.wrapper = connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.wrapper.__exit__(*exc_info)
+
+    def report(self) -> str:
+        """List the queries grouped by call site, busiest first."""
+
+        sites = {}
+        for site, sql in self.queries:
+            sites.setdefault(site, []).append(sql)
+
+        lines = []
+        for site, queries in sorted(sites.items(), key=lambda item: -len(item[1])):
+            lines.append("%s (%d queries)" % (site, len(queries)))
+            lines += ["    " + sql for sql in queries]
+        return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    """Adds assertWithinBudget to a TestCase."""
+
+    def assertWithinBudget(self, route: str, url: str, user: Optional[User] = None) -> None:
+        """
+        Request a URL with the test client and fail if it makes more queries than its route's budget.
+
+        :param route: the route in groupisite/urls.py
+        :param url: a URL matching the route
+        :param user: who to log in as, or None to request it anonymously
+        """
+
+        budget = QUERY_BUDGETS[route].authenticated if user else QUERY_BUDGETS[route].anonymous
+
+        # The first request fills any caches, the budget is for the second.
+        # Log in each time, since the page might log them out.
+        for _ in range(2):
+            self.client.logout()
+            if user:
+                self.client.force_login(user)
+            with QueryRecorder() as recorder:
+                self.client.get(url)
+
+        if len(recorder.queries) > budget:
+            self.fail("%s (%s) made %d queries for %s users, over its budget of %d:\n%s"
+                      % (url, route, len(recorder.queries), "logged in" if user else "anonymous",
+                         budget, recorder.report()))
@@ -1,11 +1,33 @@
-from channels.auth import AuthMiddlewareStack
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.security.websocket import AllowedHostsOriginValidator
-from django.urls import path
+from django.core.asgi import get_asgi_application
+
+# Load the apps before importing the consumer, which uses the models
+django_application = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from django.urls import path  # noqa: E402
+
+from public_chat.consumers import PublicChatConsumer  # noqa: E402
+from public_chat.history import buffer  # noqa: E402
+
+
+async def lifespan(scope, receive, send) -> None:
+    """Save the chat messages still waiting to be written when the server stops."""
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await buffer.flush_all()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
 
-from public_chat.consumers import PublicChatConsumer
 
 application = ProtocolTypeRouter({
+    "http": django_application,
+    "lifespan": lifespan,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
             URLRouter([
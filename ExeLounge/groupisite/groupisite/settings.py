@@ -55,20 +55,26 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "groupisite.middleware.TimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "groupisite.middleware.ProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
 ROOT_URLCONF = "groupisite.urls"
 
+# Queries taking at least this long are logged to groupisite.slow_queries with where they came from
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 200))
+
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "groupisite.timing.TimedDjangoTemplates",
         "DIRS": ["users/templates", "groupisite/templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -77,6 +83,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "groupisite.context_processors.profile_pic",
             ],
         },
     },
@@ -86,11 +93,64 @@ WSGI_APPLICATION = "groupisite.wsgi.application"
 
 ASGI_APPLICATION = "groupisite.routing.application"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Chat messages are passed between processes through Redis when it's available. Give several
+# comma-separated URLs in CHAT_REDIS_URLS to shard the groups across more than one Redis server.
+# Without Redis, the chat only works within a single process.
+CHAT_REDIS_URLS = [url for url in os.environ.get("CHAT_REDIS_URLS", os.environ.get("REDIS_URL", "")).split(",")
+                   if url]
+
+if CHAT_REDIS_URLS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHAT_REDIS_URLS,
+                "prefix": "exelounge",
+
+                # Chat messages are worthless once they're late, so drop them rather than queueing them up
+                "expiry": 10,
+                "capacity": 500,
+
+                # Sockets are kept open for a long time, so don't drop them from groups too early
+                "group_expiry": 86400,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# The sorted-set store that the leaderboard is read from (see users/leaderboard_store.py).
+# Use Redis when it's available so that every worker process shares the same leaderboard.
+# The in-memory store is only meant for tests: each process fills its own on its first request.
+if "REDIS_URL" in os.environ:
+    LEADERBOARD_STORE = {
+        "BACKEND": "users.leaderboard_store.redis_backend",
+        "OPTIONS": {"url": os.environ["REDIS_URL"]},
+    }
+else:
+    LEADERBOARD_STORE = {
+        "BACKEND": "users.leaderboard_store.InMemoryBackend",
+    }
+
+# Values that are expensive to work out, like the forum's sections (see groupisite/caching.py).
+# Use Redis when it's available so that an edit in one worker process is seen by the others.
+if "REDIS_URL" in os.environ:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
 
 AUTH_PROFILE_MODULE = 'groupisite.users.UserProfile'
 
@@ -157,11 +217,17 @@ STATIC_URL = "/static/"
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# collectstatic puts a hash of each file's contents in its name and writes gzip and Brotli copies
+# beside it. WhiteNoiseMiddleware then serves the smallest copy the browser accepts, and since a
+# hashed name never changes its contents, tells browsers to cache it forever without checking back.
+# Pages can't be shown with DEBUG off until collectstatic has been run, so it can't be missed.
+STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
-# Activate Django-Heroku
-django_heroku.settings(locals())
+# Activate Django-Heroku, leaving the static files set up as above
+django_heroku.settings(locals(), staticfiles=False)
 
 # Google ReCaptcha
 RECAPTCHA_PUBLIC_KEY = "6Lf8b3caAAAAABs2IA1DHUvmAr__hZ0gHv7Q18oy"
@@ -1,21 +1,28 @@
-function setupPublicChatWebSocket(debug_mode, room_id) {
+function setupPublicChatWebSocket(room_id) {
   /**
    * Setup the websocket tasked with dealing with chat data.
    */
     // Correctly decide between ws:// and wss://
   var ws_scheme = window.location.protocol == "https:" ? "wss" : "ws";
-  if (debug_mode === true) {
-    var ws_path = ws_scheme + "://" + window.location.host + `/public_chat/${room_id}/`;
-  } else {
-    var ws_path = ws_scheme + "://" + window.location.host + `:8001/public_chat/${room_id}/`;
-  }
+  // The chat is served on the same port as the pages
+  var ws_path = ws_scheme + "://" + window.location.host + `/public_chat/${room_id}/`;
   var public_chat_socket = new WebSocket(ws_path);
 
   // Handle incoming messages
   public_chat_socket.onmessage = function (message) {
     console.log("Got chat websocket message " + message.data);
     var data = JSON.parse(message.data);
-    appendChatMessage(data)
+    if (data["command"] === "history") {
+      prependChatHistory(data)
+    } else if (data["command"] === "messages") {
+      data["messages"].forEach(function (chatMessage) {
+        appendChatMessage(chatMessage)
+      })
+    } else if (data["command"] === "presence") {
+      document.getElementById("id_chat_online").innerText = `${data["online"]} online`
+    } else if (data["command"] === "error") {
+      createChatElement(`<i>${data["error"]}</i>`)
+    }
   };
 
   public_chat_socket.addEventListener("open", function (e) {
@@ -51,6 +58,13 @@ function setupPublicChatWebSocket(debug_mode, room_id) {
     }
   };
 
+  document.getElementById("id_chat_load_older").onclick = function (e) {
+    public_chat_socket.send(JSON.stringify({
+      "command": "load_older",
+      "cursor": this.dataset.cursor
+    }));
+  };
+
   document.getElementById("id_chat_message_submit").onclick = function (e) {
     const messageInputDom = document.getElementById("id_chat_message_input");
     const message = messageInputDom.value;
@@ -62,17 +76,35 @@ function setupPublicChatWebSocket(debug_mode, room_id) {
   };
 }
 
-function appendChatMessage(data) {
+function appendChatMessage(data, prepend = false) {
   /**
    * Define all chat related data and append it before creating the chat message element.
    */
   let message = data["message"]
   let fullName = data["full_name"]
   let text = `<b>${fullName}</b>: ${message}`;
-  createChatElement(text)
+  createChatElement(text, prepend)
 }
 
-function createChatElement(text) {
+function prependChatHistory(data) {
+  /**
+   * Add a page of older messages to the top of the chat log, and offer to load the page before it.
+   */
+  let messages = data["messages"]
+  for (let i = messages.length - 1; i >= 0; i--) {
+    appendChatMessage(messages[i], true)
+  }
+
+  let loadOlder = document.getElementById("id_chat_load_older")
+  if (data["older"]) {
+    loadOlder.dataset.cursor = data["older"]
+    loadOlder.style.display = ""
+  } else {
+    loadOlder.style.display = "none"
+  }
+}
+
+function createChatElement(text, prepend = false) {
   /**
    * Create the chat text element allowing all chat related data to be displayed to the chat log.
    */
@@ -93,8 +125,12 @@ function createChatElement(text) {
 
   newMessageDiv.appendChild(div1)
 
-  chatLog.insertBefore(newMessageDiv, chatLog.lastChild)
-  chatLog.scrollTop = chatLog.scrollHeight;
+  if (prepend) {
+    chatLog.insertBefore(newMessageDiv, chatLog.firstChild)
+  } else {
+    chatLog.insertBefore(newMessageDiv, chatLog.lastChild)
+    chatLog.scrollTop = chatLog.scrollHeight;
+  }
 }
 
 document.getElementById("id_chat_message_input").addEventListener("keydown", function (e) {
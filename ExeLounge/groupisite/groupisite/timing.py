@@ -0,0 +1,124 @@
+"""
+Measures where the time goes in each request.
+
+TimingMiddleware starts a RequestTimings for each request, which the database
+wrapper and the template backend below add to. Timing a query or a template is
+just two clock reads, so it's cheap enough to leave on in production; only
+slow queries pay for looking at the stack.
+"""
+import json
+import logging
+import os
+import traceback
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+slow_query_logger = logging.getLogger("groupisite.slow_queries")
+
+
+class RequestTimings:
+    """The time spent on each part of a request, in seconds."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.start = perf_counter()
+        self.view_start: Optional[float] = None
+        self.total = 0.0
+        self.view = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.templates = 0.0
+
+    def finish(self) -> None:
+        end = perf_counter()
+        self.total = end - self.start
+        if self.view_start is not None:
+            self.view = end - self.view_start
+
+    def server_timing(self) -> str:
+        """Get the timings as a Server-Timing header, which browsers show in their developer tools."""
+
+        return ", ".join([
+            "total;dur=%.1f" % (self.total * 1000),
+            "view;dur=%.1f" % (self.view * 1000),
+            'db;dur=%.1f;desc="%d queries"' % (self.db * 1000, self.queries),
+            "tpl;dur=%.1f" % (self.templates * 1000),
+        ])
+
+
+# The timings of the request being handled
+current_timings: ContextVar = ContextVar("current_timings", default=None)
+
+
+def get_call_site(ignore: Iterable[str] = ()) -> str:
+    """
+    Get where a query is being made from, e.g. "users/views.py:150 in settings".
+
+    This is the line of our code furthest down the stack, or for queries Django
+    makes itself (e.g. loading the session), the line that asked the ORM.
+
+    :param ignore: the files of any other wrappers around the query
+    """
+
+    base_dir = str(settings.BASE_DIR)
+    ignore = {__file__, *ignore}
+    stack = [frame for frame in reversed(traceback.extract_stack()) if frame.filename not in ignore]
+    for frame in stack:
+        if frame.filename.startswith(base_dir) and "site-packages" not in frame.filename:
+            return "%s:%d in %s" % (os.path.relpath(frame.filename, base_dir), frame.lineno, frame.name)
+    for frame in stack:
+        if os.path.join("django", "db") not in frame.filename:
+            return "%s:%d in %s" % (frame.filename.split("site-packages" + os.sep)[-1], frame.lineno, frame.name)
+    return "(unknown)"
+
+
+def time_query(execute, sql, params, many, context):
+    """A database execute wrapper that adds each query to the current timings and logs slow ones."""
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - start
+        timings = current_timings.get()
+        if timings is not None:
+            timings.db += duration
+            timings.queries += 1
+
+        if duration * 1000 >= getattr(settings, "SLOW_QUERY_THRESHOLD_MS", 200):
+            slow_query_logger.warning(json.dumps({
+                "event": "slow_query",
+                "duration_ms": round(duration * 1000, 1),
+                "sql": sql,
+                "origin": get_call_site(),
+                "path": timings.path if timings is not None else None,
+            }))
+
+
+class TimedTemplate(Template):
+    """A Django template that adds the time it takes to render to the current timings."""
+
+    def render(self, context=None, request=None) -> str:
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(context, request)
+
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.templates += perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each template it renders (but not the templates they include)."""
+
+    def from_string(self, template_code) -> TimedTemplate:
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name) -> TimedTemplate:
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -18,6 +18,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
+from forum import search_views as forum_search_views
 from forum import views as forum_views
 from public_chat import views as chat_views
 from users import views as users_views
@@ -35,7 +36,9 @@ urlpatterns = [
     path(".well-known/change-password/", users_views.change_password_redirect),
     path("change-password/", users_views.change_password_redirect),
     path("live-chat/", chat_views.live_chat),
+    path("live-chat/<slug:room_id>/", chat_views.live_chat),
     path("forums/", forum_views.forum_home),
+    path("forums/search/", forum_search_views.forum_search),
     path("forums/<slug:category>/<slug:section>/", forum_views.forum_section),
     path("forums/<slug:category>/<slug:section>/<slug:thread>/", forum_views.forum_thread),
     path("forums/<slug:category>/<slug:section>/<slug:thread>/<slug:post>/", forum_views.forum_post)
@@ -0,0 +1,30 @@
+"""
+The gunicorn worker that runs the site, HTTP and WebSockets alike, with uvicorn.
+
+Everything can be tuned with environment variables, see gunicorn.conf.py.
+"""
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+class ExeLoungeWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+
+        # Shutting down saves the chat messages that haven't been written yet (see routing.py)
+        "lifespan": "on",
+
+        # Past this many open connections (chat sockets included) a worker answers 503 straight away,
+        # rather than slowing down for everyone
+        "limit_concurrency": int(os.environ.get("WEB_MAX_CONNECTIONS", 1000)),
+
+        # How long to let requests finish after being told to stop. Open chat sockets are closed with
+        # 1012 (service restart) at the start of this, so they don't hold the shutdown up.
+        "timeout_graceful_shutdown": int(os.environ.get("GRACEFUL_TIMEOUT", 25)),
+
+        # Ping the chat sockets so proxies (Heroku's router drops idle ones after 55 seconds) keep them open
+        "ws_ping_interval": 20,
+        "ws_ping_timeout": 20,
+    }
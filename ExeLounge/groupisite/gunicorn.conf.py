@@ -0,0 +1,37 @@
+"""
+Settings for serving the site in production with gunicorn, which reads this file automatically:
+
+    gunicorn groupisite.asgi:application
+
+Each worker process serves both the pages and the chat's WebSockets on the same port. Change these
+with environment variables:
+
+    PORT                 the port to listen on (8000)
+    WEB_CONCURRENCY      the number of worker processes (two per CPU, set by Heroku for each dyno size)
+    WEB_MAX_CONNECTIONS  the most connections each worker keeps open, chat sockets included (1000)
+    GRACEFUL_TIMEOUT     how long a stopping worker gets to finish its requests, in seconds (25,
+                         within the 30 that Heroku waits before killing the dyno)
+"""
+import multiprocessing
+import os
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "8000")
+worker_class = "groupisite.workers.ExeLoungeWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+
+# Chat messages can only be passed between workers through Redis (see CHANNEL_LAYERS in settings.py)
+if not os.environ.get("CHAT_REDIS_URLS", os.environ.get("REDIS_URL")):
+    workers = 1
+
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 25))
+
+# Restart a worker that stops responding for this long
+timeout = 30
+
+# Load the app before forking, so the workers share its memory and a broken deploy fails straight away
+preload_app = True
+
+# Heroku's router sets X-Forwarded-Proto, so https is recognised
+forwarded_allow_ips = "*"
+
+accesslog = "-"
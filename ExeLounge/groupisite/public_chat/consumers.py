@@ -1,23 +1,19 @@
-from better_profanity import profanity
-from bleach.linkifier import Linker
+import asyncio
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils.html import escape
-from six.moves.urllib.parse import urlparse
-
-User = get_user_model
 
+from .flood_control import FloodControl
+from .history import buffer, get_history, get_latest_history
+from .models import ChatMessage
+from .presence import broadcaster, get_presence_registry
+from .rooms import get_room_for_user
+from .sanitization import sanitize_async
 
-def set_target(attrs, new=False):
-    """From https://bleach.readthedocs.io/en/latest/linkify.html#setting-attributes."""
-
-    p = urlparse(attrs[(None, 'href')])
-    if p.netloc not in ['my-domain.com', 'other-domain.com']:
-        attrs[(None, 'target')] = '_blank'
-        attrs[(None, 'class')] = 'external'
-    else:
-        attrs.pop((None, 'target'), None)
-    return attrs
+User = get_user_model
 
 
 class PublicChatConsumer(AsyncJsonWebsocketConsumer):
@@ -27,22 +23,68 @@ class PublicChatConsumer(AsyncJsonWebsocketConsumer):
         Called when the websocket is handshaking.
         """
         print("PublicChatConsumer: connect: " + str(self.scope["user"]))
-        # let everyone connect. But limit read/write to authenticated users
+        user = self.scope["user"]
+
+        # Check they can join the room once, rather than for every message
+        self.room = await database_sync_to_async(get_room_for_user)(
+            self.scope["url_route"]["kwargs"]["room_id"], user)
+        if self.room is None:
+            # Reject the handshake
+            await self.close()
+            return
+
+        # let everyone connect to the public room. But limit read/write to authenticated users
         await self.accept()
 
+        # Work out how they're shown in the chat once, rather than for every message
+        if user.is_authenticated:
+            self.full_name = escape(user.get_full_name())
+            self.user_id = escape(user.id)
+            self.flood_control = FloodControl(user.id)
+        else:
+            self.full_name = None
+            self.user_id = None
+
+        # Messages arriving within this many seconds of each other are sent to the client in one frame
+        self.batch_window = getattr(settings, "CHAT_BATCH_WINDOW_MS", 50) / 1000
+        self.outbox = []
+        self.outbox_task = None
+
         # Add them to the group so they get room messages
         await self.channel_layer.group_add(
-            "public_chatroom_1",
+            self.room.group_name,
             self.channel_name,
         )
 
+        # Catch them up on what's been said
+        await self.send_history()
+
+        # Count them as online, and tell everyone if they weren't already in another tab
+        registry = get_presence_registry()
+        if self.user_id is not None and await registry.join(self.room.room_id, user.id):
+            broadcaster.changed(self.room, self.channel_layer)
+        await self.send_json({"command": "presence", "online": await registry.count(self.room.room_id)})
+
     async def disconnect(self, code):
         """
         Called when the WebSocket closes.
         """
         # leave the room
         print("PublicChatConsumer: disconnect")
-        pass
+        if getattr(self, "room", None) is None:
+            # They were never let in
+            return
+
+        await self.channel_layer.group_discard(
+            self.room.group_name,
+            self.channel_name,
+        )
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+
+        if self.user_id is not None and await get_presence_registry().leave(self.room.room_id,
+                                                                            self.scope["user"].id):
+            broadcaster.changed(self.room, self.channel_layer)
 
     async def receive_json(self, content):
         """
@@ -51,34 +93,86 @@ class PublicChatConsumer(AsyncJsonWebsocketConsumer):
         # Messages will have a "command" key we can switch on
         command = content.get("command", None)
         print("PublicChatConsumer: receive_json: " + str(command))
-        print("PublicChatConsumer: receive_json: message: " + str(content["message"]))
-        if command == "send":
+        print("PublicChatConsumer: receive_json: message: " + str(content.get("message")))
+        if command == "send" and self.user_id is not None:
             if len(content["message"].lstrip()) > 0:
-                await self.send_message(content["message"])
+                error = self.flood_control.check(content["message"])
+                if error:
+                    await self.send_json({"command": "error", "error": error})
+                else:
+                    await self.send_message(content["message"])
+        elif command == "load_older" and str(content.get("cursor")).startswith("older_"):
+            await self.send_history(content["cursor"])
 
     async def send_message(self, message):
-        profanity.load_censor_words()
-        linker = Linker(callbacks=[set_target])
+        message = await sanitize_async(message)
+
+        # Save it in the background rather than waiting for the database
+        buffer.add(ChatMessage(room_id=self.room.room_id, message=message, user=self.scope["user"]))
+
         await self.channel_layer.group_send(
-            "public_chatroom_1",
+            self.room.group_name,
             {
                 "type": "chat.message",
-                "full_name": escape(self.scope["user"].get_full_name()),
-                "user_id": escape(self.scope["user"].id),
-                "message": linker.linkify(profanity.censor(escape(message))),
+                "full_name": self.full_name,
+                "user_id": self.user_id,
+                "message": message,
             }
         )
 
+    async def send_history(self, cursor=None):
+        """
+        Send a page of the room's history, oldest first.
+
+        :param cursor: from the last page sent to get older messages, or None for the latest ones
+        """
+        if cursor is None:
+            messages, older = await database_sync_to_async(get_latest_history)(self.room.room_id)
+        else:
+            page = await database_sync_to_async(get_history)(self.room.room_id, cursor)
+            messages, older = page.items[::-1], page.older_cursor
+
+        await self.send_json(
+            {
+                "command": "history",
+                "messages": [message.to_json() for message in messages],
+                "older": older,
+            },
+        )
+
     async def chat_message(self, event):
         """
         Called when someone has messaged our chat.
         """
         # Send a message down to the client
         print("PublicChatConsumer: chat_message from user #" + str(event["user_id"]))
-        await self.send_json(
+        self.outbox.append(
             {
                 "full_name": event["full_name"],
                 "user_id": event["user_id"],
                 "message": event["message"],
             },
         )
+
+        # Wait a moment for any more messages, so a busy room doesn't mean a frame per message
+        if self.outbox_task is None:
+            self.outbox_task = asyncio.get_running_loop().create_task(self.send_outbox())
+
+    async def presence_update(self, event):
+        """
+        Called when the number of people online in the room has changed.
+        """
+        await self.send_json({"command": "presence", "online": event["online"]})
+
+    async def send_outbox(self):
+        """
+        Send the waiting messages down to the client in one frame.
+        """
+        await asyncio.sleep(self.batch_window)
+        messages, self.outbox, self.outbox_task = self.outbox, [], None
+        await self.send_json(
+            {
+                "command": "messages",
+                "messages": messages,
+            },
+        )
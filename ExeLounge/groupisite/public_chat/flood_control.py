@@ -0,0 +1,89 @@
+"""
+Stops anyone flooding a chat room.
+
+Each connection and each user gets a token bucket: sending a message takes a
+token, and tokens come back at a steady rate up to a small burst. The user's
+bucket is shared between their tabs, so opening more of them doesn't help.
+"""
+import time
+from typing import Callable
+
+from django.conf import settings
+
+# The longest message that can be sent, in characters
+MAX_MESSAGE_LENGTH = getattr(settings, "CHAT_MAX_MESSAGE_LENGTH", 1000)
+
+# Messages per second, and how many can be sent at once, for each connection and each user
+CONNECTION_RATE = getattr(settings, "CHAT_CONNECTION_RATE", (2, 5))
+USER_RATE = getattr(settings, "CHAT_USER_RATE", (3, 8))
+
+# Forget full buckets once there are more users than this
+MAX_USER_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allows rate things per second on average, and up to capacity at once."""
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+
+    def refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        """Take a token if there's one left."""
+
+        self.refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_full(self) -> bool:
+        self.refill()
+        return self.tokens >= self.capacity
+
+
+user_buckets = {}
+
+
+def get_user_bucket(user_id: int) -> TokenBucket:
+    """Get the bucket shared by all of a user's connections to this worker."""
+
+    bucket = user_buckets.get(user_id)
+    if bucket is None:
+        if len(user_buckets) >= MAX_USER_BUCKETS:
+            # Anyone with a full bucket hasn't sent anything for a while, so can start again from full
+            for idle in [key for key, value in user_buckets.items() if value.is_full()]:
+                del user_buckets[idle]
+        bucket = user_buckets[user_id] = TokenBucket(*USER_RATE)
+    return bucket
+
+
+class FloodControl:
+    """Checks the messages sent on one connection."""
+
+    def __init__(self, user_id: int):
+        self.connection_bucket = TokenBucket(*CONNECTION_RATE)
+        self.user_bucket = get_user_bucket(user_id)
+
+    def check(self, message: str) -> str:
+        """
+        Check whether a message can be sent.
+
+        :return: why it can't be sent, or an empty string if it can
+        """
+
+        if len(message) > MAX_MESSAGE_LENGTH:
+            return "Messages can't be longer than %d characters." % MAX_MESSAGE_LENGTH
+
+        # Only use up one of the user's tokens if the connection has one
+        if not self.connection_bucket.take() or not self.user_bucket.take():
+            return "You're sending messages too quickly, wait a moment and try again."
+        return ""
@@ -0,0 +1,152 @@
+"""
+Keeps the history of each chat room.
+
+Messages aren't saved as they're sent, since waiting on the database would
+hold up the socket. Instead they're buffered and saved in batches, either once
+enough have built up or after a short delay. A batch that can't be saved is
+tried again after the delay, and logged and dropped if it keeps failing.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from groupisite.pagination import KeysetPage, paginate_by_date
+
+from .models import ChatMessage
+
+# The number of messages sent when joining a room or loading older messages
+HISTORY_PAGE_LENGTH = 50
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """
+    Saves messages with bulk_create every max_messages messages or max_delay seconds.
+
+    Messages that fail to save are put back in the queue, until they've been
+    tried max_attempts times.
+    """
+
+    def __init__(self, max_messages: int, max_delay: float, max_attempts: int = 3):
+        self.max_messages = max_messages
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+        # Messages waiting to be saved, and those being saved right now
+        self.pending = []
+        self.saving = []
+
+        self.timer: Optional[asyncio.Task] = None
+
+    def add(self, message: ChatMessage) -> None:
+        """Queue a message to be saved, without waiting for it."""
+
+        self.pending.append(message)
+        loop = asyncio.get_running_loop()
+
+        # Forget a timer left behind by an event loop that has since stopped
+        if self.timer is not None and (self.timer.done() or self.timer.get_loop() is not loop):
+            self.timer = None
+
+        if len(self.pending) >= self.max_messages:
+            # Save them now, so the timer can start again for the next batch
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            loop.create_task(self.flush())
+
+        elif self.timer is None:
+            self.timer = loop.create_task(self.flush_later())
+
+    async def flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Save all the pending messages in one query."""
+
+        if not self.pending:
+            return
+        messages, self.pending = self.pending, []
+        self.saving += messages
+        try:
+            await database_sync_to_async(ChatMessage.objects.bulk_create)(messages)
+        except Exception:
+            logger.exception("Couldn't save %d chat messages", len(messages))
+            self.retry(messages)
+        finally:
+            saved = set(map(id, messages))
+            self.saving = [message for message in self.saving if id(message) not in saved]
+
+    def retry(self, messages: list) -> None:
+        """Queue messages that couldn't be saved to be tried again later, dropping any tried too many times."""
+
+        retrying = []
+        for message in messages:
+            message.save_attempts = getattr(message, "save_attempts", 0) + 1
+            if message.save_attempts < self.max_attempts:
+                retrying.append(message)
+            else:
+                logger.error("Gave up saving a chat message after %d attempts: room %s, user %s, sent %s: %r",
+                             message.save_attempts, message.room_id, message.user_id, message.date, message.message)
+
+        if retrying:
+            # Before anything sent since, so they're still saved in order
+            self.pending = retrying + self.pending
+            loop = asyncio.get_running_loop()
+            if self.timer is None or self.timer.done() or self.timer.get_loop() is not loop:
+                self.timer = loop.create_task(self.flush_later())
+
+    async def flush_all(self) -> None:
+        """Save everything still waiting, e.g. when the server stops, trying failures again straight away."""
+
+        while self.pending:
+            await self.flush()
+
+        if self.timer is not None and self.timer.get_loop() is asyncio.get_running_loop():
+            self.timer.cancel()
+        self.timer = None
+
+    def unsaved(self, room_id: str) -> list:
+        """Get the messages for a room that might not be in the database yet, oldest first."""
+
+        return [message for message in self.saving + self.pending if message.room_id == room_id]
+
+
+buffer = MessageBuffer(getattr(settings, "CHAT_HISTORY_BATCH_SIZE", 100),
+                       getattr(settings, "CHAT_HISTORY_FLUSH_MS", 250) / 1000)
+
+
+def get_history(room_id: str, cursor: Optional[str] = None,
+                per_page: int = HISTORY_PAGE_LENGTH) -> KeysetPage:
+    """
+    Get a page of a room's history, newest first.
+
+    :param room_id: the room
+    :param cursor: from a previous page to get older messages, or None for the latest ones
+    :param per_page: the number of messages on each page
+    """
+
+    return paginate_by_date(ChatMessage.objects.filter(room_id=room_id).select_related("user"),
+                            cursor, per_page)
+
+
+def get_latest_history(room_id: str, per_page: int = HISTORY_PAGE_LENGTH) -> tuple:
+    """
+    Get the latest messages in a room, including any that haven't been saved yet.
+
+    :return: the messages oldest first, and the cursor for older messages
+    """
+
+    # Check the buffer first, so a message saved in the meantime is found twice rather than not at all
+    unsaved = buffer.unsaved(room_id)
+    page = get_history(room_id, None, per_page)
+
+    saved = {(message.user_id, message.date, message.message) for message in page.items}
+    return page.items[::-1] + [message for message in unsaved
+                               if (message.user_id, message.date, message.message) not in saved], \
+        page.older_cursor
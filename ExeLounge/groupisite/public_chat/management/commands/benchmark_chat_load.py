@@ -0,0 +1,177 @@
+import asyncio
+import json
+import time
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from groupisite.benchmarking import get_rss, summarize
+from groupisite.routing import application
+from public_chat.rooms import PUBLIC_ROOM_ID, ChatRoom
+from users.models import Module, UserProfile
+
+# The simulated clients' usernames, followed by their number
+USERNAME_FORMAT = "chat-load-%d@example.com"
+
+
+def get_clients(count: int) -> list:
+    """Get the users for the simulated clients, creating any that don't exist yet."""
+
+    usernames = [USERNAME_FORMAT % i for i in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+    User.objects.bulk_create([User(username=username, first_name="Load", last_name="Test %d" % i, password="!")
+                              for i, username in enumerate(usernames) if username not in existing],
+                             batch_size=1000)
+
+    users = list(User.objects.filter(username__in=usernames).order_by("pk"))
+    with_profiles = set(UserProfile.objects.filter(user__in=users).values_list("user_id", flat=True))
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in users if user.pk not in with_profiles],
+                                    batch_size=1000)
+    return users
+
+
+def get_rooms(count: int) -> list:
+    """Get the public room and count - 1 module rooms."""
+
+    modules = list(Module.objects.order_by("pk")[:count - 1])
+    if len(modules) < count - 1:
+        raise CommandError("There are only %d modules, so there can't be more than %d rooms."
+                           % (len(modules), len(modules) + 1))
+    return [ChatRoom.get(PUBLIC_ROOM_ID)] + [ChatRoom.for_module(module) for module in modules]
+
+
+def join_rooms(users: list, rooms: list) -> list:
+    """Put each user in a room, taking turns between them, and make them able to join it."""
+
+    assigned = [rooms[i % len(rooms)] for i in range(len(users))]
+    profiles = dict(UserProfile.objects.filter(user__in=users).values_list("user_id", "pk"))
+    UserProfile.modules.through.objects.bulk_create(
+        [UserProfile.modules.through(userprofile_id=profiles[user.pk], module_id=room.module.pk)
+         for user, room in zip(users, assigned) if room.module is not None],
+        batch_size=1000, ignore_conflicts=True)
+    return assigned
+
+
+def log_in(user: User) -> str:
+    """Make a session for a user, like logging in does, and get its key."""
+
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+class Client:
+    """A simulated browser with the chat open."""
+
+    def __init__(self, room: ChatRoom, session_key: str, origin: str):
+        self.room = room
+        self.communicator = WebsocketCommunicator(
+            application, "/public_chat/%s/" % room.room_id,
+            headers=[(b"cookie", ("%s=%s" % (settings.SESSION_COOKIE_NAME, session_key)).encode()),
+                     (b"origin", origin.encode())])
+        self.latencies = []
+        self.refused = 0
+
+    async def connect(self) -> None:
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise CommandError("A client couldn't connect to %s, check --origin is allowed."
+                               % self.room.room_id)
+
+    async def receive(self) -> None:
+        """Record how long each message took to arrive, until cancelled."""
+
+        while True:
+            # Read the frames directly, since timing out in receive_from would stop the consumer
+            frame = await self.communicator.output_queue.get()
+            if frame["type"] != "websocket.send":
+                continue
+
+            received = time.perf_counter()
+            content = json.loads(frame["text"])
+            if content.get("command") == "messages":
+                self.latencies += [received - float(message["message"]) for message in content["messages"]]
+            elif content.get("command") == "error":
+                self.refused += 1
+
+    async def send(self) -> None:
+        await self.communicator.send_json_to({"command": "send", "message": "%.6f" % time.perf_counter()})
+
+
+async def run_load(clients: list, rate: float, duration: float, drain: float) -> dict:
+    """Connect the clients, send rate messages a second between them for duration seconds, then disconnect."""
+
+    rss_before = get_rss()
+    for start in range(0, len(clients), 100):
+        await asyncio.gather(*[client.connect() for client in clients[start:start + 100]])
+    rss_per_connection = (get_rss() - rss_before) / len(clients)
+
+    receivers = [asyncio.ensure_future(client.receive()) for client in clients]
+
+    # Send each message on time, taking turns between the clients
+    sent = int(rate * duration)
+    start = time.perf_counter()
+    for i in range(sent):
+        await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+        await clients[i % len(clients)].send()
+    sending_time = time.perf_counter() - start
+
+    await asyncio.sleep(drain)
+    for receiver in receivers:
+        receiver.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    for client in clients:
+        await client.communicator.disconnect()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    return {"sent": sent,
+            "refused": sum(client.refused for client in clients),
+            "delivered": len(latencies),
+            "sent_per_second": sent / sending_time if sending_time else 0,
+            "delivered_per_second": len(latencies) / (sending_time + drain),
+            "latency_ms": summarize(latencies),
+            "rss_per_connection_kb": rss_per_connection / 1024}
+
+
+class Command(BaseCommand):
+    help = "Open simulated chat clients in this process, send messages between them and report how long " \
+           "they took to arrive as JSON. The clients' users are kept for next time. Keep the rate per " \
+           "client within the chat's flood control, or the extra messages are refused."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=100,
+                            help="The number of clients, each logged in as its own user.")
+        parser.add_argument("--rooms", type=int, default=1,
+                            help="The number of rooms, the public room and then module rooms.")
+        parser.add_argument("--rate", type=float, default=50,
+                            help="The number of messages sent per second, between all the clients.")
+        parser.add_argument("--duration", type=float, default=10,
+                            help="How long to send messages for, in seconds.")
+        parser.add_argument("--drain", type=float, default=1,
+                            help="How long to wait for the last messages to arrive, in seconds.")
+        parser.add_argument("--origin", default="http://localhost",
+                            help="The origin the clients connect from, which must be in ALLOWED_HOSTS.")
+        parser.add_argument("--label", default="",
+                            help="A label to tell the results apart, e.g. the commit.")
+
+    def handle(self, *args, **options) -> None:
+        users = get_clients(options["clients"])
+        rooms = join_rooms(users, get_rooms(options["rooms"]))
+        session_keys = [log_in(user) for user in users]
+        clients = [Client(room, session_key, options["origin"]) for session_key, room in zip(session_keys, rooms)]
+
+        try:
+            results = asyncio.run(run_load(clients, options["rate"], options["duration"], options["drain"]))
+        finally:
+            SessionStore.get_model_class().objects.filter(session_key__in=session_keys).delete()
+        self.stdout.write(json.dumps(dict({"label": options["label"],
+                                           "clients": options["clients"],
+                                           "rooms": options["rooms"],
+                                           "rate": options["rate"],
+                                           "duration": options["duration"]}, **results), indent=2))
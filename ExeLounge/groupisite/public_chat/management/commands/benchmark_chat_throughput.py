@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import path
+from public_chat.consumers import PublicChatConsumer
+from public_chat.flood_control import FloodControl
+from public_chat.rooms import ChatRoom, PUBLIC_ROOM_ID
+
+
+async def deliver(clients: int, messages: int, burst: int) -> tuple:
+    """
+    Send messages to the public room and wait for every client to get them all.
+
+    :param burst: the number of messages sent before waiting for the clients to catch up
+    :return: the time taken and the number of frames the clients got between them
+    """
+
+    application = URLRouter([path("public_chat/<room_id>/", PublicChatConsumer.as_asgi())])
+    communicators = []
+    for _ in range(clients):
+        communicator = WebsocketCommunicator(application, "/public_chat/%s/" % PUBLIC_ROOM_ID)
+        communicator.scope["user"] = AnonymousUser()
+        await communicator.connect()
+        await communicator.receive_json_from()
+        communicators.append(communicator)
+
+    received = [0] * clients
+    frames = [0] * clients
+
+    async def receive(client: int) -> None:
+        while received[client] < messages:
+            received[client] += len((await communicators[client].receive_json_from(timeout=60))["messages"])
+            frames[client] += 1
+
+    layer = get_channel_layer()
+    group = ChatRoom.get(PUBLIC_ROOM_ID).group_name
+    start = time.perf_counter()
+    receivers = asyncio.gather(*[receive(client) for client in range(clients)])
+    for i in range(messages):
+        await layer.group_send(group, {"type": "chat.message", "full_name": "Derek Smith", "user_id": "1",
+                                       "message": "Message %d" % i})
+
+        # Let the clients catch up now and then, rather than overflowing their channels
+        if (i + 1) % burst == 0:
+            while min(received) <= i - burst // 2:
+                await asyncio.sleep(0.001)
+    await receivers
+    elapsed = time.perf_counter() - start
+
+    for communicator in communicators:
+        await communicator.disconnect()
+    return elapsed, sum(frames)
+
+
+class Command(BaseCommand):
+    help = "Measure how quickly flood control checks messages, and how quickly a busy room reaches " \
+           "its clients with and without batching frames."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--clients", type=int, default=20,
+                            help="The number of clients in the room.")
+        parser.add_argument("--messages", type=int, default=200,
+                            help="The number of messages sent to the room.")
+        parser.add_argument("--burst", type=int, default=50,
+                            help="The number of messages sent at once, which must fit in a channel.")
+        parser.add_argument("--windows", type=int, nargs="+", default=[0, 50],
+                            help="The batch windows to try, in milliseconds.")
+
+    def handle(self, *args, **options) -> None:
+        flood_control = FloodControl(0)
+        checks = 100000
+        start = time.perf_counter()
+        for _ in range(checks):
+            flood_control.check("Hello")
+        self.stdout.write("Flood control: %.0f checks/sec" % (checks / (time.perf_counter() - start)))
+
+        for window in options["windows"]:
+            with override_settings(CHAT_BATCH_WINDOW_MS=window):
+                elapsed, frames = asyncio.run(deliver(options["clients"], options["messages"], options["burst"]))
+            delivered = options["clients"] * options["messages"]
+            self.stdout.write("Batch window %dms: %d messages in %d frames, %.0f messages/sec"
+                              % (window, delivered, frames, delivered / elapsed))
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from better_profanity import profanity
+from bleach.linkifier import Linker
+from django.core.management.base import BaseCommand
+from django.utils.html import escape
+from public_chat.sanitization import sanitize, sanitize_async, set_target
+
+
+def sanitize_per_message(message: str) -> str:
+    """Sanitize a message the way the consumer used to, building the filters every time."""
+
+    profanity.load_censor_words()
+    linker = Linker(callbacks=[set_target])
+    return linker.linkify(profanity.censor(escape(message)))
+
+
+class Command(BaseCommand):
+    help = "Measure how many chat messages per second can be sanitized, before and after " \
+           "building the filters once."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--messages", type=int, default=200,
+                            help="The number of messages to sanitize.")
+        parser.add_argument("--unique", type=int, default=50,
+                            help="The number of different messages, the rest are repeats.")
+
+    def handle(self, *args, **options) -> None:
+        messages = ["Message %d, see <b>https://exelounge.herokuapp.com/forums/%d/</b> for details" %
+                    (i % options["unique"], i % options["unique"]) for i in range(options["messages"])]
+
+        # Build the filters for every message
+        start = time.perf_counter()
+        for message in messages:
+            sanitize_per_message(message)
+        before = len(messages) / (time.perf_counter() - start)
+
+        # Build the filters once, sanitizing in the thread pool
+        async def sanitize_all() -> None:
+            await asyncio.gather(*[sanitize_async(message) for message in messages])
+
+        sanitize.cache_clear()
+        start = time.perf_counter()
+        asyncio.run(sanitize_all())
+        after = len(messages) / (time.perf_counter() - start)
+
+        self.stdout.write("Before: %.0f messages/sec" % before)
+        self.stdout.write("After: %.0f messages/sec (%.1fx)" % (after, after / before))
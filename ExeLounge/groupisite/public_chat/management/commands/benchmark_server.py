@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+import websockets
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from groupisite.benchmarking import summarize
+
+from .benchmark_chat_load import get_clients, get_rooms, join_rooms, log_in
+
+
+class PageClient:
+    """A simulated browser requesting pages one after another over a kept-alive connection."""
+
+    def __init__(self, base_url: str, cookie: str):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.cookie = cookie
+        self.reader = self.writer = None
+        self.latencies = []
+        self.errors = 0
+
+    async def get(self, path: str) -> None:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        start = time.perf_counter()
+        self.writer.write(("GET %s HTTP/1.1\r\nHost: %s\r\nCookie: %s\r\n\r\n"
+                           % (path, self.host, self.cookie)).encode())
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+        headers = dict(line.split(": ", 1) for line in head.split("\r\n")[1:] if ": " in line)
+
+        # Without a length or chunks the body ends when the server closes the connection
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            await self.read_chunks()
+        else:
+            await self.reader.read()
+            headers["connection"] = "close"
+        self.latencies.append(time.perf_counter() - start)
+
+        if not head.startswith(("http/1.1 2", "http/1.1 3")):
+            self.errors += 1
+        if headers.get("connection") == "close":
+            self.writer.close()
+            self.writer = None
+
+    async def read_chunks(self) -> None:
+        while True:
+            size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await self.reader.readexactly(size + 2)
+            if size == 0:
+                return
+
+    async def run(self, paths: list, until: float) -> None:
+        while time.perf_counter() < until:
+            for path in paths:
+                try:
+                    await self.get(path)
+                except (OSError, asyncio.IncompleteReadError):
+                    self.errors += 1
+                    self.writer = None
+
+
+class ChatClient:
+    """A simulated browser with the chat open, over a real socket."""
+
+    def __init__(self, ws_url: str, room_id: str, cookie: str, origin: str):
+        self.url = "%s/public_chat/%s/" % (ws_url.rstrip("/"), room_id)
+        self.headers = {"Cookie": cookie, "Origin": origin}
+        self.socket = None
+        self.latencies = []
+
+    async def connect(self) -> None:
+        try:
+            self.socket = await websockets.connect(self.url, additional_headers=self.headers)
+        except (OSError, websockets.InvalidHandshake) as error:
+            raise CommandError("A client couldn't connect to %s: %s" % (self.url, error))
+
+    async def receive(self) -> None:
+        """Record how long each message took to arrive, until cancelled or disconnected."""
+
+        async for frame in self.socket:
+            received = time.perf_counter()
+            content = json.loads(frame)
+            if content.get("command") == "messages":
+                self.latencies += [received - float(message["message"]) for message in content["messages"]]
+
+    async def run(self, rate: float, until: float) -> None:
+        """Send rate messages a second until the given time."""
+
+        start = time.perf_counter()
+        sent = 0
+        while time.perf_counter() < until:
+            await self.socket.send(json.dumps({"command": "send", "message": "%.6f" % time.perf_counter()}))
+            sent += 1
+            await asyncio.sleep(max(0.0, start + sent / rate - time.perf_counter()))
+
+
+async def run_load(pages: list, chats: list, paths: list, chat_rate: float, duration: float,
+                   drain: float) -> dict:
+    """Request the pages and send chat messages at the same time for duration seconds."""
+
+    for start in range(0, len(chats), 100):
+        await asyncio.gather(*[chat.connect() for chat in chats[start:start + 100]])
+    receivers = [asyncio.ensure_future(chat.receive()) for chat in chats]
+
+    start = time.perf_counter()
+    until = start + duration
+    await asyncio.gather(*[page.run(paths, until) for page in pages],
+                         *[chat.run(chat_rate, until) for chat in chats])
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(drain)
+    for receiver in receivers:
+        receiver.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    await asyncio.gather(*[chat.socket.close() for chat in chats])
+    for page in pages:
+        if page.writer is not None:
+            page.writer.close()
+
+    page_latencies = [latency for page in pages for latency in page.latencies]
+    chat_latencies = [latency for chat in chats for latency in chat.latencies]
+    return {"pages": {"requests": len(page_latencies),
+                      "errors": sum(page.errors for page in pages),
+                      "requests_per_second": len(page_latencies) / elapsed,
+                      "latency_ms": summarize(page_latencies)},
+            "chat": {"delivered": len(chat_latencies),
+                     "delivered_per_second": len(chat_latencies) / (elapsed + drain),
+                     "latency_ms": summarize(chat_latencies)}}
+
+
+class Command(BaseCommand):
+    help = "Load a running server with page requests and chat messages at the same time, over real " \
+           "connections, and report the throughput as JSON. Run it against each way of serving the site " \
+           "to compare them, e.g. gunicorn (see gunicorn.conf.py) against runserver with --ws-url " \
+           "pointing at a separate chat server. Use the same database as the server, the clients log in " \
+           "by making sessions in it."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--url", default="http://localhost:8000",
+                            help="The server's address.")
+        parser.add_argument("--ws-url",
+                            help="The chat server's address if it's separate, e.g. ws://localhost:8001.")
+        parser.add_argument("--paths", nargs="+", default=["/", "/forums/", "/live-chat/"],
+                            help="The pages each page client requests in turn.")
+        parser.add_argument("--page-clients", type=int, default=20,
+                            help="The number of clients requesting pages, each one at a time.")
+        parser.add_argument("--chat-clients", type=int, default=100,
+                            help="The number of clients in the chat.")
+        parser.add_argument("--rooms", type=int, default=1,
+                            help="The number of rooms, the public room and then module rooms.")
+        parser.add_argument("--chat-rate", type=float, default=0.2,
+                            help="The number of messages each chat client sends per second, which must be "
+                                 "within the chat's flood control.")
+        parser.add_argument("--duration", type=float, default=30,
+                            help="How long to run for, in seconds.")
+        parser.add_argument("--drain", type=float, default=1,
+                            help="How long to wait for the last messages to arrive, in seconds.")
+        parser.add_argument("--label", default="",
+                            help="A label to tell the results apart, e.g. the server.")
+
+    def handle(self, *args, **options) -> None:
+        url = options["url"].rstrip("/")
+        ws_url = options["ws_url"] or url.replace("http", "ws", 1)
+
+        users = get_clients(options["page_clients"] + options["chat_clients"])
+        rooms = join_rooms(users[options["page_clients"]:], get_rooms(options["rooms"]))
+        session_keys = [log_in(user) for user in users]
+        cookies = ["%s=%s" % (settings.SESSION_COOKIE_NAME, session_key) for session_key in session_keys]
+
+        pages = [PageClient(url, cookie) for cookie in cookies[:options["page_clients"]]]
+        chats = [ChatClient(ws_url, room.room_id, cookie, url)
+                 for cookie, room in zip(cookies[options["page_clients"]:], rooms)]
+
+        try:
+            results = asyncio.run(run_load(pages, chats, options["paths"], options["chat_rate"],
+                                           options["duration"], options["drain"]))
+        finally:
+            SessionStore.get_model_class().objects.filter(session_key__in=session_keys).delete()
+        self.stdout.write(json.dumps(dict({"label": options["label"],
+                                           "url": url,
+                                           "ws_url": ws_url,
+                                           "page_clients": options["page_clients"],
+                                           "chat_clients": options["chat_clients"],
+                                           "duration": options["duration"]}, **results), indent=2))
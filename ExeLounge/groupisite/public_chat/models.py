@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+from django.utils.html import escape
+
+
+class ChatMessage(models.Model):
+    """Represents a message sent to a chat room."""
+
+    # The room it was sent to, e.g. "public" or "module-3"
+    room_id = models.CharField(max_length=50)
+
+    # The message, already sanitized so it can be shown as it is
+    message = models.TextField()
+
+    # Set when the message is sent rather than saved, since saving happens in batches
+    date = models.DateTimeField(verbose_name="date & time sent", default=timezone.now)
+
+    # The author
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = "chat message"
+
+        # Sort in descending order, newest first
+        ordering = ["-date", "-id"]
+
+        # For fetching a page of a room's history
+        indexes = [
+            models.Index(fields=["room_id", "-date", "-id"], name="chat_message_room_date_idx")
+        ]
+
+    def __str__(self):
+        return "Message by " + self.user.username + " in " + self.room_id
+
+    def to_json(self) -> dict:
+        """Get the message as it's sent over the socket."""
+
+        return {"full_name": escape(self.user.get_full_name()),
+                "user_id": escape(self.user_id),
+                "message": self.message}
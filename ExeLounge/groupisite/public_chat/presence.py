@@ -0,0 +1,163 @@
+"""
+Keeps track of who's online in each chat room.
+
+Each room counts the connections of every user in it, so a user with the room
+open in several tabs is only counted once. Joining and leaving are O(1), and
+only change the number online when a user's first tab opens or last tab closes.
+"""
+import asyncio
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# The most often a room is told how many people are online, in seconds
+PRESENCE_INTERVAL = getattr(settings, "CHAT_PRESENCE_INTERVAL_MS", 1000) / 1000
+
+
+class PresenceRegistry:
+    """Counts the users in each room, for a single worker process."""
+
+    def __init__(self):
+        self.rooms = defaultdict(Counter)
+
+    async def join(self, room_id: str, user_id: int) -> bool:
+        """
+        Record a connection to a room.
+
+        :return: whether the number of users online changed
+        """
+
+        connections = self.rooms[room_id]
+        connections[user_id] += 1
+        return connections[user_id] == 1
+
+    async def leave(self, room_id: str, user_id: int) -> bool:
+        """
+        Record a connection to a room closing.
+
+        :return: whether the number of users online changed
+        """
+
+        connections = self.rooms[room_id]
+        connections[user_id] -= 1
+        if connections[user_id] > 0:
+            return False
+        del connections[user_id]
+        if not connections:
+            del self.rooms[room_id]
+        return True
+
+    async def count(self, room_id: str) -> int:
+        """Get the number of users online in a room."""
+
+        return len(self.rooms.get(room_id, ()))
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """
+    Counts the users in each room in Redis, so every worker sees the same numbers.
+
+    Each room is a hash of user ids to their number of connections.
+    """
+
+    # Removes the user from the hash when their last connection closes, in one step
+    LEAVE_SCRIPT = """
+        local connections = redis.call("HINCRBY", KEYS[1], ARGV[1], -1)
+        if connections <= 0 then
+            redis.call("HDEL", KEYS[1], ARGV[1])
+            return 1
+        end
+        return 0
+    """
+
+    # Forget a room nobody has joined for a day, in case a worker stopped without everyone leaving
+    EXPIRY = 86400
+
+    def __init__(self, url: str, prefix: str = "exelounge:presence"):
+        super().__init__()
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.leave_script = self.redis.register_script(self.LEAVE_SCRIPT)
+
+    def key(self, room_id: str) -> str:
+        return "%s:%s" % (self.prefix, room_id)
+
+    @sync_to_async(thread_sensitive=False)
+    def join(self, room_id: str, user_id: int) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key(room_id), user_id, 1)
+        pipe.expire(self.key(room_id), self.EXPIRY)
+        return pipe.execute()[0] == 1
+
+    @sync_to_async(thread_sensitive=False)
+    def leave(self, room_id: str, user_id: int) -> bool:
+        return bool(self.leave_script(keys=[self.key(room_id)], args=[user_id]))
+
+    @sync_to_async(thread_sensitive=False)
+    def count(self, room_id: str) -> int:
+        return self.redis.hlen(self.key(room_id))
+
+
+class PresenceBroadcaster:
+    """Tells a room how many people are online, at most once every interval."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_sent = {}
+        self.scheduled = {}
+
+    def changed(self, room, channel_layer) -> None:
+        """Schedule telling a room the number online, unless it's already scheduled."""
+
+        loop = asyncio.get_running_loop()
+        task = self.scheduled.get(room.room_id)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+
+        delay = max(0.0, self.last_sent.get(room.room_id, 0) + self.interval - time.monotonic())
+        self.scheduled[room.room_id] = loop.create_task(self.broadcast(room, channel_layer, delay))
+
+    async def broadcast(self, room, channel_layer, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self.last_sent[room.room_id] = time.monotonic()
+        self.scheduled.pop(room.room_id, None)
+
+        await channel_layer.group_send(
+            room.group_name,
+            {
+                "type": "presence.update",
+                "online": await get_presence_registry().count(room.room_id),
+            }
+        )
+
+
+broadcaster = PresenceBroadcaster(PRESENCE_INTERVAL)
+
+_registry = None
+
+
+def get_presence_registry() -> PresenceRegistry:
+    """Get the registry in Redis if the chat uses Redis, otherwise one for this process."""
+
+    global _registry
+    if _registry is None:
+        if getattr(settings, "CHAT_REDIS_URLS", None):
+            _registry = RedisPresenceRegistry(settings.CHAT_REDIS_URLS[0])
+        else:
+            _registry = PresenceRegistry()
+    return _registry
+
+
+@receiver(setting_changed)
+def reset_presence_registry(setting: str, **kwargs) -> None:
+    """Use a new registry when the setting is changed (e.g. in tests)."""
+
+    global _registry
+    if setting == "CHAT_REDIS_URLS":
+        _registry = None
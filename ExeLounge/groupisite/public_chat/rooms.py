@@ -0,0 +1,82 @@
+from typing import Optional
+
+from django.contrib.auth.models import User
+from users.models import Department, Module
+
+# The room that everyone can join
+PUBLIC_ROOM_ID = "public"
+
+
+class ChatRoom:
+    """
+    Represents a chat room, either for everyone, a module or a department.
+
+    Rooms are identified by "public", "module-<id>" or "department-<id>".
+    """
+
+    def __init__(self, room_id: str, name: str, module: Optional[Module] = None,
+                 department: Optional[Department] = None):
+        self.room_id = room_id
+        self.name = name
+        self.module = module
+        self.department = department
+
+    @property
+    def group_name(self) -> str:
+        """Get the name of the channel layer group for the room."""
+
+        return "chatroom_" + self.room_id
+
+    @staticmethod
+    def for_module(module: Module) -> "ChatRoom":
+        return ChatRoom("module-%d" % module.pk, str(module), module=module)
+
+    @staticmethod
+    def for_department(department: Department) -> "ChatRoom":
+        return ChatRoom("department-%d" % department.pk, str(department), department=department)
+
+    @staticmethod
+    def get(room_id: str) -> Optional["ChatRoom"]:
+        """Get a room from its id, or None if there's no such room."""
+
+        if room_id == PUBLIC_ROOM_ID:
+            return ChatRoom(PUBLIC_ROOM_ID, "Everyone")
+
+        kind, _, pk = room_id.partition("-")
+        if not pk.isdigit():
+            return None
+        if kind == "module":
+            module = Module.objects.filter(pk=pk).first()
+            return ChatRoom.for_module(module) if module else None
+        if kind == "department":
+            department = Department.objects.filter(pk=pk).first()
+            return ChatRoom.for_department(department) if department else None
+        return None
+
+    @staticmethod
+    def for_user(user: User) -> list:
+        """Get all the rooms that a user can join, from the modules they take."""
+
+        modules = list(Module.objects.filter(userprofile__user=user).select_related("department"))
+        departments = {module.department_id: module.department for module in modules}
+        return [ChatRoom.get(PUBLIC_ROOM_ID)] + \
+            [ChatRoom.for_department(department) for department in departments.values()] + \
+            [ChatRoom.for_module(module) for module in modules]
+
+    def is_member(self, user: User) -> bool:
+        """Whether a user can join the room, i.e. they take the module or a module in the department."""
+
+        if self.module is not None:
+            return Module.objects.filter(pk=self.module.pk, userprofile__user=user).exists()
+        if self.department is not None:
+            return Module.objects.filter(department=self.department, userprofile__user=user).exists()
+        return True
+
+
+def get_room_for_user(room_id: str, user: User) -> Optional[ChatRoom]:
+    """Get a room if the user can join it, otherwise None."""
+
+    room = ChatRoom.get(room_id)
+    if room is None or (not user.is_authenticated and room.room_id != PUBLIC_ROOM_ID):
+        return None
+    return room if room.is_member(user) else None
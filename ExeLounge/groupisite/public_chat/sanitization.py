@@ -0,0 +1,59 @@
+"""
+Cleans up chat messages before they're sent to the room.
+
+Escaping, censoring and linkifying a message is CPU bound, so it's done in a
+small pool of threads rather than on the event loop, where it would hold up
+every other socket on the worker.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from better_profanity import profanity
+from bleach.linkifier import Linker
+from django.conf import settings
+from django.utils.html import escape
+from six.moves.urllib.parse import urlparse
+
+# Load the censored words once, rather than for every message
+profanity.load_censor_words()
+
+# Each thread gets its own Linker, since its HTML parser can't be shared
+linkers = threading.local()
+
+executor = ThreadPoolExecutor(max_workers=getattr(settings, "CHAT_SANITIZATION_THREADS", 2),
+                              thread_name_prefix="chat-sanitization")
+
+
+def set_target(attrs, new=False):
+    """From https://bleach.readthedocs.io/en/latest/linkify.html#setting-attributes."""
+
+    p = urlparse(attrs[(None, 'href')])
+    if p.netloc not in ['my-domain.com', 'other-domain.com']:
+        attrs[(None, 'target')] = '_blank'
+        attrs[(None, 'class')] = 'external'
+    else:
+        attrs.pop((None, 'target'), None)
+    return attrs
+
+
+def get_linker() -> Linker:
+    """Get this thread's Linker, creating it the first time."""
+
+    if not hasattr(linkers, "linker"):
+        linkers.linker = Linker(callbacks=[set_target])
+    return linkers.linker
+
+
+@lru_cache(maxsize=1024)
+def sanitize(message: str) -> str:
+    """Escape any HTML in a message, censor profanity and turn URLs into links."""
+
+    return get_linker().linkify(profanity.censor(escape(message)))
+
+
+async def sanitize_async(message: str) -> str:
+    """Sanitize a message in the thread pool, without blocking the event loop."""
+
+    return await asyncio.get_running_loop().run_in_executor(executor, sanitize, message)
@@ -1,3 +1,542 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import multiprocessing
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from groupisite.routing import lifespan
+from users.models import College, Department, Module
+
+from .consumers import PublicChatConsumer
+from .flood_control import MAX_MESSAGE_LENGTH, FloodControl, TokenBucket, user_buckets
+from .history import MessageBuffer, buffer
+from .presence import PresenceBroadcaster, broadcaster, get_presence_registry
+from .models import ChatMessage
+from .rooms import ChatRoom, get_room_for_user
+from .sanitization import sanitize, sanitize_async
+from .worker_processes import send_chat_messages
+
+
+class SanitizationTests(SimpleTestCase):
+
+    def test_html_escaped(self) -> None:
+        """Tests that HTML in a message is shown as text."""
+
+        self.assertEqual(sanitize("<b>Hello</b>"), "&lt;b&gt;Hello&lt;/b&gt;")
+
+    def test_profanity_censored(self) -> None:
+        """Tests that swear words are censored."""
+
+        self.assertEqual(sanitize("Oh shit"), "Oh ****")
+
+    def test_links(self) -> None:
+        """Tests that URLs become links that open in a new tab."""
+
+        self.assertEqual(sanitize("See www.exeter.ac.uk"),
+                         'See <a class="external" href="http://www.exeter.ac.uk" target="_blank">www.exeter.ac.uk</a>')
+
+    def test_async(self) -> None:
+        """Tests that sanitizing in the thread pool gives the same result."""
+
+        self.assertEqual(async_to_sync(sanitize_async)("<i>See www.exeter.ac.uk</i>"),
+                         sanitize("<i>See www.exeter.ac.uk</i>"))
+
+
+class ChatCommunicator(WebsocketCommunicator):
+    """Leaves out presence frames, which can arrive at any time, unless a test wants them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ignore_presence = True
+        self.waiting = []
+
+    def is_ignored(self, frame: dict) -> bool:
+        return self.ignore_presence and frame.get("command") == "presence"
+
+    async def receive_json_from(self, timeout: float = 1) -> dict:
+        if self.waiting:
+            return self.waiting.pop(0)
+        while True:
+            frame = await super().receive_json_from(timeout)
+            if not self.is_ignored(frame):
+                return frame
+
+    async def receive_nothing(self, timeout: float = 0.1, interval: float = 0.01) -> bool:
+        while not self.waiting and not await super().receive_nothing(timeout, interval):
+            frame = await super().receive_json_from()
+            if not self.is_ignored(frame):
+                self.waiting.append(frame)
+        return not self.waiting
+
+
+class ChatTestCase(TransactionTestCase):
+
+    def setUp(self) -> None:
+        # Forget anything left over from another test
+        buffer.pending.clear()
+        user_buckets.clear()
+        broadcaster.last_sent.clear()
+
+        college = College.objects.create(college_name="CEMPS")
+        self.computer_science = Department.objects.create(department_name="Computer Science", college_name=college)
+        self.maths = Department.objects.create(department_name="Mathematics", college_name=college)
+        self.software_engineering = self.create_module("ECM2429", self.computer_science)
+        self.web_development = self.create_module("ECM1417", self.computer_science)
+        self.analysis = self.create_module("MTH2001", self.maths)
+
+        self.derek = User.objects.create_user(username="derek@exeter.ac.uk", first_name="Derek", last_name="Smith")
+        self.derek.profile.modules.add(self.software_engineering)
+        self.jane = User.objects.create_user(username="jane@exeter.ac.uk", first_name="Jane", last_name="Doe")
+        self.jane.profile.modules.add(self.web_development)
+
+    @staticmethod
+    def create_module(code: str, department: Department) -> Module:
+        return Module.objects.create(module_title=code, module_code=code, module_year=2, module_credit_value=15,
+                                     module_convenor="Dr Smith", module_descriptor_URL="", department=department)
+
+    @staticmethod
+    def connect(user: User, room_id: str) -> ChatCommunicator:
+        application = URLRouter([path("public_chat/<room_id>/", PublicChatConsumer.as_asgi())])
+        communicator = ChatCommunicator(application, "/public_chat/%s/" % room_id)
+        communicator.scope["user"] = user
+        return communicator
+
+
+class ChatRoomTests(ChatTestCase):
+
+    def test_membership(self) -> None:
+        """Tests that users can only join the rooms of their own modules and departments."""
+
+        module_room = "module-%d" % self.software_engineering.pk
+        department_room = "department-%d" % self.computer_science.pk
+        self.assertIsNotNone(get_room_for_user(module_room, self.derek))
+        self.assertIsNone(get_room_for_user(module_room, self.jane))
+        self.assertIsNotNone(get_room_for_user(department_room, self.jane))
+        self.assertIsNone(get_room_for_user("department-%d" % self.maths.pk, self.derek))
+        self.assertIsNone(get_room_for_user(module_room, AnonymousUser()))
+        self.assertIsNotNone(get_room_for_user("public", AnonymousUser()))
+        self.assertIsNone(get_room_for_user("module-x", self.derek))
+        self.assertIsNone(get_room_for_user("module-0", self.derek))
+
+    def test_rooms_for_user(self) -> None:
+        """Tests that a user's rooms are the public room, their departments and their modules."""
+
+        self.assertEqual([room.room_id for room in ChatRoom.for_user(self.derek)],
+                         ["public", "department-%d" % self.computer_science.pk,
+                          "module-%d" % self.software_engineering.pk])
+
+    def test_rejected(self) -> None:
+        """Tests that connecting to someone else's module room is refused."""
+
+        async def run() -> None:
+            communicator = self.connect(self.jane, "module-%d" % self.software_engineering.pk)
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(run)()
+
+    def test_messages_stay_in_room(self) -> None:
+        """Tests that a message only reaches sockets in the same room."""
+
+        async def run() -> None:
+            department_room = "department-%d" % self.computer_science.pk
+            derek = self.connect(self.derek, department_room)
+            jane = self.connect(self.jane, department_room)
+            public = self.connect(self.jane, "public")
+            for communicator in [derek, jane, public]:
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                await communicator.receive_json_from()
+
+            await derek.send_json_to({"command": "send", "message": "Hello"})
+            message = (await jane.receive_json_from(timeout=5))["messages"][0]
+            self.assertEqual(message["full_name"], "Derek Smith")
+            self.assertEqual(message["message"], "Hello")
+            self.assertTrue(await public.receive_nothing())
+
+            for communicator in [derek, jane, public]:
+                await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+class ChatHistoryTests(ChatTestCase):
+
+    def create_messages(self, count: int) -> None:
+        start = timezone.now() - datetime.timedelta(hours=1)
+        ChatMessage.objects.bulk_create([ChatMessage(room_id="public", user=self.derek, message="Message %d" % i,
+                                                     date=start + datetime.timedelta(seconds=i))
+                                         for i in range(count)])
+
+    def test_backfill(self) -> None:
+        """Tests that joining a room sends the latest messages, oldest first."""
+
+        self.create_messages(3)
+
+        async def run() -> None:
+            communicator = self.connect(self.jane, "public")
+            await communicator.connect()
+            history = await communicator.receive_json_from()
+            self.assertEqual(history["command"], "history")
+            self.assertEqual([message["message"] for message in history["messages"]],
+                             ["Message 0", "Message 1", "Message 2"])
+            self.assertEqual(history["messages"][0]["full_name"], "Derek Smith")
+            self.assertIsNone(history["older"])
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_load_older(self) -> None:
+        """Tests that older messages are loaded a page at a time."""
+
+        self.create_messages(60)
+
+        async def run() -> None:
+            communicator = self.connect(self.jane, "public")
+            await communicator.connect()
+            history = await communicator.receive_json_from()
+            self.assertEqual(len(history["messages"]), 50)
+            self.assertEqual(history["messages"][0]["message"], "Message 10")
+
+            await communicator.send_json_to({"command": "load_older", "cursor": history["older"]})
+            history = await communicator.receive_json_from()
+            self.assertEqual([message["message"] for message in history["messages"]],
+                             ["Message %d" % i for i in range(10)])
+            self.assertIsNone(history["older"])
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_write_behind(self) -> None:
+        """Tests that sent messages are saved in the background but are part of the history straight away."""
+
+        async def run() -> None:
+            derek = self.connect(self.derek, "public")
+            await derek.connect()
+            await derek.receive_json_from()
+            await derek.send_json_to({"command": "send", "message": "Hello"})
+            await derek.receive_json_from()
+
+            # It's in the history before it's been saved
+            jane = self.connect(self.jane, "public")
+            await jane.connect()
+            history = await jane.receive_json_from()
+            self.assertEqual([message["message"] for message in history["messages"]], ["Hello"])
+
+            # and only once after
+            await buffer.flush()
+            self.assertEqual(await database_sync_to_async(ChatMessage.objects.count)(), 1)
+            jane_again = self.connect(self.jane, "public")
+            await jane_again.connect()
+            history = await jane_again.receive_json_from()
+            self.assertEqual([message["message"] for message in history["messages"]], ["Hello"])
+
+            for communicator in [derek, jane, jane_again]:
+                await communicator.disconnect()
+
+        async_to_sync(run)()
+
+    def test_saved_on_shutdown(self) -> None:
+        """Tests that messages waiting to be saved are saved when the server stops."""
+
+        async def run() -> None:
+            buffer.add(ChatMessage(room_id="public", user=self.derek, message="Goodbye"))
+
+            server = ApplicationCommunicator(lifespan, {"type": "lifespan"})
+            await server.send_input({"type": "lifespan.startup"})
+            self.assertEqual(await server.receive_output(), {"type": "lifespan.startup.complete"})
+            await server.send_input({"type": "lifespan.shutdown"})
+            self.assertEqual(await server.receive_output(), {"type": "lifespan.shutdown.complete"})
+
+            self.assertEqual(await database_sync_to_async(ChatMessage.objects.count)(), 1)
+
+        async_to_sync(run)()
+
+    def test_batching(self) -> None:
+        """Tests that the buffer saves once it's full or once the delay is up."""
+
+        async def run() -> None:
+            count = database_sync_to_async(ChatMessage.objects.count)
+            batched = MessageBuffer(max_messages=3, max_delay=0.2)
+            for i in range(3):
+                batched.add(ChatMessage(room_id="public", user=self.derek, message="Message %d" % i))
+            await asyncio.sleep(0.1)
+            self.assertEqual(await count(), 3)
+
+            batched.add(ChatMessage(room_id="public", user=self.derek, message="Message 3"))
+            await asyncio.sleep(0.1)
+            self.assertEqual(await count(), 3)
+            await asyncio.sleep(0.2)
+            self.assertEqual(await count(), 4)
+
+        async_to_sync(run)()
+
+    def test_saving_retried(self) -> None:
+        """Tests that messages that couldn't be saved are tried again after the delay."""
+
+        async def run() -> None:
+            batched = MessageBuffer(max_messages=10, max_delay=0.1)
+            missing_pk = self.jane.pk + 1000
+            message = ChatMessage(room_id="public", user_id=missing_pk, message="Hello")
+            batched.pending.append(message)
+            with self.assertLogs("public_chat.history", "ERROR"):
+                await batched.flush()
+            self.assertEqual(batched.unsaved("public"), [message])
+
+            # Whatever was wrong is fixed before it's tried again
+            await database_sync_to_async(User.objects.create_user)(pk=missing_pk, username="ethel@exeter.ac.uk")
+            await asyncio.sleep(0.2)
+            self.assertEqual(await database_sync_to_async(ChatMessage.objects.count)(), 1)
+            self.assertEqual(batched.unsaved("public"), [])
+
+        async_to_sync(run)()
+
+    def test_saving_given_up(self) -> None:
+        """Tests that messages that keep failing to save are logged and dropped."""
+
+        async def run() -> None:
+            batched = MessageBuffer(max_messages=10, max_delay=0.1, max_attempts=2)
+            batched.pending.append(ChatMessage(room_id="public", user_id=self.jane.pk + 1000, message="Lost"))
+            with self.assertLogs("public_chat.history", "ERROR") as logs:
+                await batched.flush_all()
+            self.assertIn("Gave up saving a chat message after 2 attempts", logs.output[-1])
+            self.assertIn("'Lost'", logs.output[-1])
+            self.assertEqual(batched.unsaved("public"), [])
+            self.assertIsNone(batched.timer)
+
+        async_to_sync(run)()
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_and_refill(self) -> None:
+        """Tests that a bucket allows a burst, then refills at its rate."""
+
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+        clock.now = 0.5
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+
+        # It doesn't fill up beyond its capacity
+        clock.now = 100
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_message_length(self) -> None:
+        """Tests that long messages are refused."""
+
+        flood_control = FloodControl(1)
+        self.assertEqual(flood_control.check("a" * MAX_MESSAGE_LENGTH), "")
+        self.assertNotEqual(flood_control.check("a" * (MAX_MESSAGE_LENGTH + 1)), "")
+
+    def test_shared_between_connections(self) -> None:
+        """Tests that a user's connections share their allowance."""
+
+        user_buckets.clear()
+        first, second = FloodControl(1), FloodControl(1)
+        sent = 0
+        for _ in range(10):
+            sent += not first.check("Hello")
+            sent += not second.check("Hello")
+        self.assertEqual(sent, first.user_bucket.capacity)
+        self.assertIs(first.user_bucket, second.user_bucket)
+
+
+class ChatFloodTests(ChatTestCase):
+
+    def test_rate_limited(self) -> None:
+        """Tests that sending messages too quickly gets an error rather than sending them."""
+
+        async def run() -> None:
+            derek = self.connect(self.derek, "public")
+            await derek.connect()
+            await derek.receive_json_from()
+
+            replies = []
+            for _ in range(6):
+                await derek.send_json_to({"command": "send", "message": "Hello"})
+            while not await derek.receive_nothing(timeout=0.3):
+                replies.append(await derek.receive_json_from())
+
+            errors = [reply for reply in replies if reply["command"] == "error"]
+            messages = sum(len(reply["messages"]) for reply in replies if reply["command"] == "messages")
+            self.assertEqual(len(errors), 1)
+            self.assertEqual(messages, 5)
+            await derek.disconnect()
+
+        async_to_sync(run)()
+
+    @override_settings(CHAT_BATCH_WINDOW_MS=300)
+    def test_batched(self) -> None:
+        """Tests that messages sent close together reach other clients in one frame."""
+
+        async def run() -> None:
+            derek = self.connect(self.derek, "public")
+            jane = self.connect(self.jane, "public")
+            for communicator in [derek, jane]:
+                await communicator.connect()
+                await communicator.receive_json_from()
+
+            for i in range(3):
+                await derek.send_json_to({"command": "send", "message": "Message %d" % i})
+            frame = await jane.receive_json_from(timeout=5)
+            self.assertEqual([message["message"] for message in frame["messages"]],
+                             ["Message 0", "Message 1", "Message 2"])
+            self.assertTrue(await jane.receive_nothing())
+
+            for communicator in [derek, jane]:
+                await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+class FakeChannelLayer:
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group: str, message: dict) -> None:
+        self.sent.append((group, message))
+
+
+class PresenceTests(ChatTestCase):
+
+    def test_registry(self) -> None:
+        """Tests that users are counted once however many tabs they have open."""
+
+        async def run() -> None:
+            registry = get_presence_registry()
+            self.assertEqual([await registry.join("public", 1), await registry.join("public", 1),
+                              await registry.join("public", 2)], [True, False, True])
+            self.assertEqual(await registry.count("public"), 2)
+
+            self.assertEqual([await registry.leave("public", 1), await registry.leave("public", 2)],
+                             [False, True])
+            self.assertEqual(await registry.count("public"), 1)
+            self.assertTrue(await registry.leave("public", 1))
+            self.assertEqual(await registry.count("public"), 0)
+
+        async_to_sync(run)()
+
+    def test_throttled(self) -> None:
+        """Tests that a room is told the number online at most once every interval."""
+
+        async def run() -> None:
+            throttled = PresenceBroadcaster(interval=0.2)
+            layer = FakeChannelLayer()
+            room = ChatRoom.get("public")
+            for _ in range(5):
+                throttled.changed(room, layer)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(layer.sent), 1)
+
+            throttled.changed(room, layer)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(layer.sent), 1)
+            await asyncio.sleep(0.2)
+            self.assertEqual(len(layer.sent), 2)
+            self.assertEqual(layer.sent[0], (room.group_name, {"type": "presence.update", "online": 0}))
+
+        async_to_sync(run)()
+
+    def test_online_count(self) -> None:
+        """Tests that joining and leaving a room updates the number online for everyone in it."""
+
+        async def run() -> None:
+            derek = self.connect(self.derek, "public")
+            derek.ignore_presence = False
+            await derek.connect()
+            await derek.receive_json_from()
+            self.assertEqual(await derek.receive_json_from(), {"command": "presence", "online": 1})
+
+            # Another tab doesn't count
+            derek_again = self.connect(self.derek, "public")
+            await derek_again.connect()
+            jane = self.connect(self.jane, "public")
+            await jane.connect()
+
+            async def receive_online() -> int:
+                while True:
+                    frame = await derek.receive_json_from(timeout=5)
+                    if frame["command"] == "presence" and frame["online"] == 2:
+                        return frame["online"]
+
+            self.assertEqual(await receive_online(), 2)
+
+            await jane.disconnect()
+            await derek_again.disconnect()
+            self.assertEqual(await get_presence_registry().count("public"), 1)
+            await derek.disconnect()
+            self.assertEqual(await get_presence_registry().count("public"), 0)
+
+        async_to_sync(run)()
+
+    @skipUnless(settings.CHANNEL_LAYERS["default"]["BACKEND"] == "channels.layers.InMemoryChannelLayer",
+                "Only the in-memory channel layer's groups can be looked at.")
+    def test_group_discard(self) -> None:
+        """Tests that a closed socket is removed from the room's group."""
+
+        async def run() -> None:
+            derek = self.connect(self.derek, "public")
+            await derek.connect()
+            await derek.receive_json_from()
+            group = ChatRoom.get("public").group_name
+            self.assertEqual(len(get_channel_layer().groups.get(group, {})), 1)
+
+            await derek.disconnect()
+            self.assertEqual(len(get_channel_layer().groups.get(group, {})), 0)
+
+        async_to_sync(run)()
+
+
+@skipUnless(settings.CHAT_REDIS_URLS, "Set CHAT_REDIS_URLS to test the chat through Redis.")
+class RedisChannelLayerTests(ChatTestCase):
+
+    def test_delivery_between_processes(self) -> None:
+        """Tests that a message sent by one worker process reaches a socket in another through the channel layer."""
+
+        count = 100
+        sender = multiprocessing.get_context("spawn").Process(
+            target=send_chat_messages, args=(ChatRoom.get("public").group_name, count))
+
+        async def run() -> list:
+            derek = self.connect(self.derek, "public")
+            await derek.connect()
+            await derek.receive_json_from()
+
+            sender.start()
+            latencies = []
+            while len(latencies) < count:
+                frame = await derek.receive_json_from(timeout=30)
+                latencies += [time.time() - float(message["message"]) for message in frame["messages"]]
+
+            await asyncio.get_running_loop().run_in_executor(None, sender.join)
+            await derek.disconnect()
+            return sorted(latencies)
+
+        latencies = async_to_sync(run)()
+        print("Cross-process delivery of %d messages: p50 %.2fms, p99 %.2fms"
+              % (count, latencies[count // 2] * 1000, latencies[count * 99 // 100] * 1000))
+        self.assertEqual(len(latencies), count)
+        self.assertEqual(sender.exitcode, 0)
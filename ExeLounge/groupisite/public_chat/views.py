@@ -1,19 +1,24 @@
-from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render, redirect
 
+from .rooms import PUBLIC_ROOM_ID, ChatRoom, get_room_for_user
+
 # Create your views here.
-from groupisite.views import get_profile_pic
 
 
-def live_chat(request):
-    """Produce the live chat."""
+def live_chat(request, room_id: str = PUBLIC_ROOM_ID):
+    """Produce the live chat for a room, which the user must be able to join."""
 
     # If they're not logged in then send them to login
     if request.user.is_anonymous:
         return redirect("/login/")
 
-    context = {"debug_mode": settings.DEBUG,
-               "room_id": "1",
-               "profile_pic": get_profile_pic(request.user)}
+    room = get_room_for_user(room_id, request.user)
+    if room is None:
+        raise Http404("Chat room not found")
+
+    context = {"room_id": room.room_id,
+               "room": room,
+               "rooms": ChatRoom.for_user(request.user)}
 
     return render(request, "chat.html", context=context)
@@ -0,0 +1,34 @@
+"""
+Stands in for another worker process, to check that chat messages reach sockets in this one.
+
+A spawned process imports this module before Django is set up, so it mustn't
+import any models at the top.
+"""
+import asyncio
+import time
+
+import django
+from channels.layers import get_channel_layer
+
+
+def send_chat_messages(group: str, count: int, interval: float = 0.01) -> None:
+    """
+    Send messages to a room's group through the configured channel layer, like a consumer does.
+
+    Each message is the time it was sent, so the receiver can work out how long it took to arrive.
+
+    :param group: the room's group name
+    :param count: the number of messages to send
+    :param interval: how long to wait between messages in seconds
+    """
+
+    django.setup()
+
+    async def send() -> None:
+        layer = get_channel_layer()
+        for _ in range(count):
+            await layer.group_send(group, {"type": "chat.message", "full_name": "Derek Smith", "user_id": "1",
+                                           "message": repr(time.time())})
+            await asyncio.sleep(interval)
+
+    asyncio.run(send())
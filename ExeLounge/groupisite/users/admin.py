@@ -39,3 +39,6 @@ class UserProfileAdmin(admin.ModelAdmin):
                     "leaderboard_privacy", "forum_score")
     list_filter = ("course_title", "leaderboard_privacy")
     list_editable = ["leaderboard_privacy"]
+
+    # Saving a profile doesn't change its score, which recompute_forum_scores can fix if it's wrong
+    readonly_fields = ["forum_score"]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UsersConfig(AppConfig):
     name = "users"
+
+    def ready(self) -> None:
+        # Connect the receivers that keep the leaderboard store, thumbnails and study choices up to date
+        from . import choices, leaderboard_store, thumbnails  # noqa: F401
@@ -0,0 +1,52 @@
+"""
+The courses and modules students pick from when they register or change their settings.
+
+They're read from the database the first time they're needed, rather than when
+users.forms is imported, and cached until a course or module is saved or deleted.
+"""
+from django.db.models.signals import post_delete, post_save
+from groupisite.caching import VersionedCache
+
+from .models import Course, Module
+
+
+def build_study_choices() -> dict:
+    """
+    Read the courses and modules.
+
+    :return: the choices for each field, e.g. {"courses": [...], "modules": [...]}, and each module's credits
+    """
+
+    modules = Module.objects.order_by("module_code").values_list("module_code", "module_title", "module_credit_value")
+    return {
+        "courses": [(title, title) for title in
+                    Course.objects.order_by("course_title").values_list("course_title", flat=True)],
+        "modules": [(code, code + " " + title) for code, title, _ in modules],
+        "module_credits": {code: credit_value for code, _, credit_value in modules},
+    }
+
+
+study_choices = VersionedCache("users:study_choices", build_study_choices)
+
+for model in [Course, Module]:
+    post_save.connect(study_choices.invalidate, sender=model, dispatch_uid="study_choices_saved_%s" % model.__name__)
+    post_delete.connect(study_choices.invalidate, sender=model,
+                        dispatch_uid="study_choices_deleted_%s" % model.__name__)
+
+
+def get_course_choices() -> list:
+    """Get the possible courses."""
+
+    return study_choices.get()["courses"]
+
+
+def get_module_choices() -> list:
+    """Get the possible modules."""
+
+    return study_choices.get()["modules"]
+
+
+def get_module_credits() -> dict:
+    """Get the credit value of each module by its code."""
+
+    return study_choices.get()["module_credits"]
@@ -7,7 +7,8 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from material import Layout, Row
 
-from .models import Module, Course, UserProfile
+from .choices import get_course_choices, get_module_choices, get_module_credits
+from .models import UserProfile
 
 
 def validate_exeter_email(email: str) -> None:
@@ -102,10 +103,12 @@ class StudentRegistrationForm(UserCreationForm):
 def validate_credits(modules: list) -> None:
     """Validate that they are taking 120 credits."""
 
+    credit_values = get_module_credits()
     module_credits = 0
 
     for module in modules:
-        module_credits += Module.objects.get(module_code=module).module_credit_value
+        # It's 0 if the module was deleted since the form was made
+        module_credits += credit_values.get(module, 0)
 
     if module_credits != 120:
         raise ValidationError("You must take 120 credits of modules (not %(credits)d).",
@@ -117,37 +120,23 @@ class StudentStudyForm(forms.Form):
     Form for selecting course & modules.
     """
 
-    @staticmethod
-    def module_choices() -> list:
-        """Get the possible modules."""
-
-        module_options = Module.objects.all().values_list("module_title", "module_code").order_by("module_code")
-        module_choices = []
-        for module in module_options:
-            module_choices.append((module[1], module[1] + " " + module[0]))
-        return module_choices
-
-    @staticmethod
-    def course_choices() -> list:
-        """Get the possible courses."""
-
-        course_options = Course.objects.all().values_list("course_title").order_by("course_title")
-        course_choices = []
-        for course in course_options:
-            course_choices.append((course[0], course[0]))
-        return course_choices
-
     # Course selector
-    course = forms.ChoiceField(choices=course_choices.__get__(forms.Form),
-                               error_messages={"required": "You must pick a course.",
+    course = forms.ChoiceField(error_messages={"required": "You must pick a course.",
                                                "invalid_choice": "%(value)s is not a valid course."})
 
     # Module selector
-    modules = forms.MultipleChoiceField(choices=module_choices.__get__(forms.Form), validators=[validate_credits],
+    modules = forms.MultipleChoiceField(validators=[validate_credits],
                                         error_messages={"required": "You must pick some modules.",
                                                         "invalid_choice": "%(value)s is not a valid module."},
                                         help_text="Your module credits must add up to 120")
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Read the choices from the cache once for each form, rather than each time they're looked through
+        self.fields["course"].choices = get_course_choices()
+        self.fields["modules"].choices = get_module_choices()
+
 
 class LoginForm(forms.Form):
     """
@@ -0,0 +1,106 @@
+from typing import Optional
+
+from django.contrib.auth.models import User
+from django.db.models import F, QuerySet, Window
+from django.db.models.functions import Rank
+
+from .models import UserProfile
+
+# The account whose profile picture is shown for anyone not displaying their full name
+PLACEHOLDER_USERNAME = "deleteduser@exeter.ac.uk"
+
+# The number of places shown on the leaderboard
+LEADERBOARD_LENGTH = 15
+
+
+def get_initials(full_name: str) -> str:
+    """Get the initials of a name, e.g. "Derek Smith" becomes "D. S. "."""
+
+    try:
+        return "".join([x[0].upper() + ". " for x in full_name.split(" ")])
+    except IndexError:
+        return ""
+
+
+def get_placeholder_photo() -> str:
+    """Get the URL of the profile picture used in place of a hidden one."""
+
+    return UserProfile.objects.only("profile_pic").get(user__username=PLACEHOLDER_USERNAME).profile_pic.url
+
+
+def make_entry(place: int, score: int, privacy: str, first_name: str, full_name: str,
+               photo: str, is_current_user: bool, placeholder_photo: Optional[str]) -> dict:
+    """Make a leaderboard row, only showing what the user's privacy setting allows."""
+
+    # If they want their full name or this is the current user
+    if privacy == "FULL_NAME" or is_current_user:
+        name = full_name
+
+    # If they only want their first name
+    elif privacy == "FIRST_NAME":
+        name = first_name
+        photo = placeholder_photo
+
+    # They must want their initials only
+    else:
+        name = get_initials(full_name)
+        photo = placeholder_photo
+
+    return {"place": place,
+            "photo": photo,
+            "name": name,
+            "score": score}
+
+
+def get_visible_profiles(length: int = LEADERBOARD_LENGTH) -> QuerySet:
+    """
+    Get the top of the leaderboard, leaving out everyone who's hidden.
+
+    The filter matches the condition of users_profile_leaderboard_idx, so the
+    profiles are read from the index in order and only the first few are read.
+    """
+
+    return UserProfile.objects.exclude(leaderboard_privacy="HIDE") \
+        .select_related("user") \
+        .annotate(place=Window(expression=Rank(), order_by=F("forum_score").desc())) \
+        .order_by("-forum_score", "user_id")[:length]
+
+
+def get_forum_leaderboard(user: User, length: int = LEADERBOARD_LENGTH) -> list:
+    """
+    Generate the forum leaderboard as seen by the given user.
+
+    The places are ranked in the database, so users with the same score share
+    a place and the next place is skipped (1, 1, 3, ...). Within a place, users
+    are listed in order of their ids.
+    """
+
+    profiles = list(get_visible_profiles(length))
+
+    # The current user is always on the leaderboard, even if they're hidden. They're looked up on their own,
+    # since adding them to the query above would stop it using the index.
+    if all(profile.user_id != user.pk for profile in profiles):
+        hidden = UserProfile.objects.filter(user_id=user.pk, leaderboard_privacy="HIDE").first()
+        if hidden is not None:
+            hidden.user = user
+            hidden.place = 1 + len([profile for profile in profiles if profile.forum_score > hidden.forum_score])
+            for profile in profiles:
+                if profile.forum_score < hidden.forum_score:
+                    profile.place += 1
+            profiles = sorted(profiles + [hidden], key=lambda profile: (-profile.forum_score, profile.user_id))
+            profiles = profiles[:length]
+
+    forum_leaderboard = []
+    placeholder_photo = None
+    for profile in profiles:
+        is_current_user = profile.user_id == user.pk
+
+        # Only look up the placeholder if someone needs it
+        if placeholder_photo is None and profile.leaderboard_privacy != "FULL_NAME" and not is_current_user:
+            placeholder_photo = get_placeholder_photo()
+
+        forum_leaderboard.append(make_entry(profile.place, profile.forum_score, profile.leaderboard_privacy,
+                                            profile.user.first_name, profile.user.get_full_name(),
+                                            profile.profile_pic.url, is_current_user, placeholder_photo))
+
+    return forum_leaderboard
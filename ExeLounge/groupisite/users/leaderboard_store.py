@@ -0,0 +1,448 @@
+"""
+A sorted-set store of forum scores that the homepage leaderboard is read from.
+
+Entries are updated whenever a user or their profile is saved or a forum score changes,
+so reading the top of the leaderboard never has to sort the UserProfile table. A
+shared store, like Redis, is filled by the rebuild_leaderboard command, which the
+Procfile runs on every release, and the leaderboard is read from the database until
+then. The in-process InMemoryBackend, which is only meant for tests, is filled by each
+process the first time it's read. The backend is set by the LEADERBOARD_STORE setting
+and can be the InMemoryBackend or any client with the redis-py interface, e.g.:
+
+    LEADERBOARD_STORE = {"BACKEND": "users.leaderboard_store.redis_backend",
+                         "OPTIONS": {"url": "redis://localhost:6379/0"}}
+"""
+import bisect
+import json
+import threading
+from typing import Any, Iterable, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .leaderboard import LEADERBOARD_LENGTH, PLACEHOLDER_USERNAME, get_forum_leaderboard, make_entry
+from .models import UserProfile, forum_score_changed
+
+# How many profiles to write to the backend at a time when rebuilding
+REBUILD_CHUNK_SIZE = 2000
+
+
+class SortedSet:
+    """A set of members ordered by score, then by member when the scores are equal, like a Redis sorted set."""
+
+    def __init__(self):
+        self.scores = {}
+        self.order = []
+
+    def add(self, member: str, score: float) -> None:
+        """Add a member, or move it if it's already in the set."""
+
+        self.remove(member)
+        self.scores[member] = score
+        bisect.insort(self.order, (score, member))
+
+    def remove(self, member: str) -> bool:
+        """Remove a member, returning whether it was in the set."""
+
+        if member not in self.scores:
+            return False
+        del self.order[bisect.bisect_left(self.order, (self.scores.pop(member), member))]
+        return True
+
+
+class InMemoryBackend:
+    """
+    Keeps the leaderboard in this process, for tests and single process servers.
+
+    Implements the parts of the redis-py client that the store uses, so that it
+    can be swapped for a Redis client without any other changes.
+    """
+
+    # Only this process can see what's stored, so another can't fill it
+    shared = False
+
+    def __init__(self, **kwargs):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def _get(self, name: str, kind: type, create: bool = False) -> Any:
+        """Get the value at a key, creating it if needed."""
+
+        if name not in self.data:
+            if not create:
+                return kind()
+            self.data[name] = kind()
+        return self.data[name]
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+    def delete(self, *names: str) -> int:
+        with self.lock:
+            return len([self.data.pop(name) for name in names if name in self.data])
+
+    def exists(self, *names: str) -> int:
+        with self.lock:
+            return len([name for name in names if name in self.data])
+
+    def rename(self, src: str, dst: str) -> bool:
+        with self.lock:
+            self.data[dst] = self.data.pop(src)
+            return True
+
+    def zadd(self, name: str, mapping: dict, nx: bool = False, xx: bool = False) -> int:
+        with self.lock:
+            sorted_set = self._get(name, SortedSet, True)
+            added = len([member for member in mapping if str(member) not in sorted_set.scores])
+            for member, score in mapping.items():
+                exists = str(member) in sorted_set.scores
+                if not (nx and exists or xx and not exists):
+                    sorted_set.add(str(member), float(score))
+            return 0 if xx else added
+
+    def zrem(self, name: str, *values: Any) -> int:
+        with self.lock:
+            sorted_set = self._get(name, SortedSet)
+            return len([value for value in values if sorted_set.remove(str(value))])
+
+    def zincrby(self, name: str, amount: float, value: Any) -> float:
+        with self.lock:
+            sorted_set = self._get(name, SortedSet, True)
+            score = sorted_set.scores.get(str(value), 0.0) + amount
+            sorted_set.add(str(value), score)
+            return score
+
+    def zscore(self, name: str, value: Any) -> Optional[float]:
+        with self.lock:
+            return self._get(name, SortedSet).scores.get(str(value))
+
+    def zrange(self, name: str, start: int, end: int, withscores: bool = False) -> list:
+        with self.lock:
+            order = self._get(name, SortedSet).order
+            rows = order[start:] if end == -1 else order[start:end + 1]
+            if withscores:
+                return [(member, score) for score, member in rows]
+            return [member for score, member in rows]
+
+    def hset(self, name: str, key: Any = None, value: Any = None, mapping: dict = None) -> int:
+        with self.lock:
+            mapping = dict(mapping or {})
+            if key is not None:
+                mapping[key] = value
+            hash_ = self._get(name, dict, True)
+            added = len([field for field in mapping if str(field) not in hash_])
+            hash_.update({str(field): str(value) for field, value in mapping.items()})
+            return added
+
+    def hget(self, name: str, key: Any) -> Optional[str]:
+        with self.lock:
+            return self._get(name, dict).get(str(key))
+
+    def hmget(self, name: str, keys: Iterable) -> list:
+        with self.lock:
+            hash_ = self._get(name, dict)
+            return [hash_.get(str(key)) for key in keys]
+
+    def hdel(self, name: str, *keys: Any) -> int:
+        with self.lock:
+            hash_ = self._get(name, dict)
+            return len([hash_.pop(str(key)) for key in keys if str(key) in hash_])
+
+
+class InMemoryPipeline:
+    """Queues up commands and runs them together, like a redis-py pipeline."""
+
+    def __init__(self, backend: InMemoryBackend):
+        self.backend = backend
+        self.commands = []
+
+    def __enter__(self) -> "InMemoryPipeline":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.commands = []
+
+    def __getattr__(self, name: str) -> Any:
+        command = getattr(self.backend, name)
+
+        def queue(*args, **kwargs) -> "InMemoryPipeline":
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> list:
+        with self.backend.lock:
+            results = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+def redis_backend(url: str, **kwargs) -> Any:
+    """Connect to Redis, or any server that speaks its protocol."""
+
+    import redis
+
+    return redis.Redis.from_url(url, decode_responses=True, **kwargs)
+
+
+class LeaderboardStore:
+    """
+    Stores everyone's forum score and the details needed to show them on the leaderboard.
+
+    Uses two sorted sets, one of every user and one of just those visible on
+    the leaderboard, plus a hash of each user's name, photo and privacy.
+
+    The sorted sets hold each score negated and are read in ascending order, so
+    that users with the same score come out in order of their member. Each
+    member is the user's id padded with zeros, so that's the order of the ids,
+    the same as the database's leaderboard.
+    """
+
+    def __init__(self, backend: Any, prefix: str = "leaderboard"):
+        self.backend = backend
+        self.prefix = prefix
+        self.build_lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """Whether other processes use the same backend, so one of them can fill it for all of them."""
+
+        return getattr(self.backend, "shared", True)
+
+    def key(self, name: str, rebuilding: bool = False) -> str:
+        """Get the backend key for one of the store's structures."""
+
+        if rebuilding:
+            return "%s:rebuild:%s" % (self.prefix, name)
+        return "%s:%s" % (self.prefix, name)
+
+    @staticmethod
+    def member(user_id: int) -> str:
+        """Get a user's member in the sorted sets."""
+
+        return "%010d" % user_id
+
+    @staticmethod
+    def get_details(profile: UserProfile) -> str:
+        """Get what the leaderboard shows about a profile."""
+
+        return json.dumps({"first_name": profile.user.first_name,
+                           "full_name": profile.user.get_full_name(),
+                           "privacy": profile.leaderboard_privacy,
+                           "photo": profile.profile_pic.url})
+
+    def write_profile(self, pipe: Any, profile: UserProfile, rebuilding: bool = False,
+                      stored_score: Optional[float] = None) -> None:
+        """
+        Queue the commands to store a profile.
+
+        :param stored_score: the score already in the store, to keep instead of the profile's when it might be older
+        """
+
+        member = self.member(profile.user_id)
+        if stored_score is None:
+            pipe.zadd(self.key("scores", rebuilding), {member: -profile.forum_score})
+        if profile.leaderboard_privacy == "HIDE":
+            pipe.zrem(self.key("visible", rebuilding), member)
+        elif stored_score is None:
+            pipe.zadd(self.key("visible", rebuilding), {member: -profile.forum_score})
+        else:
+            # add_to_score keeps the score of anyone already visible up to date
+            pipe.zadd(self.key("visible", rebuilding), {member: stored_score}, nx=True)
+        pipe.hset(self.key("details", rebuilding), mapping={profile.user_id: self.get_details(profile)})
+        if profile.user.username == PLACEHOLDER_USERNAME:
+            pipe.hset(self.key("meta", rebuilding), mapping={"placeholder_photo": profile.profile_pic.url})
+
+    def sync_profile(self, profile: UserProfile, score_saved: bool = True) -> None:
+        """
+        Store the current state of a profile.
+
+        :param score_saved: whether the profile's forum score was saved or read just now, rather than possibly
+                            being the one it was loaded with, which the store may have had changes to since
+        """
+
+        stored_score = None if score_saved else self.backend.zscore(self.key("scores"), self.member(profile.user_id))
+        with self.backend.pipeline() as pipe:
+            self.write_profile(pipe, profile, stored_score=stored_score)
+            pipe.execute()
+
+    def add_to_score(self, user_id: int, value: int) -> None:
+        """Add to a user's stored score, not letting it drop below 0."""
+
+        member = self.member(user_id)
+        score = self.backend.zincrby(self.key("scores"), -value, member)
+        with self.backend.pipeline() as pipe:
+            if score > 0:
+                score = 0
+                pipe.zadd(self.key("scores"), {member: score})
+
+            # Only update the visible set if they're already in it
+            pipe.zadd(self.key("visible"), {member: score}, xx=True)
+            pipe.execute()
+
+    def remove(self, user_id: int) -> None:
+        """Remove a user from the store."""
+
+        with self.backend.pipeline() as pipe:
+            pipe.zrem(self.key("scores"), self.member(user_id))
+            pipe.zrem(self.key("visible"), self.member(user_id))
+            pipe.hdel(self.key("details"), user_id)
+            pipe.execute()
+
+    def is_built(self) -> bool:
+        """Whether the store has been filled from the database."""
+
+        return self.backend.hget(self.key("meta"), "built") is not None
+
+    def rebuild(self) -> int:
+        """
+        Fill the store from the database, returning the number of profiles stored.
+
+        The new entries are written to separate keys and then swapped in, so the
+        leaderboard can still be read while this is running.
+        """
+
+        names = ["scores", "visible", "details", "meta"]
+        self.backend.delete(*[self.key(name, True) for name in names])
+
+        profiles = UserProfile.objects.select_related("user").order_by("pk")
+        count = 0
+        pipe = self.backend.pipeline(transaction=False)
+        for profile in profiles.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            self.write_profile(pipe, profile, True)
+            count += 1
+            if count % REBUILD_CHUNK_SIZE == 0:
+                pipe.execute()
+        pipe.hset(self.key("meta", True), mapping={"built": count})
+        pipe.execute()
+
+        # Swap the new entries in, removing anything that no longer exists
+        written = [name for name in names if self.backend.exists(self.key(name, True))]
+        with self.backend.pipeline() as pipe:
+            removed = [self.key(name) for name in names if name not in written]
+            if removed:
+                pipe.delete(*removed)
+            for name in written:
+                pipe.rename(self.key(name, True), self.key(name))
+            pipe.execute()
+
+        return count
+
+    def get_leaderboard(self, user: User, length: int = LEADERBOARD_LENGTH) -> list:
+        """
+        Get the forum leaderboard as seen by the given user.
+
+        Gives the same result as users.leaderboard.get_forum_leaderboard, but
+        without querying the database once the store has been built.
+        """
+
+        with self.backend.pipeline(transaction=False) as pipe:
+            pipe.hmget(self.key("meta"), ["built", "placeholder_photo"])
+            pipe.zrange(self.key("visible"), 0, length - 1, withscores=True)
+            pipe.zscore(self.key("visible"), self.member(user.pk))
+            pipe.zscore(self.key("scores"), self.member(user.pk))
+            (built, placeholder_photo), top, visible_score, score = pipe.execute()
+
+        # Rebuilding reads every profile, so leave a shared store to rebuild_leaderboard rather than this request.
+        # Nothing else can fill this process's own store though, so that's done once, by the first request.
+        if built is None:
+            if self.shared:
+                return get_forum_leaderboard(user, length)
+            with self.build_lock:
+                if not self.is_built():
+                    self.rebuild()
+            return self.get_leaderboard(user, length)
+
+        # The current user is always on the leaderboard, even if they're hidden
+        rows = [(int(member), -int(user_score)) for member, user_score in top]
+        if visible_score is None and score is not None:
+            rows.append((user.pk, -int(score)))
+            rows = sorted(rows, key=lambda row: (-row[1], row[0]))[:length]
+
+        details = self.backend.hmget(self.key("details"), [user_id for user_id, user_score in rows]) if rows else []
+
+        forum_leaderboard = []
+        place = 0
+        for i, ((user_id, user_score), user_details) in enumerate(zip(rows, details)):
+
+            # Don't increment their place if they have the same score as the last user
+            if i == 0 or user_score != rows[i - 1][1]:
+                place = i + 1
+
+            # They may have been removed since the scores were read
+            if user_details is None:
+                continue
+            user_details = json.loads(user_details)
+
+            forum_leaderboard.append(make_entry(place, user_score, user_details["privacy"],
+                                                user_details["first_name"], user_details["full_name"],
+                                                user_details["photo"], user_id == user.pk, placeholder_photo))
+
+        return forum_leaderboard
+
+
+_store = None
+
+
+def get_leaderboard_store() -> LeaderboardStore:
+    """Get the store set up by the LEADERBOARD_STORE setting."""
+
+    global _store
+    if _store is None:
+        config = getattr(settings, "LEADERBOARD_STORE",
+                         {"BACKEND": "users.leaderboard_store.InMemoryBackend"})
+        backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+        _store = LeaderboardStore(backend, config.get("PREFIX", "leaderboard"))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_leaderboard_store(setting: str, **kwargs) -> None:
+    """Use a new store when the setting is changed (e.g. in tests)."""
+
+    global _store
+    if setting == "LEADERBOARD_STORE":
+        _store = None
+
+
+@receiver(post_save, sender=UserProfile)
+def sync_leaderboard_entry(sender, instance: UserProfile, created: bool, update_fields: Optional[frozenset] = None,
+                           **kwargs) -> None:
+    """Update the store whenever a profile is saved."""
+
+    # Saving an existing profile leaves its score out (see UserProfile.save), so keep the one in the store
+    get_leaderboard_store().sync_profile(instance, created or update_fields is None or "forum_score" in update_fields)
+
+
+@receiver(post_save, sender=User)
+def sync_leaderboard_name(sender, instance: User, created: bool, update_fields: Optional[frozenset] = None,
+                          **kwargs) -> None:
+    """Update the store whenever a user is saved, since the leaderboard shows their name."""
+
+    # A new user's profile is stored when it's created, and logging in only saves last_login
+    if created or (update_fields is not None and not {"first_name", "last_name"} & update_fields):
+        return
+
+    profile = UserProfile.objects.filter(user=instance).first()
+    if profile is not None:
+        profile.user = instance
+        get_leaderboard_store().sync_profile(profile)
+
+
+@receiver(forum_score_changed)
+def update_leaderboard_score(sender, user_id: int, value: int, **kwargs) -> None:
+    """Update the store whenever a forum score is changed in the database."""
+
+    get_leaderboard_store().add_to_score(user_id, value)
+
+
+@receiver(post_delete, sender=UserProfile)
+def remove_leaderboard_entry(sender, instance: UserProfile, **kwargs) -> None:
+    """Remove deleted profiles from the store."""
+
+    get_leaderboard_store().remove(instance.user_id)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from users.models import UserProfile
+from users.thumbnails import make_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Make the thumbnails of every profile picture that doesn't have them yet."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--replace", action="store_true",
+                            help="Make the thumbnails again even if they already exist.")
+
+    def handle(self, *args, **options) -> None:
+        storage = UserProfile._meta.get_field("profile_pic").storage
+        names = UserProfile.objects.order_by().values_list("profile_pic", flat=True).distinct()
+
+        count = 0
+        for name in names.iterator():
+            if name:
+                count += make_thumbnails(name, storage, options["replace"])
+
+        self.stdout.write(self.style.SUCCESS("Made %d thumbnails." % count))
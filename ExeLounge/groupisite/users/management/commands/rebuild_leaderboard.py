@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from users.leaderboard_store import get_leaderboard_store
+
+
+class Command(BaseCommand):
+    help = "Rebuild the leaderboard store from the user profiles in the database."
+
+    def handle(self, *args, **options) -> None:
+        store = get_leaderboard_store()
+
+        # Each process fills its own store when it isn't shared, so there's nothing to do here
+        if not store.shared:
+            self.stdout.write("The leaderboard store isn't shared between processes, so it wasn't rebuilt.")
+            return
+
+        count = store.rebuild()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the leaderboard from %d profiles." % count))
@@ -1,13 +1,21 @@
 import datetime
 import uuid
+from functools import partial
 from typing import Optional, Any
 
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
+
+
+# Sent with user_id and value whenever a forum score is changed by UserProfile.add_to_forum_score,
+# once the change has been committed
+forum_score_changed = Signal()
 
 
 class CustomLogin(ModelBackend):
@@ -177,19 +185,65 @@ class UserProfile(models.Model):
 
     forum_score = models.IntegerField(default=0, validators=[MinValueValidator(0)])
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # Writing back the score loaded with an existing profile would lose any change made to it since.
+        # It's only ever changed in the database, by add_to_forum_score(s).
+        if not self._state.adding and not force_insert and update_fields is None:
+            deferred = self.get_deferred_fields()
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name != "forum_score"
+                             and field.attname not in deferred]
+        super().save(force_insert, force_update, using, update_fields)
+
     def update_forum_score(self, value: int) -> None:
         """Update the forum score, not letting it drop below 0."""
 
-        if self.forum_score + value < 0:
-            self.forum_score = 0
-        else:
-            self.forum_score += value
-        self.save()
+        UserProfile.add_to_forum_score(self.user_id, value)
+        self.refresh_from_db(fields=["forum_score"])
+
+    @staticmethod
+    def add_to_forum_score(user_id: int, value: int) -> None:
+        """
+        Add to a user's forum score, not letting it drop below 0.
+
+        This is a single UPDATE in the database, so no profile is loaded and
+        concurrent changes to the same score can't overwrite each other.
+        """
+
+        UserProfile.objects.filter(user_id=user_id).update(forum_score=Greatest(F("forum_score") + value, 0))
+
+        # Wait until it's committed, so a rolled back change doesn't reach the leaderboard store
+        transaction.on_commit(partial(forum_score_changed.send, sender=UserProfile, user_id=user_id, value=value))
+
+    @staticmethod
+    def add_to_forum_scores(values: dict) -> None:
+        """
+        Add to many users' forum scores, not letting them drop below 0.
+
+        :param values: the value to add for each user id
+        """
+
+        # Update everyone getting the same value in one UPDATE
+        user_ids = {}
+        for user_id, value in values.items():
+            if value != 0:
+                user_ids.setdefault(value, []).append(user_id)
+        for value, ids in user_ids.items():
+            UserProfile.objects.filter(user_id__in=ids).update(forum_score=Greatest(F("forum_score") + value, 0))
+            for user_id in ids:
+                transaction.on_commit(partial(forum_score_changed.send, sender=UserProfile, user_id=user_id,
+                                              value=value))
 
     class Meta:
         verbose_name = "user profile"
         verbose_name_plural = "user profiles"
 
+        # For ranking the profiles shown on the leaderboard
+        indexes = [
+            models.Index(fields=["-forum_score"], name="users_profile_leaderboard_idx",
+                         condition=~models.Q(leaderboard_privacy="HIDE"))
+        ]
+
     def __str__(self):
         """
         String function to return a user's username.
@@ -206,8 +260,8 @@ def create_user_profile(sender, instance: User,
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance: User, **kwargs) -> None:
-    try:
-        UserProfile.objects.get(user=instance).save()
-    except UserProfile.DoesNotExist:
-        UserProfile.objects.create(user=instance)
+def save_user_profile(sender, instance: User, created: bool, **kwargs) -> None:
+    # Make sure older users have a profile. Saving one that exists would write back the
+    # forum score it was loaded with, losing any change made to it since.
+    if not created:
+        UserProfile.objects.get_or_create(user=instance)
@@ -0,0 +1,46 @@
+from urllib.parse import unquote
+
+from django import template
+from django.conf import settings
+
+from users.thumbnails import THUMBNAIL_SIZES, get_thumbnail_name, has_thumbnails
+
+register = template.Library()
+
+
+def is_thumbnailed(url: str) -> bool:
+    """
+    Whether a profile picture's thumbnails have been made.
+
+    Pictures that were uploaded before thumbnails were made, or aren't in the media folder, might not have any.
+    """
+
+    return bool(url) and url.startswith(settings.MEDIA_URL) and has_thumbnails(unquote(url[len(settings.MEDIA_URL):]))
+
+
+@register.filter
+def thumbnail(url: str, size: int) -> str:
+    """
+    Get the URL of a JPEG thumbnail of a profile picture, or of the picture itself if it doesn't have one.
+
+    Usage: {{ photo_url|thumbnail:40 }}
+    """
+
+    if not is_thumbnailed(url):
+        return url or ""
+    return get_thumbnail_name(url, int(size), "jpg")
+
+
+@register.filter
+def thumbnail_srcset(url: str, extension: str = "jpg") -> str:
+    """
+    Get a srcset of every size of thumbnail of a profile picture.
+
+    It's empty if the picture doesn't have any, so browsers skip the <source> and use the <img> src.
+
+    Usage: <source type="image/webp" srcset="{{ photo_url|thumbnail_srcset:"webp" }}" sizes="40px">
+    """
+
+    if not is_thumbnailed(url):
+        return ""
+    return ", ".join("%s %dw" % (get_thumbnail_name(url, size, extension), size) for size in THUMBNAIL_SIZES)
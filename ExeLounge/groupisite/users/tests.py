@@ -1,8 +1,37 @@
 import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipUnless
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.templatetags.static import static
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from groupisite.context_processors import profile_pic
+from forum.models import ForumPost, ForumSection, ForumThread
+from groupisite.middleware import ProfileMiddleware, TimingMiddleware
+from groupisite.query_budgets import QUERY_BUDGETS, QueryBudgetMixin
+from groupisite.timing import TimedDjangoTemplates
+from groupisite.views import get_profile_pic
+from PIL import Image
 
-from .forms import StudentRegistrationForm, LoginForm
+from .forms import StudentRegistrationForm, LoginForm, StudentStudyForm
+from .leaderboard import PLACEHOLDER_USERNAME, get_forum_leaderboard, get_visible_profiles
+from .leaderboard_store import get_leaderboard_store
+from .models import College, Course, Department, Module, UserProfile
+from .templatetags.thumbnails import thumbnail, thumbnail_srcset
+from .thumbnails import make_thumbnails
 
 
 class StudentRegistrationTests(TestCase):
@@ -30,3 +59,565 @@ class LoginTests(TestCase):
         form = LoginForm(data={"email": "derek@gmail.com", "password": "samplepassword"})
         self.assertEqual(form.errors["email"],
                          ["Email address must contain the University of Exeter domain name."])
+
+
+class LeaderboardTestMixin:
+
+    def setUp(self) -> None:
+        """Create the placeholder user and some students with scores."""
+
+        User.objects.create_user(username=PLACEHOLDER_USERNAME, first_name="Deleted", last_name="User")
+        self.derek = self.create_student("derek@exeter.ac.uk", "Derek", "Smith", "HIDE", 10)
+        self.edith = self.create_student("edith@exeter.ac.uk", "Edith", "Jones", "FULL_NAME", 20)
+        self.ethel = self.create_student("ethel@exeter.ac.uk", "Ethel", "Brown", "FIRST_NAME", 20)
+        self.frank = self.create_student("frank@exeter.ac.uk", "Frank", "Green", "INITIALS", 5)
+
+    @staticmethod
+    def create_student(username: str, first_name: str, last_name: str,
+                       privacy: str, score: int) -> User:
+        """Create a user with the given leaderboard privacy and score."""
+
+        user = User.objects.create_user(username=username, first_name=first_name, last_name=last_name)
+        UserProfile.objects.filter(user=user).update(leaderboard_privacy=privacy, forum_score=score)
+        return user
+
+
+class LeaderboardTests(LeaderboardTestMixin, TestCase):
+
+    def test_places_and_privacy(self) -> None:
+        """Tests that ties share a place and names follow each user's privacy."""
+
+        leaderboard = get_forum_leaderboard(self.derek)
+        self.assertEqual([(row["place"], row["name"], row["score"]) for row in leaderboard],
+                         [(1, "Edith Jones", 20), (1, "Ethel", 20), (3, "Derek Smith", 10), (4, "F. G. ", 5)])
+
+    def test_hidden_users(self) -> None:
+        """Tests that hidden users are only visible to themselves."""
+
+        leaderboard = get_forum_leaderboard(self.frank)
+        self.assertNotIn("Derek Smith", [row["name"] for row in leaderboard])
+        self.assertEqual(leaderboard[2], {"place": 3,
+                                          "photo": UserProfile.objects.get(user=self.frank).profile_pic.url,
+                                          "name": "Frank Green",
+                                          "score": 5})
+
+    @skipUnless(connection.vendor == "postgresql", "Only PostgreSQL's query plans are checked.")
+    def test_uses_index(self) -> None:
+        """Tests that the leaderboard's query ranks the visible profiles using the partial index."""
+
+        # The table is too small for an index to be worth it, unless sequential scans are ruled out
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = get_visible_profiles().explain()
+
+        # Reading the index in order, rather than a bitmap scan of every visible profile that then has to be sorted
+        self.assertIn("Index Scan using users_profile_leaderboard_idx", plan)
+
+    def test_query_count(self) -> None:
+        """Tests that the leaderboard doesn't query once per row."""
+
+        with self.assertNumQueries(2):
+            get_forum_leaderboard(self.frank)
+
+        # Hidden users are looked up on their own
+        with self.assertNumQueries(3):
+            get_forum_leaderboard(self.derek)
+
+    def test_hidden_user_places(self) -> None:
+        """Tests that a hidden user is ranked among the visible ones they're shown with."""
+
+        UserProfile.objects.filter(user=self.derek).update(forum_score=20)
+        leaderboard = get_forum_leaderboard(self.derek)
+        self.assertEqual([(row["place"], row["name"], row["score"]) for row in leaderboard],
+                         [(1, "Derek Smith", 20), (1, "Edith Jones", 20), (1, "Ethel", 20), (4, "F. G. ", 5)])
+
+        UserProfile.objects.filter(user=self.derek).update(forum_score=30)
+        self.assertEqual([row["place"] for row in get_forum_leaderboard(self.derek)], [1, 2, 2, 4])
+        self.assertEqual([row["name"] for row in get_forum_leaderboard(self.derek, 2)], ["Derek Smith", "Edith Jones"])
+        self.assertEqual([row["name"] for row in get_forum_leaderboard(self.frank, 2)], ["Edith Jones", "Ethel"])
+
+        UserProfile.objects.filter(user=self.derek).update(forum_score=1)
+        self.assertEqual([row["name"] for row in get_forum_leaderboard(self.derek, 3)],
+                         ["Edith Jones", "Ethel", "F. G. "])
+
+
+# The store is only told about score changes once they're committed, which never happens inside a TestCase
+@override_settings(LEADERBOARD_STORE={"BACKEND": "users.leaderboard_store.InMemoryBackend"})
+class LeaderboardStoreTests(LeaderboardTestMixin, TransactionTestCase):
+
+    def setUp(self) -> None:
+        """Start from an empty store."""
+
+        store = get_leaderboard_store()
+        store.backend.delete(*[store.key(name) for name in ["scores", "visible", "details", "meta"]])
+        super().setUp()
+
+    def test_matches_database(self) -> None:
+        """Tests that the rebuilt store gives the same leaderboard as the database."""
+
+        get_leaderboard_store().rebuild()
+        for user in [self.derek, self.edith, self.frank]:
+            self.assertEqual(get_leaderboard_store().get_leaderboard(user), get_forum_leaderboard(user))
+
+    def test_updated_on_save(self) -> None:
+        """Tests that score and privacy changes reach the store without a rebuild."""
+
+        store = get_leaderboard_store()
+        store.rebuild()
+
+        UserProfile.objects.get(user=self.frank).update_forum_score(30)
+        profile = UserProfile.objects.get(user=self.derek)
+        profile.leaderboard_privacy = "FULL_NAME"
+        profile.save()
+
+        with self.assertNumQueries(0):
+            leaderboard = store.get_leaderboard(self.edith)
+        self.assertEqual([(row["place"], row["name"], row["score"]) for row in leaderboard],
+                         [(1, "F. G. ", 35), (2, "Edith Jones", 20), (2, "Ethel", 20), (4, "Derek Smith", 10)])
+
+    def test_rolled_back(self) -> None:
+        """Tests that a score change that's rolled back doesn't reach the store."""
+
+        store = get_leaderboard_store()
+        store.rebuild()
+
+        with self.assertRaises(ValueError), transaction.atomic():
+            UserProfile.add_to_forum_score(self.frank.pk, 30)
+            UserProfile.add_to_forum_scores({self.edith.pk: 5, self.ethel.pk: 5})
+            raise ValueError("Something went wrong after the scores were changed")
+
+        self.assertEqual(store.get_leaderboard(self.frank), get_forum_leaderboard(self.frank))
+
+    def test_saved_after_score_changed(self) -> None:
+        """Tests that saving a profile loaded before its score changed, as the settings page does, keeps the change."""
+
+        store = get_leaderboard_store()
+        store.rebuild()
+
+        derek = UserProfile.objects.get(user=self.derek)
+        frank = UserProfile.objects.get(user=self.frank)
+        UserProfile.add_to_forum_scores({self.derek.pk: 30, self.frank.pk: 30})
+        derek.leaderboard_privacy = "FULL_NAME"
+        derek.save()
+        frank.bio = "Hello"
+        frank.save()
+
+        self.assertEqual(UserProfile.objects.get(user=self.derek).forum_score, 40)
+        self.assertEqual(UserProfile.objects.get(user=self.frank).forum_score, 35)
+        leaderboard = store.get_leaderboard(self.edith)
+        self.assertEqual([(row["name"], row["score"]) for row in leaderboard[:2]],
+                         [("Derek Smith", 40), ("F. G. ", 35)])
+        self.assertEqual(leaderboard, get_forum_leaderboard(self.edith))
+
+    def test_not_built(self) -> None:
+        """
+        Tests that a shared store is read from the database until it's been built, and that a store only this process
+        can see is built by the first read.
+        """
+
+        store = get_leaderboard_store()
+        expected = get_forum_leaderboard(self.frank)
+        with self.assertNumQueries(2 if store.shared else 1):
+            self.assertEqual(store.get_leaderboard(self.frank), expected)
+        self.assertEqual(store.is_built(), not store.shared)
+
+        call_command("rebuild_leaderboard", stdout=io.StringIO())
+        self.assertTrue(store.is_built())
+        with self.assertNumQueries(0):
+            self.assertEqual(store.get_leaderboard(self.frank), expected)
+
+    def test_name_changed(self) -> None:
+        """Tests that a user's new name reaches the store, without logging in touching it."""
+
+        store = get_leaderboard_store()
+        store.rebuild()
+
+        self.edith.first_name = "Edie"
+        self.edith.save()
+        self.assertEqual(store.get_leaderboard(self.derek)[0]["name"], "Edie Jones")
+
+        # Just the UPDATE and checking they have a profile
+        with self.assertNumQueries(2):
+            self.edith.save(update_fields=["last_login"])
+
+    def test_ties(self) -> None:
+        """Tests that users with the same score are listed in order of their ids, as in the database."""
+
+        # Ids after everyone else's that sort differently as strings, e.g. 9000, 10000 and 100000
+        digits = len(str(User.objects.order_by("-pk").first().pk))
+        pks = [9 * 10 ** digits, 10 ** (digits + 1), 10 ** (digits + 2)]
+        for pk in reversed(pks):
+            user = User.objects.create_user(pk=pk, username="%d@exeter.ac.uk" % pk, first_name="User",
+                                            last_name=str(pk))
+            UserProfile.objects.filter(user=user).update(leaderboard_privacy="FULL_NAME", forum_score=20)
+
+        store = get_leaderboard_store()
+        store.rebuild()
+        leaderboard = store.get_leaderboard(self.derek)
+        self.assertEqual([row["name"] for row in leaderboard[:5]],
+                         ["Edith Jones", "Ethel"] + ["User %d" % pk for pk in pks])
+        self.assertEqual(leaderboard, get_forum_leaderboard(self.derek))
+
+
+@skipUnless("REDIS_URL" in os.environ, "Set REDIS_URL to test the leaderboard store in Redis.")
+@override_settings(LEADERBOARD_STORE={"BACKEND": "users.leaderboard_store.redis_backend",
+                                      "OPTIONS": {"url": os.environ.get("REDIS_URL")},
+                                      "PREFIX": "test_leaderboard"})
+class RedisLeaderboardStoreTests(LeaderboardStoreTests):
+    pass
+
+
+class ForumScoreTests(TransactionTestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="derek@exeter.ac.uk")
+
+    def test_single_query(self) -> None:
+        """Tests that a score change is a single UPDATE."""
+
+        with self.assertNumQueries(1):
+            UserProfile.add_to_forum_score(self.user.pk, 5)
+        self.assertEqual(UserProfile.objects.get(user=self.user).forum_score, 5)
+
+    def test_not_below_zero(self) -> None:
+        """Tests that the score doesn't drop below 0."""
+
+        UserProfile.add_to_forum_score(self.user.pk, 3)
+        UserProfile.add_to_forum_score(self.user.pk, -5)
+        self.assertEqual(UserProfile.objects.get(user=self.user).forum_score, 0)
+
+    def test_concurrent_updates(self) -> None:
+        """Tests that no changes are lost when many are made at once."""
+
+        def vote() -> None:
+            for _ in range(20):
+                UserProfile.add_to_forum_score(self.user.pk, 1)
+            connection.close()
+
+        threads = [threading.Thread(target=vote) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(UserProfile.objects.get(user=self.user).forum_score, 100)
+
+
+class StudyChoicesTests(TransactionTestCase):
+    # The cache is only invalidated once a transaction commits, which never happens inside a TestCase
+
+    def setUp(self) -> None:
+        """Create a course and two modules worth 120 credits."""
+
+        cache.clear()
+        college = College.objects.create(college_name="CEMPS")
+        self.department = Department.objects.create(department_name="Computer Science", college_name=college)
+        self.course = Course.objects.create(course_title="Computer Science", level="BSc", campus="Streatham",
+                                            department_name=self.department)
+        for code, credit_value in [("ECM2429", 60), ("ECM2414", 60)]:
+            self.create_module(code, credit_value)
+
+    def create_module(self, code: str, credit_value: int) -> Module:
+        return Module.objects.create(module_title="Module " + code, module_code=code, module_year=2,
+                                     module_credit_value=credit_value, module_convenor="Dr Smith",
+                                     module_descriptor_URL="", department=self.department)
+
+    def test_cached(self) -> None:
+        """Tests that the choices are read once, then forms are made, shown and checked without any queries."""
+
+        with self.assertNumQueries(2):
+            form = StudentStudyForm()
+        self.assertEqual(form.fields["course"].choices, [("Computer Science", "Computer Science")])
+        self.assertEqual(form.fields["modules"].choices, [("ECM2414", "ECM2414 Module ECM2414"),
+                                                          ("ECM2429", "ECM2429 Module ECM2429")])
+
+        with self.assertNumQueries(0):
+            self.assertIn("ECM2429 Module ECM2429", StudentStudyForm().as_p())
+            form = StudentStudyForm({"course": "Computer Science", "modules": ["ECM2414", "ECM2429"]})
+            self.assertTrue(form.is_valid())
+
+    def test_invalidated(self) -> None:
+        """Tests that added, renamed and deleted courses and modules show up straight away."""
+
+        StudentStudyForm()
+        module = self.create_module("ECM2418", 15)
+        self.assertIn(("ECM2418", "ECM2418 Module ECM2418"), StudentStudyForm().fields["modules"].choices)
+        form = StudentStudyForm({"course": "Computer Science", "modules": ["ECM2414", "ECM2418", "ECM2429"]})
+        self.assertEqual(form.errors["modules"], ["You must take 120 credits of modules (not 135)."])
+
+        module.delete()
+        self.assertNotIn(("ECM2418", "ECM2418 Module ECM2418"), StudentStudyForm().fields["modules"].choices)
+
+        self.course.course_title = "Computer Science with AI"
+        self.course.save()
+        self.assertEqual(StudentStudyForm().fields["course"].choices,
+                         [("Computer Science with AI", "Computer Science with AI")])
+
+
+class ProfileMiddlewareTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="derek@exeter.ac.uk", first_name="Derek", last_name="Smith")
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user
+        ProfileMiddleware(lambda request: None)(self.request)
+
+    def test_profile_loaded_once(self) -> None:
+        """Tests that the profile, its course and the navbar picture take one query."""
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.request.profile.user, self.user)
+            self.assertIsNone(self.request.profile.course_title)
+            self.assertEqual(profile_pic(self.request)["profile_pic"]["name"], "Derek Smith")
+
+    def test_get_profile_pic(self) -> None:
+        """Tests that get_profile_pic uses the profile loaded for the request."""
+
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=self.user.pk)
+        ProfileMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(1):
+            self.assertIsNone(request.profile.course_title)
+            self.assertEqual(get_profile_pic(request.user), {"name": "Derek Smith",
+                                                             "url": request.profile.profile_pic.url})
+
+    def test_anonymous(self) -> None:
+        """Tests that anonymous users don't have a profile."""
+
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        ProfileMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(0):
+            self.assertFalse(request.profile)
+            self.assertFalse(profile_pic(request)["profile_pic"])
+
+
+class TimingMiddlewareTests(TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username="derek@exeter.ac.uk", is_staff=True)
+        self.templates = TimedDjangoTemplates({"NAME": "timed", "DIRS": [], "APP_DIRS": False, "OPTIONS": {}})
+
+    def view(self, request) -> HttpResponse:
+        users = list(User.objects.all())
+        return HttpResponse(self.templates.from_string("{{ users|length }} users").render({"users": users}))
+
+    def get(self, user=None) -> HttpResponse:
+        middleware = TimingMiddleware(self.view)
+        request = RequestFactory().get("/")
+        if user is not None:
+            request._cached_user = user
+        middleware.process_view(request, self.view, (), {})
+        return middleware(request)
+
+    def test_server_timing(self) -> None:
+        """Tests that staff get the timings, including the number of queries."""
+
+        response = self.get(self.user)
+        self.assertEqual(response.content, b"1 users")
+        timings = dict(timing.split(";", 1) for timing in response["Server-Timing"].split(", "))
+        self.assertEqual(set(timings), {"total", "view", "db", "tpl"})
+        self.assertIn('desc="1 queries"', timings["db"])
+
+    def test_not_staff(self) -> None:
+        """Tests that no one else gets the timings, and they're not worked out by loading the user."""
+
+        self.user.is_staff = False
+        self.assertFalse(self.get(self.user).has_header("Server-Timing"))
+        with self.assertNumQueries(1):
+            self.assertFalse(self.get().has_header("Server-Timing"))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_log(self) -> None:
+        """Tests that slow queries are logged with the line they came from."""
+
+        with self.assertLogs("groupisite.slow_queries") as logs:
+            self.get()
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["event"], "slow_query")
+        self.assertEqual(entry["path"], "/")
+        self.assertIn("auth_user", entry["sql"])
+        self.assertIn("in view", entry["origin"])
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self) -> None:
+        """Use a temporary media folder."""
+
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_thumbnails_made_on_upload(self) -> None:
+        """Tests that every size and format of thumbnail is made for a new profile picture."""
+
+        photo = io.BytesIO()
+        Image.new("RGB", (600, 400), "red").save(photo, "PNG")
+
+        profile = User.objects.create_user(username="derek@exeter.ac.uk").profile
+        profile.profile_pic = SimpleUploadedFile("derek.png", photo.getvalue(), content_type="image/png")
+        profile.save()
+
+        name = os.path.splitext(profile.profile_pic.path)[0]
+        for size in [40, 80, 160]:
+            for extension in ["webp", "jpg"]:
+                with Image.open("%s_%d.%s" % (name, size, extension)) as image:
+                    self.assertEqual(image.size, (size, size))
+
+    def test_template_filters(self) -> None:
+        """Tests that the filters give the URLs of the thumbnails."""
+
+        photo = io.BytesIO()
+        Image.new("RGB", (600, 400), "red").save(photo, "JPEG")
+        default_storage.save("profile_pictures/derek.jpeg", ContentFile(photo.getvalue()))
+        make_thumbnails("profile_pictures/derek.jpeg")
+
+        self.assertEqual(thumbnail("/media/profile_pictures/derek.jpeg", 40), "/media/profile_pictures/derek_40.jpg")
+        self.assertEqual(thumbnail_srcset("/media/profile_pictures/derek.jpeg", "webp"),
+                         "/media/profile_pictures/derek_40.webp 40w, /media/profile_pictures/derek_80.webp 80w, "
+                         "/media/profile_pictures/derek_160.webp 160w")
+
+    def test_no_thumbnails(self) -> None:
+        """Tests that the filters fall back to the picture itself if its thumbnails haven't been made."""
+
+        default_storage.save("profile_pictures/edith.jpeg", ContentFile(b""))
+
+        self.assertEqual(thumbnail("/media/profile_pictures/edith.jpeg", 40), "/media/profile_pictures/edith.jpeg")
+        self.assertEqual(thumbnail_srcset("/media/profile_pictures/edith.jpeg", "webp"), "")
+        self.assertEqual(thumbnail("https://example.com/edith.jpeg", 40), "https://example.com/edith.jpeg")
+        self.assertEqual(thumbnail("", 40), "")
+
+    def test_not_checked_again(self) -> None:
+        """Tests that the storage isn't checked for the thumbnails of a picture already known to have them."""
+
+        photo = io.BytesIO()
+        Image.new("RGB", (600, 400), "red").save(photo, "JPEG")
+        default_storage.save("profile_pictures/ethel.jpeg", ContentFile(photo.getvalue()))
+        make_thumbnails("profile_pictures/ethel.jpeg")
+
+        shutil.rmtree(os.path.join(self.media_root.name, "profile_pictures"))
+        self.assertEqual(thumbnail("/media/profile_pictures/ethel.jpeg", 40), "/media/profile_pictures/ethel_40.jpg")
+        self.assertEqual(make_thumbnails("profile_pictures/ethel.jpeg"), 0)
+
+    def test_default_thumbnails(self) -> None:
+        """Tests that the default profile picture's thumbnails are in the media folder."""
+
+        url = settings.MEDIA_URL + UserProfile._meta.get_field("profile_pic").default
+        with self.settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR, "media")):
+            self.assertEqual(thumbnail(url, 40), "/media/profile_pictures/default_40.jpg")
+            self.assertEqual(thumbnail_srcset(url, "webp"),
+                             "/media/profile_pictures/default_40.webp 40w, "
+                             "/media/profile_pictures/default_80.webp 80w, "
+                             "/media/profile_pictures/default_160.webp 160w")
+
+
+class StaticFilesTests(TestCase):
+
+    def setUp(self) -> None:
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        settings_override = override_settings(STATIC_ROOT=static_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, url: str, accept_encoding: str) -> tuple:
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+        content = b"".join(response.streaming_content)
+        response.close()
+        return response, content
+
+    def test_not_collected(self) -> None:
+        """Tests that a missing collectstatic is reported, rather than linking to names that aren't cached."""
+
+        with self.assertRaisesMessage(ValueError, "Missing staticfiles manifest entry for 'css/main.css'"):
+            static("css/main.css")
+
+    def test_compressed(self) -> None:
+        """Tests that the hashed files are served compressed and cached forever."""
+
+        call_command("collectstatic", interactive=False, verbosity=0)
+        url = static("css/main.css")
+        self.assertRegex(url, r"^/static/css/main\.[0-9a-f]{12}\.css$")
+
+        plain, plain_content = self.get(url, "")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        for accept_encoding, encoding in [("gzip, deflate, br", "br"), ("gzip, deflate", "gzip")]:
+            response, content = self.get(url, accept_encoding)
+            self.assertEqual(response["Content-Encoding"], encoding)
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertLess(len(content), len(plain_content))
+
+        # The unhashed name might change, so it isn't cached for long
+        response, _ = self.get("/static/css/main.css", "")
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+
+# The pages link to static files by name, since collectstatic hasn't been run
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self) -> None:
+        User.objects.create_user(username=PLACEHOLDER_USERNAME, first_name="Deleted", last_name="User")
+        self.user = User.objects.create_user(username="derek@exeter.ac.uk", first_name="Derek", last_name="Smith")
+
+        college = College.objects.create(college_name="CEMPS")
+        department = Department.objects.create(department_name="Computer Science", college_name=college)
+        module = Module.objects.create(module_title="Software Engineering", module_code="ECM2429", module_year=2,
+                                       module_credit_value=15, module_convenor="Dr Smith",
+                                       module_descriptor_URL="", department=department)
+        self.user.profile.modules.add(module)
+
+        section = ForumSection.objects.create(name="Study Help", category="ACADEMIC", url_slug="study-help")
+        thread = ForumThread.objects.create(name="Exams", section=section, url_slug="exams")
+        post = ForumPost.objects.create(title="Revision", url_slug="revision", thread=thread, author=self.user)
+        forum = "/forums/academic/study-help/"
+
+        # A URL for every route
+        self.urls = {
+            "favicon.ico": "/favicon.ico",
+            "admin/login/": "/admin/login/",
+            "admin/": "/admin/",
+            "register/": "/register/",
+            "login/": "/login/",
+            "": "/",
+            "logout/": "/logout/",
+            "settings/": "/settings/",
+            "settings/change-password/": "/settings/change-password/",
+            ".well-known/change-password/": "/.well-known/change-password/",
+            "change-password/": "/change-password/",
+            "live-chat/": "/live-chat/",
+            "live-chat/<slug:room_id>/": "/live-chat/module-%d/" % module.pk,
+            "forums/": "/forums/",
+            "forums/search/": "/forums/search/?q=revision&section=study-help",
+            "forums/<slug:category>/<slug:section>/": forum,
+            "forums/<slug:category>/<slug:section>/<slug:thread>/": forum + "exams/",
+            "forums/<slug:category>/<slug:section>/<slug:thread>/<slug:post>/": forum + "exams/revision/",
+        }
+
+    def test_every_route_has_budget(self) -> None:
+        """Tests that every route has a budget, so a new page can't be added without one."""
+
+        # Imported here so the rest of the tests don't depend on every app's views
+        from groupisite.urls import urlpatterns
+
+        routes = {str(pattern.pattern) for pattern in urlpatterns}
+        self.assertEqual(routes - set(QUERY_BUDGETS), set())
+        self.assertEqual(set(self.urls), set(QUERY_BUDGETS))
+
+    def test_anonymous(self) -> None:
+        """Tests that no page makes more queries than its budget for anonymous users."""
+
+        for route, url in self.urls.items():
+            with self.subTest(route=route):
+                self.assertWithinBudget(route, url)
+
+    def test_logged_in(self) -> None:
+        """Tests that no page makes more queries than its budget for logged in users."""
+
+        for route, url in self.urls.items():
+            with self.subTest(route=route):
+                self.assertWithinBudget(route, url, self.user)
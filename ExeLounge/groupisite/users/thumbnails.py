@@ -0,0 +1,110 @@
+"""
+Makes small copies of profile pictures, so pages showing them at 40px don't
+download the full size photo.
+
+Each picture gets a square thumbnail at every size in THUMBNAIL_SIZES, in
+WebP and JPEG, saved next to the original, e.g. profile_pictures/abc.png has
+profile_pictures/abc_40.webp, profile_pictures/abc_40.jpg, ...
+
+Which pictures have thumbnails is remembered by each process, so showing a
+picture only checks the storage the first time. Pictures from before
+thumbnails were made don't get them until the make_thumbnails command is run,
+and until then are shown full size.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+
+# The widths (and heights) of the thumbnails in pixels
+THUMBNAIL_SIZES = [40, 80, 160]
+
+# The file extension and Pillow format of each type of thumbnail
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+# Whether each picture in the default storage has its thumbnails, by name
+_has_thumbnails = {}
+
+
+def get_thumbnail_name(name: str, size: int, extension: str) -> str:
+    """Get the name of a thumbnail of a picture, e.g. profile_pictures/abc_40.webp."""
+
+    return "%s_%d.%s" % (os.path.splitext(name)[0], size, extension)
+
+
+def make_thumbnails(name: str, storage: Storage = default_storage, replace: bool = False) -> int:
+    """
+    Make all the thumbnails of a picture.
+
+    :param name: the name of the picture in the storage
+    :param storage: where the picture and its thumbnails are kept
+    :param replace: whether to replace thumbnails that already exist
+    :return: the number of thumbnails made
+    """
+
+    if not replace and storage is default_storage and _has_thumbnails.get(name):
+        return 0
+
+    names = {(size, extension): get_thumbnail_name(name, size, extension)
+             for size in THUMBNAIL_SIZES for extension in THUMBNAIL_FORMATS}
+    if not replace:
+        names = {key: thumbnail for key, thumbnail in names.items() if not storage.exists(thumbnail)}
+    if not names:
+        if storage is default_storage:
+            _has_thumbnails[name] = True
+        return 0
+    if not storage.exists(name):
+        return 0
+
+    # Turn the picture the right way up and drop any transparency
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert("RGB")
+
+    for (size, extension), thumbnail in names.items():
+        output = io.BytesIO()
+        ImageOps.fit(image, (size, size), Image.LANCZOS).save(output, THUMBNAIL_FORMATS[extension], quality=85)
+        if storage.exists(thumbnail):
+            storage.delete(thumbnail)
+        storage.save(thumbnail, ContentFile(output.getvalue()))
+
+    if storage is default_storage:
+        _has_thumbnails[name] = True
+    return len(names)
+
+
+def has_thumbnails(name: str) -> bool:
+    """
+    Whether a picture in the default storage has its thumbnails.
+
+    Thumbnails are made together, so this only checks for the last one made,
+    and only the first time it's asked about each picture.
+    """
+
+    if name not in _has_thumbnails:
+        last = get_thumbnail_name(name, THUMBNAIL_SIZES[-1], list(THUMBNAIL_FORMATS)[-1])
+        _has_thumbnails[name] = default_storage.exists(last)
+    return _has_thumbnails[name]
+
+
+@receiver(setting_changed)
+def forget_thumbnails(setting: str, **kwargs) -> None:
+    """Check for thumbnails again when the media folder is changed (e.g. in tests)."""
+
+    if setting in ["MEDIA_ROOT", "DEFAULT_FILE_STORAGE"]:
+        _has_thumbnails.clear()
+
+
+@receiver(post_save, sender=UserProfile)
+def make_profile_pic_thumbnails(sender, instance: UserProfile, **kwargs) -> None:
+    """Make the thumbnails of a newly uploaded profile picture."""
+
+    if instance.profile_pic:
+        make_thumbnails(instance.profile_pic.name, instance.profile_pic.storage)
@@ -5,7 +5,6 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User
 from django.http import HttpResponse, HttpResponseRedirect, HttpRequest
 from django.shortcuts import render, redirect
-from groupisite.views import get_profile_pic
 
 from .forms import StudentRegistrationForm, LoginForm, StudentStudyForm, \
     SettingsForm, CaptchaForm
@@ -57,8 +56,7 @@ def user_register(request: HttpRequest) -> Union[HttpResponseRedirect,
         profile.date_of_birth = register_form.cleaned_data.get("date_of_birth")
         profile.admission_date = register_form.cleaned_data.get("admission_date")
         profile.course_title = Course.objects.get(course_title=study_form.cleaned_data.get("course"))
-        for module in study_form.cleaned_data.get("modules"):
-            profile.modules.add(Module.objects.get(module_code=module))
+        profile.modules.set(Module.objects.filter(module_code__in=study_form.cleaned_data.get("modules")))
         profile.save()
 
         # Log the user in
@@ -143,7 +141,7 @@ def settings(request: HttpRequest) -> Union[HttpResponseRedirect,
     if request.user.is_anonymous:
         return redirect("/login/")
 
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.profile
 
     # If this is a POST request we need to process the form data
     if request.method == "POST":
@@ -156,15 +154,12 @@ def settings(request: HttpRequest) -> Union[HttpResponseRedirect,
         if len(study_form.errors) > 0 or \
                 len(settings_form.errors) > 0:
             return render(request, "settings.html",
-                          {"profile_pic": get_profile_pic(request.user),
-                           "study_form": study_form,
+                          {"study_form": study_form,
                            "settings_form": settings_form})
 
         # Update the user profile data
         profile.course_title = Course.objects.get(course_title=study_form.cleaned_data.get("course"))
-        profile.modules.clear()
-        for module in study_form.cleaned_data.get("modules"):
-            profile.modules.add(Module.objects.get(module_code=module))
+        profile.modules.set(Module.objects.filter(module_code__in=study_form.cleaned_data.get("modules")))
         profile.leaderboard_privacy = settings_form.cleaned_data.get("leaderboard_privacy")
 
         # Update the profile picture
@@ -190,8 +185,7 @@ def settings(request: HttpRequest) -> Union[HttpResponseRedirect,
         settings_form = SettingsForm(initial=settings_initial)
 
     return render(request, "settings.html",
-                  {"profile_pic": get_profile_pic(request.user),
-                   "study_form": study_form,
+                  {"study_form": study_form,
                    "settings_form": settings_form})
 
 
@@ -220,16 +214,14 @@ def change_password(request: HttpRequest) -> Union[HttpResponseRedirect,
         # Otherwise explain the error
         else:
             return render(request, "change-password.html",
-                          {"profile_pic": get_profile_pic(request.user),
-                           "password_form": password_form})
+                          {"password_form": password_form})
 
     # If a GET (or any other method)
     else:
         password_form = PasswordChangeForm(user=request.user)
 
     return render(request, "change-password.html",
-                  {"profile_pic": get_profile_pic(request.user),
-                   "password_form": password_form})
+                  {"password_form": password_form})
 
 
 def change_password_redirect(request: HttpRequest) -> HttpResponseRedirect: